@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 OpenMarket Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Builds a synthetic deep auth DAG and measures the number of database
+queries and the wall time taken to compute auth chains over it, both with a
+cold and a warm auth chain cache.
+
+Each event in the DAG is authed by the create event and the previous two
+events, roughly like a long run of membership and power level changes.
+
+Run from the root of the source tree:
+
+    PYTHONPATH=. python scripts-dev/benchmark_auth_chain.py
+"""
+
+from twisted.internet import defer, task
+
+from synapse.storage._base import sql_query_timer
+
+from tests.utils import setup_test_homeserver
+
+from mock import Mock
+
+import time
+
+
+DAG_DEPTH = 2000
+ROOM_ID = "!bench:test"
+
+
+def event_id(i):
+    return "$event%d:test" % (i,)
+
+
+def populate(txn, depth):
+    txn.executemany(
+        "INSERT INTO events"
+        " (stream_ordering, topological_ordering, event_id, type, room_id,"
+        " content, processed, outlier, depth)"
+        " VALUES (?,?,?,?,?,?,?,?,?)",
+        [
+            (i, i, event_id(i), "m.room.member", ROOM_ID, "{}", True, False, i)
+            for i in range(depth)
+        ]
+    )
+
+    edges = []
+    for i in range(1, depth):
+        auth = set([0, max(i - 1, 0), max(i - 2, 0)])
+        edges.extend((event_id(i), event_id(a), ROOM_ID) for a in auth)
+
+    txn.executemany(
+        "INSERT INTO event_auth (event_id, auth_id, room_id) VALUES (?,?,?)",
+        edges
+    )
+
+
+def query_count():
+    return sum(sql_query_timer.counts.counts.values())
+
+
+@defer.inlineCallbacks
+def measure(store, desc, event_ids):
+    queries_before = query_count()
+    start = time.time()
+    chain = yield store.get_auth_chain_ids(event_ids)
+    elapsed = time.time() - start
+    queries = query_count() - queries_before
+
+    print "%-30s %6d events in chain, %5d queries, %8.3f ms" % (
+        desc, len(chain), queries, elapsed * 1000,
+    )
+
+
+@defer.inlineCallbacks
+def run(reactor):
+    hs = yield setup_test_homeserver(
+        resource_for_federation=Mock(),
+        http_client=None,
+    )
+    store = hs.get_datastore()
+
+    yield store.runInteraction("populate", populate, DAG_DEPTH)
+
+    tip = [event_id(DAG_DEPTH - 1)]
+    state = [event_id(i) for i in range(DAG_DEPTH - 100, DAG_DEPTH)]
+
+    yield measure(store, "single event, cold cache", tip)
+    yield measure(store, "single event, warm cache", tip)
+
+    store._auth_chain_cache.invalidate_all()
+
+    yield measure(store, "100 events, cold cache", state)
+    yield measure(store, "100 events, warm cache", state)
+
+
+if __name__ == "__main__":
+    task.react(run)
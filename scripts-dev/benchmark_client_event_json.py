@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 OpenMarket Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measures the time taken to encode the response to a synthetic initialSync
+over many rooms, both by serializing every event to a dict and encoding the
+whole response, and by using `ClientEvent`s whose encodings are cached on the
+events.
+
+Each room's state and recent messages are the same events every time, as they
+would be for a user who calls initialSync repeatedly, or for many users in the
+same rooms.
+
+Run from the root of the source tree:
+
+    PYTHONPATH=. python scripts-dev/benchmark_client_event_json.py
+"""
+
+from syutil.jsonutil import encode_canonical_json
+
+from synapse.events import FrozenEvent
+from synapse.events.utils import serialize_event, serialize_client_event
+from synapse.http.server import encode_json_with_client_events
+
+import time
+
+
+ROOMS = 100
+STATE_EVENTS_PER_ROOM = 20
+MESSAGES_PER_ROOM = 10
+ITERATIONS = 10
+
+
+def make_event(room_id, i, state_key=None):
+    d = {
+        "event_id": "$%s_%d:test" % (room_id[1:], i),
+        "type": "m.room.message",
+        "room_id": room_id,
+        "sender": "@user%d:test" % (i,),
+        "depth": i,
+        "content": {"msgtype": "m.text", "body": "Message %d" % (i,)},
+        "prev_events": [],
+        "auth_events": [],
+        "hashes": {"sha256": "a" * 43},
+        "signatures": {"test": {"ed25519:auto": "b" * 86}},
+        "origin": "test",
+        "origin_server_ts": 1000000 + i,
+        "unsigned": {"age_ts": 1000000 + i},
+    }
+    if state_key is not None:
+        d["type"] = "m.room.member"
+        d["state_key"] = state_key
+        d["content"] = {"membership": "join", "displayname": state_key}
+    return FrozenEvent(d)
+
+
+def make_rooms():
+    rooms = []
+    for r in range(ROOMS):
+        room_id = "!room%d:test" % (r,)
+        state = [
+            make_event(room_id, i, state_key="@user%d:test" % (i,))
+            for i in range(STATE_EVENTS_PER_ROOM)
+        ]
+        messages = [
+            make_event(room_id, STATE_EVENTS_PER_ROOM + i)
+            for i in range(MESSAGES_PER_ROOM)
+        ]
+        rooms.append((room_id, state, messages))
+    return rooms
+
+
+def initial_sync(rooms, serialize, time_now):
+    return {
+        "rooms": [
+            {
+                "room_id": room_id,
+                "membership": "join",
+                "messages": {
+                    "chunk": [serialize(e, time_now) for e in messages],
+                    "start": "s1",
+                    "end": "s2",
+                },
+                "state": [serialize(e, time_now) for e in state],
+            }
+            for room_id, state, messages in rooms
+        ],
+        "presence": [],
+        "end": "s2",
+    }
+
+
+def measure(desc, rooms, serialize, encode):
+    elapsed = 0
+    for i in range(ITERATIONS):
+        start = time.time()
+        encode(initial_sync(rooms, serialize, 2000000 + i))
+        elapsed += time.time() - start
+
+    print "%-24s %8.3f ms per response" % (desc, elapsed * 1000 / ITERATIONS)
+
+
+def run():
+    rooms = make_rooms()
+
+    measure(
+        "serialize_event", rooms, serialize_event, encode_canonical_json
+    )
+
+    # Use new events for the cold run, so that nothing is cached on them.
+    rooms = make_rooms()
+    start = time.time()
+    actual = encode_json_with_client_events(
+        initial_sync(rooms, serialize_client_event, 2000000)
+    )
+    print "%-24s %8.3f ms per response" % (
+        "ClientEvent (cold)", (time.time() - start) * 1000,
+    )
+
+    expected = encode_canonical_json(
+        initial_sync(rooms, serialize_event, 2000000)
+    )
+    assert actual == expected, "Encodings differ"
+
+    measure(
+        "ClientEvent (warm)", rooms, serialize_client_event,
+        encode_json_with_client_events,
+    )
+
+
+if __name__ == "__main__":
+    run()
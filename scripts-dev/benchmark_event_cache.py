@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 OpenMarket Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measures the time taken by `_get_events` to fetch a batch of events when
+they are in the event cache, only in the event row cache, and in neither.
+
+Run from the root of the source tree:
+
+    PYTHONPATH=. python scripts-dev/benchmark_event_cache.py
+"""
+
+from twisted.internet import defer, task
+
+from syutil.jsonutil import encode_canonical_json
+
+from tests.utils import setup_test_homeserver, MockKey
+
+from mock import Mock
+
+import time
+
+
+NUM_EVENTS = 1000
+ITERATIONS = 10
+ROOM_ID = "!bench:test"
+
+
+def event_id(i):
+    return "$event%d:test" % (i,)
+
+
+def populate(txn, num_events):
+    txn.executemany(
+        "INSERT INTO event_json (event_id, room_id, internal_metadata, json)"
+        " VALUES (?,?,?,?)",
+        [
+            (
+                event_id(i), ROOM_ID, "{}",
+                encode_canonical_json({
+                    "event_id": event_id(i),
+                    "type": "m.room.message",
+                    "room_id": ROOM_ID,
+                    "sender": "@user:test",
+                    "depth": i,
+                    "content": {"msgtype": "m.text", "body": "Message %d" % i},
+                    "prev_events": [[event_id(i - 1), {}]],
+                    "auth_events": [],
+                    "hashes": {"sha256": "a" * 43},
+                    "signatures": {"test": {"ed25519:auto": "b" * 86}},
+                    "origin": "test",
+                    "origin_server_ts": 1000000 + i,
+                    "unsigned": {},
+                }),
+            )
+            for i in range(num_events)
+        ]
+    )
+
+
+@defer.inlineCallbacks
+def measure(store, desc, event_ids, invalidate):
+    elapsed = 0
+    for _ in range(ITERATIONS):
+        invalidate()
+        start = time.time()
+        yield store._get_events(event_ids)
+        elapsed += time.time() - start
+
+    print "%-20s %8.3f ms per %d events" % (
+        desc, elapsed * 1000 / ITERATIONS, len(event_ids),
+    )
+
+
+@defer.inlineCallbacks
+def run(reactor):
+    config = Mock()
+    config.signing_key = [MockKey()]
+    config.disable_registration = False
+    config.event_cache_size = NUM_EVENTS
+    config.event_row_cache_size = NUM_EVENTS
+    config.state_group_cache_size = 1
+    config.auth_chain_index = False
+    config.cache_factor = 1.0
+    config.cache_sizes = {}
+
+    hs = yield setup_test_homeserver(
+        config=config,
+        resource_for_federation=Mock(),
+        http_client=None,
+    )
+    store = hs.get_datastore()
+
+    yield store.runInteraction("populate", populate, NUM_EVENTS)
+
+    event_ids = [event_id(i) for i in range(NUM_EVENTS)]
+
+    def invalidate_events():
+        store._get_event_cache.invalidate_all()
+
+    def invalidate_all():
+        store._get_event_cache.invalidate_all()
+        store._event_row_cache.invalidate_all()
+
+    yield store._get_events(event_ids)
+
+    yield measure(store, "event cache", event_ids, lambda: None)
+    yield measure(store, "event row cache", event_ids, invalidate_events)
+    yield measure(store, "database", event_ids, invalidate_all)
+
+
+if __name__ == "__main__":
+    task.react(run)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 OpenMarket Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measures the time taken to insert into, read from and prune an
+ExpiringCache that is kept full, for a few different cache sizes.
+
+Run from the root of the source tree:
+
+    PYTHONPATH=. python scripts-dev/benchmark_expiring_cache.py
+"""
+
+from synapse.util.expiringcache import ExpiringCache
+
+import time
+
+
+CACHE_SIZES = (1000, 10000, 100000)
+OPERATIONS = 100000
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0
+
+    def time_msec(self):
+        self.now += 1
+        return self.now
+
+    def looping_call(self, function, interval):
+        pass
+
+
+def timed(desc, max_len, func):
+    start = time.time()
+    func()
+    elapsed = time.time() - start
+
+    print "%-8s max_len=%-7d %8.3f us/op" % (
+        desc, max_len, elapsed * 1000000 / OPERATIONS,
+    )
+
+
+def run(max_len):
+    clock = Clock()
+    cache = ExpiringCache(
+        "bench", clock, max_len=max_len, expiry_ms=OPERATIONS,
+        reset_expiry_on_get=True,
+    )
+
+    for i in range(max_len):
+        cache[i] = i
+
+    def insert():
+        for i in range(max_len, max_len + OPERATIONS):
+            cache[i] = i
+
+    def get():
+        for i in range(OPERATIONS):
+            cache.get(i % (2 * max_len))
+
+    def prune():
+        clock.now += OPERATIONS
+        cache._prune_cache()
+
+    timed("insert", max_len, insert)
+    timed("get", max_len, get)
+    timed("prune", max_len, prune)
+
+
+if __name__ == "__main__":
+    for max_len in CACHE_SIZES:
+        run(max_len)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 OpenMarket Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Replays a synthetic incoming federation transaction carrying PDUs for many
+rooms and measures the wall time taken to handle it, for a few different room
+concurrency limits.
+
+Handling a PDU is simulated by sleeping, with the PDUs of a few of the rooms
+taking much longer than the rest, roughly like rooms where we have to fetch
+missing events or state from the remote server.
+
+Run from the root of the source tree:
+
+    PYTHONPATH=. python scripts-dev/benchmark_federation_transaction.py
+"""
+
+from twisted.internet import defer, task
+
+from synapse.federation.federation_server import FederationServer
+from synapse.util import Clock
+from synapse.util.async import sleep
+from synapse.util.lockutils import LockManager
+
+from mock import Mock
+
+import time
+
+
+ROOMS = 20
+PDUS = 50
+SLOW_ROOMS = 2
+
+FAST_PDU_SECONDS = 0.005
+SLOW_PDU_SECONDS = 0.2
+
+CONCURRENCIES = (1, 5, 10, 20)
+
+
+def room_id(i):
+    return "!room%d:remote" % (i,)
+
+
+def make_transaction(transaction_id):
+    pdus = []
+    for i in range(PDUS):
+        pdus.append({
+            "event_id": "$%s_%d:remote" % (transaction_id, i),
+            "room_id": room_id(i % ROOMS),
+            "type": "m.room.message",
+            "sender": "@user:remote",
+            "origin": "remote",
+            "origin_server_ts": 0,
+            "content": {"body": "message %d" % (i,)},
+            "prev_events": [],
+            "auth_events": [],
+            "depth": i,
+            "hashes": {},
+            "signatures": {},
+        })
+
+    return {
+        "transaction_id": transaction_id,
+        "origin": "remote",
+        "destination": "test",
+        "origin_server_ts": 0,
+        "pdus": pdus,
+    }
+
+
+class BenchmarkFederationServer(FederationServer):
+    def __init__(self, concurrency):
+        self.hs = Mock()
+        self.hs.config.federation_transaction_room_concurrency = concurrency
+
+        self._clock = Clock()
+        self._room_pdu_linearizer = LockManager()
+
+        self.transaction_actions = Mock()
+        self.transaction_actions.have_responded.return_value = (
+            defer.succeed(None)
+        )
+        self.transaction_actions.set_response.return_value = (
+            defer.succeed(None)
+        )
+
+        self.slow_rooms = set(room_id(i) for i in range(SLOW_ROOMS))
+
+    def _check_sigs_and_hashes(self, pdus):
+        return [defer.succeed(pdu) for pdu in pdus]
+
+    def _handle_new_pdu(self, origin, pdu, get_missing=True,
+                        checked_pdu=None):
+        if pdu.room_id in self.slow_rooms:
+            return sleep(SLOW_PDU_SECONDS)
+        return sleep(FAST_PDU_SECONDS)
+
+
+@defer.inlineCallbacks
+def run(reactor):
+    for concurrency in CONCURRENCIES:
+        server = BenchmarkFederationServer(concurrency)
+        transaction = make_transaction("txn%d" % (concurrency,))
+
+        start = time.time()
+        code, response = yield server.on_incoming_transaction(transaction)
+        elapsed = time.time() - start
+
+        print "concurrency=%-3d %3d pdus, %3d rooms, %8.3f ms" % (
+            concurrency, len(response["pdus"]), ROOMS, elapsed * 1000,
+        )
+
+
+if __name__ == "__main__":
+    task.react(run)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 OpenMarket Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compares the time taken by the JSON encoders used for HTTP responses to
+encode synthetic initialSync and v2 /sync responses over many rooms.
+
+Run from the root of the source tree:
+
+    PYTHONPATH=. python scripts-dev/benchmark_json_encoders.py
+"""
+
+from syutil.jsonutil import encode_canonical_json
+
+from synapse.events import FrozenEvent
+from synapse.events.utils import (
+    serialize_event, format_event_for_client_v2_without_event_id,
+)
+from synapse.http.server import encode_json_with_client_events
+
+import time
+
+
+ROOMS = 100
+STATE_EVENTS_PER_ROOM = 20
+MESSAGES_PER_ROOM = 10
+ITERATIONS = 10
+TIME_NOW = 2000000
+
+
+def make_event(room_id, i, state_key=None):
+    d = {
+        "event_id": "$%s_%d:test" % (room_id[1:], i),
+        "type": "m.room.message",
+        "room_id": room_id,
+        "sender": "@user%d:test" % (i,),
+        "depth": i,
+        "content": {"msgtype": "m.text", "body": u"Message %d ☃" % (i,)},
+        "prev_events": [],
+        "auth_events": [],
+        "hashes": {"sha256": "a" * 43},
+        "signatures": {"test": {"ed25519:auto": "b" * 86}},
+        "origin": "test",
+        "origin_server_ts": 1000000 + i,
+        "unsigned": {"age_ts": 1000000 + i},
+    }
+    if state_key is not None:
+        d["type"] = "m.room.member"
+        d["state_key"] = state_key
+        d["content"] = {"membership": "join", "displayname": state_key}
+    return FrozenEvent(d)
+
+
+def make_rooms():
+    rooms = []
+    for r in range(ROOMS):
+        room_id = "!room%d:test" % (r,)
+        state = [
+            make_event(room_id, i, state_key="@user%d:test" % (i,))
+            for i in range(STATE_EVENTS_PER_ROOM)
+        ]
+        messages = [
+            make_event(room_id, STATE_EVENTS_PER_ROOM + i)
+            for i in range(MESSAGES_PER_ROOM)
+        ]
+        rooms.append((room_id, state, messages))
+    return rooms
+
+
+def initial_sync_response(rooms):
+    return {
+        "rooms": [
+            {
+                "room_id": room_id,
+                "membership": "join",
+                "messages": {
+                    "chunk": [serialize_event(e, TIME_NOW) for e in messages],
+                    "start": "s1",
+                    "end": "s2",
+                },
+                "state": [serialize_event(e, TIME_NOW) for e in state],
+            }
+            for room_id, state, messages in rooms
+        ],
+        "presence": [],
+        "end": "s2",
+    }
+
+
+def sync_response(rooms):
+    def serialize(event):
+        return serialize_event(
+            event, TIME_NOW,
+            event_format=format_event_for_client_v2_without_event_id,
+        )
+
+    return {
+        "public_user_data": [],
+        "private_user_data": [],
+        "rooms": [
+            {
+                "room_id": room_id,
+                "event_map": dict(
+                    (e.event_id, serialize(e)) for e in state + messages
+                ),
+                "events": {
+                    "batch": [e.event_id for e in messages],
+                    "prev_batch": "s1",
+                },
+                "state": [e.event_id for e in state],
+                "limited": False,
+                "published": False,
+                "ephemeral": [],
+            }
+            for room_id, state, messages in rooms
+        ],
+        "next_batch": "s2",
+    }
+
+
+def fast_encoder(json_object):
+    return encode_json_with_client_events(json_object, canonical=False)
+
+
+ENCODERS = (
+    ("encode_canonical_json", encode_canonical_json),
+    ("canonical", encode_json_with_client_events),
+    ("non-canonical", fast_encoder),
+)
+
+
+def measure(desc, response):
+    for name, encoder in ENCODERS:
+        elapsed = 0
+        for _ in range(ITERATIONS):
+            start = time.time()
+            json_bytes = encoder(response)
+            elapsed += time.time() - start
+
+        print "%-12s %-22s %8.3f ms, %8d bytes" % (
+            desc, name, elapsed * 1000 / ITERATIONS, len(json_bytes),
+        )
+
+
+def run():
+    rooms = make_rooms()
+
+    measure("initialSync", initial_sync_response(rooms))
+    measure("/sync", sync_response(rooms))
+
+
+if __name__ == "__main__":
+    run()
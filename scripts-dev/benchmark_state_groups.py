@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2015 OpenMarket Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measures the number of database round-trips and the wall time taken to
+look up the state groups for 1, 10 and 100 prev_events.
+
+Run from the root of the source tree:
+
+    PYTHONPATH=. python scripts-dev/benchmark_state_groups.py
+"""
+
+from twisted.internet import defer, task
+
+from synapse.storage._base import sql_query_timer
+
+from tests.utils import setup_test_homeserver
+
+from mock import Mock
+
+import time
+
+
+PREV_EVENT_COUNTS = (1, 10, 100)
+STATE_EVENTS_PER_GROUP = 50
+ITERATIONS = 20
+
+
+def populate(txn, num_events):
+    """Creates `num_events` events, each in their own state group with
+    STATE_EVENTS_PER_GROUP state events.
+    """
+    room_id = "!bench:test"
+    for i in range(num_events):
+        event_id = "$event%d:test" % (i,)
+        txn.execute(
+            "INSERT INTO state_groups (id, room_id, event_id) VALUES (?,?,?)",
+            (i + 1, room_id, event_id)
+        )
+        txn.execute(
+            "INSERT INTO event_to_state_groups (event_id, state_group)"
+            " VALUES (?,?)",
+            (event_id, i + 1)
+        )
+        txn.executemany(
+            "INSERT INTO state_groups_state"
+            " (state_group, room_id, type, state_key, event_id)"
+            " VALUES (?,?,?,?,?)",
+            [
+                (
+                    i + 1, room_id, "m.room.member", "@user%d:test" % (j,),
+                    "$state%d_%d:test" % (i, j),
+                )
+                for j in range(STATE_EVENTS_PER_GROUP)
+            ]
+        )
+
+
+def query_count():
+    return sum(sql_query_timer.counts.counts.values())
+
+
+@defer.inlineCallbacks
+def run(reactor):
+    hs = yield setup_test_homeserver(
+        resource_for_federation=Mock(),
+        http_client=None,
+    )
+    store = hs.get_datastore()
+
+    yield store.runInteraction(
+        "populate", populate, max(PREV_EVENT_COUNTS)
+    )
+
+    for count in PREV_EVENT_COUNTS:
+        event_ids = ["$event%d:test" % (i,) for i in range(count)]
+
+        queries_before = query_count()
+        start = time.time()
+        for _ in range(ITERATIONS):
+            yield store.runInteraction(
+                "get_state_groups",
+                store._get_state_groups_txn, event_ids,
+            )
+        elapsed = time.time() - start
+        queries = query_count() - queries_before
+
+        print "%4d prev_events: %5.1f queries/call, %8.3f ms/call" % (
+            count, float(queries) / ITERATIONS, elapsed * 1000 / ITERATIONS,
+        )
+
+
+if __name__ == "__main__":
+    task.react(run)
@@ -67,6 +67,8 @@ APPEND_ONLY_TABLES = [
     "state_groups",
     "state_groups_state",
     "event_to_state_groups",
+    "event_auth_closure",
+    "event_auth_closure_indexed",
     "rejections",
 ]
 
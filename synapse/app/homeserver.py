@@ -477,6 +477,9 @@ def setup(config_options):
     hs.get_pusherpool().start()
     hs.get_state_handler().start_caching()
     hs.get_datastore().start_profiling()
+    hs.get_datastore().start_state_group_compaction()
+    hs.get_datastore().start_auth_chain_index_backfill()
+    hs.get_datastore().start_client_ip_flushing()
     hs.get_replication_layer().start_get_pdu_cache()
 
     return hs
@@ -23,6 +23,26 @@ class DatabaseConfig(Config):
             config.get("event_cache_size", "10K")
         )
 
+        self.event_row_cache_size = self.parse_size(
+            config.get("event_row_cache_size", "50K")
+        )
+
+        self.state_group_cache_size = self.parse_size(
+            config.get("state_group_cache_size", "100K")
+        )
+
+        self.auth_chain_index = config.get("auth_chain_index", False)
+
+        self.client_ip_flush_interval = self.parse_duration(
+            config.get("client_ip_flush_interval", "5s")
+        )
+
+        self.cache_factor = float(config.get("cache_factor", 1.0))
+        self.cache_sizes = {
+            name: self.parse_size(size)
+            for name, size in config.get("cache_sizes", {}).items()
+        }
+
         self.database_config = config.get("database")
 
         if self.database_config is None:
@@ -59,6 +79,31 @@ class DatabaseConfig(Config):
 
         # Number of events to cache in memory.
         event_cache_size: "10K"
+
+        # Number of events to cache in memory in their unparsed form. Parsing a
+        # cached event is much cheaper than fetching it from the database.
+        event_row_cache_size: "50K"
+
+        # Number of state entries, summed across all state groups, to cache in
+        # memory.
+        state_group_cache_size: "100K"
+
+        # Whether to maintain an index of every event's full auth chain. This
+        # makes answering federation auth queries much cheaper, at the cost of
+        # extra storage. Existing events are indexed in the background.
+        auth_chain_index: False
+
+        # How often to write the IP addresses and user agents that users have
+        # made requests from to the database.
+        client_ip_flush_interval: "5s"
+
+        # Multiplies the default size of every in-memory cache.
+        cache_factor: 1.0
+
+        # Overrides the size of individual caches, by name. The names, sizes,
+        # hit rates and approximate memory usage of the caches can be found at
+        # /_matrix/client/api/v1/admin/caches.
+        cache_sizes: {}
         """ % locals()
 
     def read_arguments(self, args):
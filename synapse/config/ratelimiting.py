@@ -12,7 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from ._base import Config
+from ._base import Config, ConfigError
 
 
 class RatelimitConfig(Config):
@@ -26,6 +26,21 @@ class RatelimitConfig(Config):
         self.federation_rc_sleep_delay = config["federation_rc_sleep_delay"]
         self.federation_rc_reject_limit = config["federation_rc_reject_limit"]
         self.federation_rc_concurrent = config["federation_rc_concurrent"]
+        self.federation_transaction_room_concurrency = config.get(
+            "federation_transaction_room_concurrency", 10
+        )
+        self.sync_room_concurrency = config.get("sync_room_concurrency", 10)
+        self.sync_total_room_concurrency = config.get(
+            "sync_total_room_concurrency", 100
+        )
+
+        for name in (
+            "federation_transaction_room_concurrency",
+            "sync_room_concurrency",
+            "sync_total_room_concurrency",
+        ):
+            if getattr(self, name) < 1:
+                raise ConfigError("%s must be at least 1" % (name,))
 
     def default_config(self, config_dir_path, server_name):
         return """\
@@ -55,4 +70,14 @@ class RatelimitConfig(Config):
         # The number of federation requests to concurrently process from a
         # single server
         federation_rc_concurrent: 3
+
+        # The number of rooms to concurrently process the events of from a
+        # single incoming federation transaction
+        federation_transaction_room_concurrency: 10
+
+        # The number of rooms to concurrently load for a single initial sync
+        sync_room_concurrency: 10
+
+        # The number of rooms to concurrently load across all initial syncs
+        sync_total_room_concurrency: 100
         """
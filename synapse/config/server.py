@@ -28,6 +28,9 @@ class ServerConfig(Config):
         self.web_client = config["web_client"]
         self.soft_file_limit = config["soft_file_limit"]
         self.daemonize = config.get("daemonize")
+        self.canonical_client_json = config.get(
+            "canonical_client_json", False
+        )
 
         # Attempt to guess the content_addr for the v0 content repostitory
         content_addr = config.get("content_addr")
@@ -82,6 +85,11 @@ class ServerConfig(Config):
         # hard limit.
         soft_file_limit: 0
 
+        # Whether to encode responses to clients as canonical JSON, i.e. with
+        # sorted keys. This is slower, and only needed for responses that are
+        # signed, so is only worth turning on when debugging.
+        canonical_client_json: False
+
         # Turn on the twisted telnet manhole service on localhost on the given
         # port.
         #manhole: 9000
@@ -14,7 +14,7 @@
 # limitations under the License.
 
 from synapse.crypto.keyclient import fetch_server_key
-from twisted.internet import defer
+from twisted.internet import defer, threads
 from syutil.crypto.jsonsign import (
     verify_signed_json, signature_ids, sign_json, encode_canonical_json
 )
@@ -23,11 +23,14 @@ from syutil.crypto.signing_key import (
 )
 from syutil.base64util import decode_base64, encode_base64
 from synapse.api.errors import SynapseError, Codes
+from synapse.storage._base import Cache, resize_cache
 
 from synapse.util.retryutils import get_retry_limiter
 
 from synapse.util.async import ObservableDeferred
 
+from twisted.python.failure import Failure
+
 from OpenSSL import crypto
 
 import urllib
@@ -38,6 +41,20 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+# How long to keep a verify key in memory when we don't know when it expires.
+VERIFY_KEY_CACHE_MS = 60 * 60 * 1000
+
+# How long to wait before retrying to fetch the keys of a server after failing
+# to fetch them.
+KEY_FETCH_FAILURE_CACHE_MS = 60 * 1000
+
+# The default number of verify keys and failed key fetches to keep in memory.
+# Remote servers can make up as many key ids as they like, so these have to be
+# bounded.
+VERIFY_KEY_CACHE_SIZE = 10000
+KEY_FETCH_FAILURE_CACHE_SIZE = 1000
+
+
 class Keyring(object):
     def __init__(self, hs):
         self.store = hs.get_datastore()
@@ -47,18 +64,109 @@ class Keyring(object):
         self.perspective_servers = self.config.perspectives
         self.hs = hs
 
+        # (server_name, key_ids) -> ObservableDeferred of the key download
         self.key_downloads = {}
 
-    @defer.inlineCallbacks
+        # (server_name, key_id) -> (VerifyKey, valid_until_ms)
+        self.verify_key_cache = Cache(
+            "verify_key_cache", keylen=2, lru=True,
+            max_entries=VERIFY_KEY_CACHE_SIZE,
+        )
+
+        # (server_name, key_id) -> (failed_at_ms, Failure) for the key ids of
+        # key fetches that failed recently.
+        self.failed_key_fetches = Cache(
+            "failed_key_fetches", keylen=2, lru=True,
+            max_entries=KEY_FETCH_FAILURE_CACHE_SIZE,
+        )
+
+        for cache in (self.verify_key_cache, self.failed_key_fetches):
+            resize_cache(
+                cache, self.config.cache_factor, self.config.cache_sizes
+            )
+
     def verify_json_for_server(self, server_name, json_object):
-        logger.debug("Verifying for %s", server_name)
-        key_ids = signature_ids(json_object, server_name)
-        if not key_ids:
-            raise SynapseError(
-                400,
-                "Not signed with a supported algorithm",
-                Codes.UNAUTHORIZED,
+        return self.verify_json_objects_for_server(
+            [(server_name, json_object)]
+        )[0]
+
+    def verify_json_objects_for_server(self, server_and_json):
+        """Checks the signatures of a batch of JSON objects. The verify key of
+        each server is only fetched once per batch, and the signatures are
+        checked together on a worker thread.
+
+        Args:
+            server_and_json (list): List of (server_name, json_object) pairs.
+
+        Returns:
+            list of Deferreds: One for each pair, which fails with a
+            SynapseError if the object isn't correctly signed by the server.
+        """
+        deferreds = []
+        groups = {}
+        for server_name, json_object in server_and_json:
+            logger.debug("Verifying for %s", server_name)
+            key_ids = signature_ids(json_object, server_name)
+            if not key_ids:
+                deferreds.append(defer.fail(SynapseError(
+                    400,
+                    "Not signed with a supported algorithm",
+                    Codes.UNAUTHORIZED,
+                )))
+                continue
+
+            d = defer.Deferred()
+            deferreds.append(d)
+            groups.setdefault((server_name, tuple(key_ids)), []).append(
+                (json_object, d)
+            )
+
+        for (server_name, key_ids), group in groups.items():
+            self._verify_json_group(server_name, list(key_ids), group)
+
+        return deferreds
+
+    @defer.inlineCallbacks
+    def _verify_json_group(self, server_name, key_ids, group):
+        """Fetches the verify key for the server and checks the signatures of
+        the JSON objects with it.
+
+        Args:
+            server_name (str)
+            key_ids (list of str)
+            group (list): List of (json_object, Deferred) pairs. Each Deferred
+                is fired with the result of checking its object.
+        """
+        try:
+            verify_key = yield self._get_verify_key_for_server(
+                server_name, key_ids
             )
+            json_objects = [j for j, _ in group]
+            if len(json_objects) > 1:
+                errors = yield threads.deferToThread(
+                    _check_signed_jsons, server_name, verify_key, json_objects,
+                )
+            else:
+                # Not worth the trip to a worker thread for a single object
+                errors = _check_signed_jsons(
+                    server_name, verify_key, json_objects,
+                )
+        except Exception:
+            failure = Failure()
+            for _, d in group:
+                d.errback(failure)
+            return
+
+        for error, (_, d) in zip(errors, group):
+            if error is None:
+                d.callback(None)
+            else:
+                d.errback(error)
+
+    @defer.inlineCallbacks
+    def _get_verify_key_for_server(self, server_name, key_ids):
+        """Like get_server_verify_key, but turns errors into SynapseErrors
+        """
         try:
             verify_key = yield self.get_server_verify_key(server_name, key_ids)
         except IOError as e:
@@ -82,16 +190,7 @@ class Keyring(object):
                 Codes.UNAUTHORIZED,
             )
 
-        try:
-            verify_signed_json(json_object, server_name, verify_key)
-        except:
-            raise SynapseError(
-                401,
-                "Invalid signature for server %s with key %s:%s" % (
-                    server_name, verify_key.alg, verify_key.version
-                ),
-                Codes.UNAUTHORIZED,
-            )
+        defer.returnValue(verify_key)
 
     @defer.inlineCallbacks
     def get_server_verify_key(self, server_name, key_ids):
@@ -101,30 +200,139 @@ class Keyring(object):
             server_name(str): The name of the server to fetch a key for.
             keys_ids (list of str): The key_ids to check for.
         """
+        verify_key = self._get_cached_verify_key(server_name, key_ids)
+        if verify_key is not None:
+            defer.returnValue(verify_key)
+            return
+
         cached = yield self.store.get_server_verify_keys(server_name, key_ids)
 
         if cached:
+            verify_keys = {
+                "%s:%s" % (key.alg, key.version): key for key in cached
+            }
+            valid_until_ms = yield self._get_stored_keys_valid_until(
+                server_name, verify_keys.keys()
+            )
+            for key_id, verify_key in verify_keys.items():
+                self._cache_verify_keys(
+                    server_name, {key_id: verify_key},
+                    valid_until_ms.get(key_id),
+                )
             defer.returnValue(cached[0])
             return
 
-        download = self.key_downloads.get(server_name)
+        download_key = (server_name, tuple(key_ids))
+        download = self.key_downloads.get(download_key)
 
         if download is None:
+            self._check_recent_key_fetch_failures(server_name, key_ids)
+
             download = self._get_server_verify_key_impl(server_name, key_ids)
+
+            # This has to be added before the download is wrapped, since the
+            # ObservableDeferred consumes the failure.
+            @download.addErrback
+            def errback(failure):
+                failed_at_ms = self.clock.time_msec()
+                for key_id in key_ids:
+                    self.failed_key_fetches.prefill(
+                        server_name, key_id, (failed_at_ms, failure),
+                    )
+                return failure
+
             download = ObservableDeferred(
                 download,
                 consumeErrors=True
             )
-            self.key_downloads[server_name] = download
+            self.key_downloads[download_key] = download
 
             @download.addBoth
             def callback(ret):
-                del self.key_downloads[server_name]
+                del self.key_downloads[download_key]
                 return ret
 
         r = yield download.observe()
         defer.returnValue(r)
 
+    def _check_recent_key_fetch_failures(self, server_name, key_ids):
+        """Re-raises the failure of the last fetch of the key ids if fetches
+        of all of them failed recently, so that we don't keep asking a server
+        for keys it can't give us.
+        """
+        now_ms = self.clock.time_msec()
+        failure = None
+        for key_id in key_ids:
+            try:
+                failed = self.failed_key_fetches.get(server_name, key_id)
+            except KeyError:
+                return
+
+            failed_at_ms, failure = failed
+            if now_ms - failed_at_ms >= KEY_FETCH_FAILURE_CACHE_MS:
+                self.failed_key_fetches.invalidate(server_name, key_id)
+                return
+
+        if failure is not None:
+            failure.raiseException()
+
+    @defer.inlineCallbacks
+    def _get_stored_keys_valid_until(self, server_name, key_ids):
+        """Returns a dict of key_id -> the time in milliseconds until which
+        the stored key JSON says the key is valid, for those of the key ids
+        that we have stored key JSON for.
+        """
+        key_json = yield self.store.get_server_keys_json([
+            (server_name, key_id, None) for key_id in key_ids
+        ])
+
+        valid_until_ms = {}
+        for (_, key_id, _), rows in key_json.items():
+            if rows:
+                valid_until_ms[key_id] = max(
+                    row["ts_valid_until_ms"] for row in rows
+                )
+
+        defer.returnValue(valid_until_ms)
+
+    def _get_cached_verify_key(self, server_name, key_ids):
+        """Returns the first of the key ids for the server that we have a
+        valid decoded verify key for in memory, or None.
+        """
+        now_ms = self.clock.time_msec()
+        for key_id in key_ids:
+            try:
+                cached = self.verify_key_cache.get(server_name, key_id)
+            except KeyError:
+                continue
+
+            verify_key, valid_until_ms = cached
+            if now_ms < valid_until_ms:
+                return verify_key
+
+            self.verify_key_cache.invalidate(server_name, key_id)
+
+        return None
+
+    def _cache_verify_keys(self, server_name, verify_keys,
+                           valid_until_ms=None):
+        """Keeps decoded verify keys for the server in memory until they stop
+        being valid.
+        Args:
+            server_name (str): The name of the server the keys are for.
+            verify_keys (dict): A mapping of key_id to VerifyKey.
+            valid_until_ms (int): When the keys stop being valid, if known.
+        """
+        max_valid_until_ms = self.clock.time_msec() + VERIFY_KEY_CACHE_MS
+        if valid_until_ms is None:
+            valid_until_ms = max_valid_until_ms
+        valid_until_ms = min(valid_until_ms, max_valid_until_ms)
+
+        for key_id, verify_key in verify_keys.items():
+            self.verify_key_cache.prefill(
+                server_name, key_id, (verify_key, valid_until_ms),
+            )
+
     @defer.inlineCallbacks
     def _get_server_verify_key_impl(self, server_name, key_ids):
         keys = None
@@ -366,6 +574,8 @@ class Keyring(object):
         response_keys.update(verify_keys)
         response_keys.update(old_verify_keys)
 
+        self._cache_verify_keys(server_name, verify_keys, ts_valid_until_ms)
+
         for key_id in updated_key_ids:
             yield self.store.store_server_keys_json(
                 server_name=server_name,
@@ -450,6 +660,9 @@ class Keyring(object):
             verify_keys=verify_keys,
         )
 
+        # v1 responses don't say how long the keys are valid for.
+        self._cache_verify_keys(server_name, verify_keys)
+
         defer.returnValue(verify_keys)
 
     @defer.inlineCallbacks
@@ -467,3 +680,27 @@ class Keyring(object):
             yield self.store.store_server_verify_key(
                 server_name, server_name, key.time_added, key
             )
+
+
+def _check_signed_jsons(server_name, verify_key, json_objects):
+    """Checks the signatures of the JSON objects. This is safe to call from a
+    worker thread.
+
+    Returns:
+        list: For each object, None if it was correctly signed or the
+        SynapseError to raise if not.
+    """
+    errors = []
+    for json_object in json_objects:
+        try:
+            verify_signed_json(json_object, server_name, verify_key)
+            errors.append(None)
+        except:
+            errors.append(SynapseError(
+                401,
+                "Invalid signature for server %s with key %s:%s" % (
+                    server_name, verify_key.alg, verify_key.version
+                ),
+                Codes.UNAUTHORIZED,
+            ))
+    return errors
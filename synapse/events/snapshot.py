@@ -19,4 +19,7 @@ class EventContext(object):
     def __init__(self, current_state=None):
         self.current_state = current_state
         self.state_group = None
+        # A state group that the state of this event is likely to be a small
+        # delta from, used to store new state groups as deltas.
+        self.prev_group = None
         self.rejected = False
@@ -16,6 +16,10 @@
 from synapse.api.constants import EventTypes
 from . import EventBase
 
+from syutil.jsonutil import encode_canonical_json
+
+import collections
+
 
 def prune_event(event):
     """ Returns a pruned version of the given event, which removes all keys we
@@ -144,6 +148,9 @@ def serialize_event(e, time_now_ms, as_client_event=True,
     # Should this strip out None's?
     d = {k: v for k, v in e.get_dict().items()}
 
+    # Copy the unsigned dict so that we don't change the event's.
+    d["unsigned"] = dict(d["unsigned"])
+
     if "age_ts" in d["unsigned"]:
         d["unsigned"]["age"] = time_now_ms - d["unsigned"]["age_ts"]
         del d["unsigned"]["age_ts"]
@@ -163,3 +170,99 @@ def serialize_event(e, time_now_ms, as_client_event=True,
         return event_format(d)
     else:
         return d
+
+
+def serialize_client_event(e, time_now_ms, as_client_event=True):
+    """Like `serialize_event`, but client events are returned as a
+    `ClientEvent`, which caches its JSON encoding on the event. This should
+    only be used for events that are going straight into a client response.
+    """
+    if not as_client_event or not isinstance(e, EventBase):
+        return serialize_event(e, time_now_ms, as_client_event)
+
+    return ClientEvent(e, time_now_ms)
+
+
+class ClientEvent(collections.MutableMapping):
+    """The client serialization of an event, as returned by `serialize_event`
+    with the default format.
+
+    This can be used like the dict returned by `serialize_event`, which is only
+    built if it is needed, but can also be encoded as JSON with `encode_json`.
+    This caches the encoding, without the age of the event, on the event so
+    that an event which is in many responses only has to be encoded once.
+    """
+
+    __slots__ = ["event", "time_now_ms", "_dict"]
+
+    def __init__(self, event, time_now_ms):
+        self.event = event
+        self.time_now_ms = int(time_now_ms)
+        self._dict = None
+
+    def _get_dict(self):
+        if self._dict is None:
+            self._dict = serialize_event(self.event, self.time_now_ms)
+        return self._dict
+
+    def __getitem__(self, key):
+        return self._get_dict()[key]
+
+    def __setitem__(self, key, value):
+        self._get_dict()[key] = value
+
+    def __delitem__(self, key):
+        del self._get_dict()[key]
+
+    def __iter__(self):
+        return iter(self._get_dict())
+
+    def __len__(self):
+        return len(self._get_dict())
+
+    def __repr__(self):
+        return repr(self._get_dict())
+
+    def encode_json(self):
+        """Returns the canonical JSON encoding of the event as UTF-8 bytes.
+        """
+        if self._dict is not None:
+            # The dict may have been changed, so we can't use the cache.
+            return encode_canonical_json(self._dict)
+
+        event = self.event
+        cached = getattr(event, "_client_json_without_age", None)
+        if cached is None:
+            cached = _encode_client_event_without_age(event)
+            event._client_json_without_age = cached
+
+        if not cached:
+            return encode_canonical_json(self._get_dict())
+
+        age_ts = event.unsigned.get("age_ts")
+        if age_ts is None:
+            return cached
+
+        # "age" sorts before all the other keys, so we can put it first and
+        # still have canonical JSON.
+        age = self.time_now_ms - age_ts
+        if cached == "{}":
+            return '{"age":%d}' % (age,)
+        return '{"age":%d,%s' % (age, cached[1:])
+
+
+def _encode_client_event_without_age(event):
+    """Returns the canonical JSON encoding of the client serialization of the
+    event without its age, or False if it can't be reused across responses.
+    """
+    if "redacted_because" in event.unsigned:
+        # The redaction has its own age.
+        return False
+
+    d = serialize_event(event, 0)
+    d.pop("age", None)
+
+    if d and min(d) < "age":
+        return False
+
+    return encode_canonical_json(d)
@@ -56,9 +56,9 @@ class FederationBase(object):
         signed_pdus = []
 
         @defer.inlineCallbacks
-        def do(pdu):
+        def do(pdu, check):
             try:
-                new_pdu = yield self._check_sigs_and_hash(pdu)
+                new_pdu = yield check
                 signed_pdus.append(new_pdu)
             except SynapseError:
                 # FIXME: We should handle signature failures more gracefully.
@@ -94,14 +94,15 @@ class FederationBase(object):
                     pdu.event_id,
                 )
 
+        checks = self._check_sigs_and_hashes(pdus)
+
         yield defer.gatherResults(
-            [do(pdu) for pdu in pdus],
+            [do(pdu, check) for pdu, check in zip(pdus, checks)],
             consumeErrors=True
         ).addErrback(unwrapFirstError)
 
         defer.returnValue(signed_pdus)
 
-    @defer.inlineCallbacks
     def _check_sigs_and_hash(self, pdu):
         """Throws a SynapseError if the PDU does not have the correct
         signatures.
@@ -110,27 +111,52 @@ class FederationBase(object):
             FrozenEvent: Either the given event or it redacted if it failed the
             content hash check.
         """
-        # Check signatures are correct.
-        redacted_event = prune_event(pdu)
-        redacted_pdu_json = redacted_event.get_pdu_json()
+        return self._check_sigs_and_hashes([pdu])[0]
 
-        try:
-            yield self.keyring.verify_json_for_server(
-                pdu.origin, redacted_pdu_json
-            )
-        except SynapseError:
+    def _check_sigs_and_hashes(self, pdus):
+        """Checks the signatures and hashes of a list of PDUs. The signatures
+        are checked as a batch, so that the keys of each origin are only
+        fetched once.
+
+        Returns:
+            list of Deferreds: One for each PDU, which either fails with a
+            SynapseError or returns the PDU, redacted if it failed the content
+            hash check.
+        """
+        if not pdus:
+            return []
+
+        redacted_pdus = [prune_event(pdu) for pdu in pdus]
+
+        deferreds = self.keyring.verify_json_objects_for_server([
+            (pdu.origin, redacted.get_pdu_json())
+            for pdu, redacted in zip(pdus, redacted_pdus)
+        ])
+
+        def callback(_, pdu, redacted_event):
+            if not check_event_content_hash(pdu):
+                logger.warn(
+                    "Event content has been tampered, redacting %s, %s",
+                    pdu.event_id, encode_canonical_json(pdu.get_dict())
+                )
+                return redacted_event
+
+            return pdu
+
+        def errback(failure, pdu, redacted_event):
+            failure.trap(SynapseError)
             logger.warn(
                 "Signature check failed for %s redacted to %s",
                 encode_canonical_json(pdu.get_pdu_json()),
-                encode_canonical_json(redacted_pdu_json),
+                encode_canonical_json(redacted_event.get_pdu_json()),
             )
-            raise
+            return failure
 
-        if not check_event_content_hash(pdu):
-            logger.warn(
-                "Event content has been tampered, redacting %s, %s",
-                pdu.event_id, encode_canonical_json(pdu.get_dict())
+        for d, pdu, redacted in zip(deferreds, pdus, redacted_pdus):
+            d.addCallbacks(
+                callback, errback,
+                callbackArgs=(pdu, redacted),
+                errbackArgs=(pdu, redacted),
             )
-            defer.returnValue(redacted_event)
 
-        defer.returnValue(pdu)
+        return deferreds
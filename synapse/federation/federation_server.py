@@ -15,10 +15,12 @@
 
 
 from twisted.internet import defer
+from twisted.python.failure import Failure
 
 from .federation_base import FederationBase
 from .units import Transaction, Edu
 
+from synapse.util.async import concurrently_map
 from synapse.util.logutils import log_function
 from synapse.events import FrozenEvent
 import synapse.metrics
@@ -27,6 +29,8 @@ from synapse.api.errors import FederationError, SynapseError
 
 from synapse.crypto.event_signing import compute_event_signature
 
+from collections import OrderedDict
+
 import logging
 
 
@@ -122,20 +126,63 @@ class FederationServer(FederationBase):
 
         logger.debug("[%s] Transaction is new", transaction.transaction_id)
 
-        results = []
+        # _handle_new_pdu skips the PDUs we have already persisted, e.g. when
+        # a transaction is retried, so we don't check their signatures.
+        existing = []
+        if pdu_list:
+            existing = yield self.store.get_events(
+                [pdu.event_id for pdu in pdu_list], allow_rejected=True,
+            )
+        seen_ids = set(
+            event.event_id for event in existing
+            if not event.internal_metadata.is_outlier()
+        )
+        unseen = [
+            i for i, pdu in enumerate(pdu_list) if pdu.event_id not in seen_ids
+        ]
 
-        for pdu in pdu_list:
-            d = self._handle_new_pdu(transaction.origin, pdu)
+        # Check the signatures of the other PDUs up front, so that we only
+        # fetch the keys of each origin once.
+        checks = yield defer.DeferredList(
+            self._check_sigs_and_hashes([pdu_list[i] for i in unseen]),
+            consumeErrors=True,
+        )
+        pdu_checks = {
+            i: checked_pdu for i, (_, checked_pdu) in zip(unseen, checks)
+        }
 
-            try:
-                yield d
-                results.append({})
-            except FederationError as e:
-                self.send_failure(e, transaction.origin)
-                results.append({"error": str(e)})
-            except Exception as e:
-                results.append({"error": str(e)})
-                logger.exception("Failed to handle PDU")
+        # The PDUs of each room are handled in order, but the rooms are handled
+        # concurrently so that one slow room doesn't hold up the others.
+        pdus_by_room = OrderedDict()
+        for i, pdu in enumerate(pdu_list):
+            pdus_by_room.setdefault(pdu.room_id, []).append(i)
+
+        results = [None] * len(pdu_list)
+
+        @defer.inlineCallbacks
+        def handle_room_pdus(room_id):
+            lock = yield self._room_pdu_linearizer.lock(room_id)
+            with lock:
+                for i in pdus_by_room[room_id]:
+                    d = self._handle_new_pdu(
+                        transaction.origin, pdu_list[i],
+                        checked_pdu=pdu_checks.get(i),
+                    )
+
+                    try:
+                        yield d
+                        results[i] = {}
+                    except FederationError as e:
+                        self.send_failure(e, transaction.origin)
+                        results[i] = {"error": str(e)}
+                    except Exception as e:
+                        results[i] = {"error": str(e)}
+                        logger.exception("Failed to handle PDU")
+
+        yield concurrently_map(
+            handle_room_pdus, pdus_by_room.keys(),
+            limit=self.hs.config.federation_transaction_room_concurrency,
+        )
 
         if hasattr(transaction, "edus"):
             for edu in [Edu(**x) for x in transaction.edus]:
@@ -352,7 +399,17 @@ class FederationServer(FederationBase):
 
     @defer.inlineCallbacks
     @log_function
-    def _handle_new_pdu(self, origin, pdu, get_missing=True):
+    def _handle_new_pdu(self, origin, pdu, get_missing=True,
+                        checked_pdu=None):
+        """
+        Args:
+            origin (str)
+            pdu (FrozenEvent)
+            get_missing (bool)
+            checked_pdu: The result of checking the signatures and hashes of
+                the PDU, if we have already done so; either a FrozenEvent or a
+                Failure.
+        """
         # We reprocess pdus when we have seen them only as outliers
         existing = yield self._get_persisted_pdu(
             origin, pdu.event_id, do_auth=False
@@ -373,7 +430,12 @@ class FederationServer(FederationBase):
 
         # Check signature.
         try:
-            pdu = yield self._check_sigs_and_hash(pdu)
+            if checked_pdu is None:
+                pdu = yield self._check_sigs_and_hash(pdu)
+            elif isinstance(checked_pdu, Failure):
+                checked_pdu.raiseException()
+            else:
+                pdu = checked_pdu
         except SynapseError as e:
             raise FederationError(
                 "ERROR",
@@ -24,6 +24,8 @@ from .transaction_queue import TransactionQueue
 
 from .persistence import TransactionActions
 
+from synapse.util.lockutils import LockManager
+
 import logging
 
 
@@ -72,6 +74,8 @@ class ReplicationLayer(FederationClient, FederationServer):
 
         self._order = 0
 
+        self._room_pdu_linearizer = LockManager()
+
         self.hs = hs
 
     def __str__(self):
@@ -17,6 +17,8 @@ from twisted.internet import defer
 
 from ._base import BaseHandler
 
+from synapse.storage._base import get_cache_stats
+
 import logging
 
 
@@ -60,3 +62,6 @@ class AdminHandler(BaseHandler):
         }
 
         defer.returnValue(ret)
+
+    def get_cache_stats(self):
+        return {"caches": get_cache_stats()}
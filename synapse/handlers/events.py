@@ -17,7 +17,7 @@ from twisted.internet import defer
 
 from synapse.util.logutils import log_function
 from synapse.types import UserID
-from synapse.events.utils import serialize_event
+from synapse.events.utils import serialize_client_event
 
 from ._base import BaseHandler
 
@@ -87,7 +87,8 @@ class EventStreamHandler(BaseHandler):
             time_now = self.clock.time_msec()
 
             chunks = [
-                serialize_event(e, time_now, as_client_event) for e in events
+                serialize_client_event(e, time_now, as_client_event)
+                for e in events
             ]
 
             chunk = {
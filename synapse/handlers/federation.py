@@ -138,26 +138,30 @@ class FederationHandler(BaseHandler):
         if state and auth_chain is not None:
             # If we have any state or auth_chain given to us by the replication
             # layer, then we should handle them (if we haven't before.)
+            event_infos = []
             for e in itertools.chain(auth_chain, state):
                 if e.event_id in seen_ids:
                     continue
 
                 e.internal_metadata.outlier = True
-                try:
-                    auth_ids = [e_id for e_id, _ in e.auth_events]
-                    auth = {
-                        (e.type, e.state_key): e for e in auth_chain
-                        if e.event_id in auth_ids
-                    }
-                    yield self._handle_new_event(
-                        origin, e, auth_events=auth
-                    )
-                    seen_ids.add(e.event_id)
-                except:
-                    logger.exception(
-                        "Failed to handle state event %s",
-                        e.event_id,
-                    )
+                auth_ids = [e_id for e_id, _ in e.auth_events]
+                auth = {
+                    (e.type, e.state_key): e for e in auth_chain
+                    if e.event_id in auth_ids
+                }
+                event_infos.append({
+                    "event": e,
+                    "auth_events": auth,
+                })
+                seen_ids.add(e.event_id)
+
+            try:
+                yield self._handle_new_events(origin, event_infos)
+            except:
+                logger.exception(
+                    "Failed to handle state events of %s",
+                    event.event_id,
+                )
 
         try:
             _, event_stream_id, max_stream_id = yield self._handle_new_event(
@@ -260,25 +264,22 @@ class FederationHandler(BaseHandler):
             auth_events.update({a.event_id: a for a in auth})
             events_to_state[e_id] = state
 
-        yield defer.gatherResults(
-            [
-                self._handle_new_event(dest, a)
-                for a in auth_events.values()
-            ],
-            consumeErrors=True,
-        ).addErrback(unwrapFirstError)
+        yield self._handle_new_events(
+            dest,
+            [{"event": a} for a in auth_events.values()],
+        )
 
-        yield defer.gatherResults(
+        yield self._handle_new_events(
+            dest,
             [
-                self._handle_new_event(
-                    dest, event_map[e_id],
-                    state=events_to_state[e_id],
-                    backfilled=True,
-                )
+                {
+                    "event": event_map[e_id],
+                    "state": events_to_state[e_id],
+                }
                 for e_id in events_to_state
             ],
-            consumeErrors=True
-        ).addErrback(unwrapFirstError)
+            backfilled=True,
+        )
 
         events.sort(key=lambda e: e.depth)
 
@@ -559,28 +560,29 @@ class FederationHandler(BaseHandler):
                 origin, [e for e in auth_chain if e.event_id != event.event_id]
             )
 
-            @defer.inlineCallbacks
-            def handle_state(e):
+            event_infos = []
+            for e in state:
                 if e.event_id == event.event_id:
-                    return
+                    continue
 
                 e.internal_metadata.outlier = True
-                try:
-                    auth_ids = [e_id for e_id, _ in e.auth_events]
-                    auth = {
-                        (e.type, e.state_key): e for e in auth_chain
-                        if e.event_id in auth_ids
-                    }
-                    yield self._handle_new_event(
-                        origin, e, auth_events=auth
-                    )
-                except:
-                    logger.exception(
-                        "Failed to handle state event %s",
-                        e.event_id,
-                    )
+                auth_ids = [e_id for e_id, _ in e.auth_events]
+                auth = {
+                    (e.type, e.state_key): e for e in auth_chain
+                    if e.event_id in auth_ids
+                }
+                event_infos.append({
+                    "event": e,
+                    "auth_events": auth,
+                })
 
-            yield defer.DeferredList([handle_state(e) for e in state])
+            try:
+                yield self._handle_new_events(origin, event_infos)
+            except:
+                logger.exception(
+                    "Failed to handle state events of %s",
+                    room_id,
+                )
 
             auth_ids = [e_id for e_id, _ in event.auth_events]
             auth_events = {
@@ -900,31 +902,12 @@ class FederationHandler(BaseHandler):
             event.event_id, event.signatures,
         )
 
-        context = yield self.state_handler.compute_event_context(
-            event, old_state=state
-        )
-
-        if not auth_events:
-            auth_events = context.current_state
-
-        logger.debug(
-            "_handle_new_event: %s, auth_events: %s",
-            event.event_id, auth_events,
+        context, auth_events = yield self._prep_event(
+            origin, event, state=state, auth_events=auth_events
         )
 
         is_new_state = not event.internal_metadata.is_outlier()
 
-        # This is a hack to fix some old rooms where the initial join event
-        # didn't reference the create event in its auth events.
-        if event.type == EventTypes.Member and not event.auth_events:
-            if len(event.prev_events) == 1 and event.depth < 5:
-                c = yield self.store.get_event(
-                    event.prev_events[0][0],
-                    allow_none=True,
-                )
-                if c and c.type == EventTypes.Create:
-                    auth_events[(c.type, c.state_key)] = c
-
         try:
             yield self.do_auth(
                 origin, event, context, auth_events=auth_events
@@ -958,6 +941,99 @@ class FederationHandler(BaseHandler):
 
         defer.returnValue((context, event_stream_id, max_stream_id))
 
+    @defer.inlineCallbacks
+    def _handle_new_events(self, origin, event_infos, backfilled=False):
+        """Like `_handle_new_event`, but for a list of outliers or backfilled
+        events, which are persisted in a single transaction. Events that fail
+        the auth checks are persisted as rejected rather than raising, and
+        events that we fail to handle at all are logged and skipped.
+
+        Args:
+            origin (str)
+            event_infos (list): dicts with an "event" and optionally the
+                "state" and "auth_events" to pass to `_handle_new_event`.
+            backfilled (bool)
+        """
+        @defer.inlineCallbacks
+        def prep(ev_info):
+            event = ev_info["event"]
+            try:
+                context, auth_events = yield self._prep_event(
+                    origin, event,
+                    state=ev_info.get("state"),
+                    auth_events=ev_info.get("auth_events"),
+                )
+
+                try:
+                    yield self.do_auth(
+                        origin, event, context, auth_events=auth_events
+                    )
+                except AuthError as e:
+                    logger.warn(
+                        "Rejecting %s because %s",
+                        event.event_id, e.msg
+                    )
+
+                    context.rejected = RejectedReason.AUTH_ERROR
+            except:
+                logger.exception(
+                    "Failed to handle event %s",
+                    event.event_id,
+                )
+                defer.returnValue(None)
+
+            defer.returnValue(context)
+
+        contexts = yield defer.gatherResults(
+            [prep(ev_info) for ev_info in event_infos],
+            consumeErrors=True,
+        ).addErrback(unwrapFirstError)
+
+        # Neither outliers nor backfilled events change the current state of
+        # the room.
+        yield self.store.persist_events(
+            [
+                (ev_info["event"], context)
+                for ev_info, context in zip(event_infos, contexts)
+                if context is not None
+            ],
+            backfilled=backfilled,
+            is_new_state=False,
+        )
+
+    @defer.inlineCallbacks
+    def _prep_event(self, origin, event, state=None, auth_events=None):
+        """Computes the context of an event we've received over federation,
+        and the auth events to check it against.
+
+        Returns:
+            Deferred: (context, auth_events) tuple.
+        """
+        context = yield self.state_handler.compute_event_context(
+            event, old_state=state
+        )
+
+        if not auth_events:
+            auth_events = context.current_state
+
+        logger.debug(
+            "_prep_event: %s, auth_events: %s",
+            event.event_id, auth_events,
+        )
+
+        # This is a hack to fix some old rooms where the initial join event
+        # didn't reference the create event in its auth events.
+        if event.type == EventTypes.Member and not event.auth_events:
+            if len(event.prev_events) == 1 and event.depth < 5:
+                c = yield self.store.get_event(
+                    event.prev_events[0][0],
+                    allow_none=True,
+                )
+                if c and c.type == EventTypes.Create:
+                    auth_events[(c.type, c.state_key)] = c
+
+        defer.returnValue((context, auth_events))
+
     @defer.inlineCallbacks
     def on_query_auth(self, origin, event_id, remote_auth_chain, rejects,
                       missing):
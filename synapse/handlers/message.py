@@ -18,10 +18,12 @@ from twisted.internet import defer
 from synapse.api.constants import EventTypes, Membership
 from synapse.api.errors import RoomError, SynapseError
 from synapse.streams.config import PaginationConfig
-from synapse.events.utils import serialize_event
+from synapse.events.utils import serialize_client_event
 from synapse.events.validator import EventValidator
 from synapse.util import unwrapFirstError
+from synapse.util.async import concurrently_iterate
 from synapse.util.logcontext import PreserveLoggingContext
+from synapse.util.streamedjson import StreamedJsonList
 from synapse.types import UserID, RoomStreamToken
 
 from ._base import BaseHandler
@@ -117,7 +119,8 @@ class MessageHandler(BaseHandler):
 
         chunk = {
             "chunk": [
-                serialize_event(e, time_now, as_client_event) for e in events
+                serialize_client_event(e, time_now, as_client_event)
+                for e in events
             ],
             "start": pagin_config.from_token.to_string(),
             "end": next_token.to_string(),
@@ -238,7 +241,7 @@ class MessageHandler(BaseHandler):
         current_state = yield self.state_handler.get_current_state(room_id)
         now = self.clock.time_msec()
         defer.returnValue(
-            [serialize_event(c, now) for c in current_state.values()]
+            [serialize_client_event(c, now) for c in current_state.values()]
         )
 
     @defer.inlineCallbacks
@@ -256,10 +259,13 @@ class MessageHandler(BaseHandler):
             feedback (bool): True to get feedback along with these messages.
             as_client_event (bool): True to get events in client-server format.
         Returns:
-            A list of dicts with "room_id" and "membership" keys for all rooms
-            the user is currently invited or joined in on. Rooms where the user
-            is joined on, may return a "messages" key with messages, depending
-            on the specified PaginationConfig.
+            A dict whose "rooms" are dicts with "room_id" and "membership"
+            keys for all rooms the user is currently invited or joined in on.
+            Rooms where the user is joined on, may return a "messages" key
+            with messages, depending on the specified PaginationConfig.
+
+            The "rooms" are a StreamedJsonList, so rooms are only looked up, a
+            few at a time, as the response is written to the client.
         """
         room_list = yield self.store.get_rooms_for_user_where_membership_is(
             user_id=user_id,
@@ -268,8 +274,6 @@ class MessageHandler(BaseHandler):
 
         user = UserID.from_string(user_id)
 
-        rooms_ret = []
-
         now_token = yield self.hs.get_event_sources().get_current_token()
 
         presence_stream = self.hs.get_event_sources().sources["presence"]
@@ -298,10 +302,8 @@ class MessageHandler(BaseHandler):
             if event.membership == Membership.INVITE:
                 d["inviter"] = event.sender
 
-            rooms_ret.append(d)
-
             if event.membership != Membership.JOIN:
-                return
+                defer.returnValue(d)
             try:
                 (messages, token), current_state = yield defer.gatherResults(
                     [
@@ -322,7 +324,7 @@ class MessageHandler(BaseHandler):
 
                 d["messages"] = {
                     "chunk": [
-                        serialize_event(m, time_now, as_client_event)
+                        serialize_client_event(m, time_now, as_client_event)
                         for m in messages
                     ],
                     "start": start_token.to_string(),
@@ -330,19 +332,20 @@ class MessageHandler(BaseHandler):
                 }
 
                 d["state"] = [
-                    serialize_event(c, time_now, as_client_event)
+                    serialize_client_event(c, time_now, as_client_event)
                     for c in current_state.values()
                 ]
             except:
                 logger.exception("Failed to get snapshot")
 
-        yield defer.gatherResults(
-            [handle_room(e) for e in room_list],
-            consumeErrors=True
-        ).addErrback(unwrapFirstError)
+            defer.returnValue(d)
 
         ret = {
-            "rooms": rooms_ret,
+            "rooms": StreamedJsonList(concurrently_iterate(
+                handle_room, room_list,
+                limit=self.hs.config.sync_room_concurrency,
+                semaphore=self.hs.get_sync_room_semaphore(),
+            )),
             "presence": presence,
             "end": now_token.to_string()
         }
@@ -368,7 +371,7 @@ class MessageHandler(BaseHandler):
         # TODO: These concurrently
         time_now = self.clock.time_msec()
         state = [
-            serialize_event(x, time_now)
+            serialize_client_event(x, time_now)
             for x in current_state.values()
         ]
 
@@ -416,7 +419,7 @@ class MessageHandler(BaseHandler):
             "membership": member_event.membership,
             "room_id": room_id,
             "messages": {
-                "chunk": [serialize_event(m, time_now) for m in messages],
+                "chunk": [serialize_client_event(m, time_now) for m in messages],
                 "start": start_token.to_string(),
                 "end": end_token.to_string(),
             },
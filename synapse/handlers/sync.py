@@ -17,6 +17,9 @@ from ._base import BaseHandler
 
 from synapse.streams.config import PaginationConfig
 from synapse.api.constants import Membership, EventTypes
+from synapse.util.async import concurrently_map
+
+from syutil.jsonutil import encode_canonical_json
 
 from twisted.internet import defer
 
@@ -100,8 +103,14 @@ class SyncHandler(BaseHandler):
                 sync_config.user
             )
             result = yield self.notifier.wait_for_events(
-                sync_config.user, room_ids,
-                sync_config.filter, timeout, current_sync_callback
+                sync_config.user, room_ids, timeout, current_sync_callback,
+                from_token=since_token,
+                callback_key=(
+                    "sync", sync_config.user.to_string(), since_token,
+                    sync_config.limit, sync_config.gap, sync_config.sort,
+                    sync_config.backfill,
+                    encode_canonical_json(sync_config.filter.filter_json),
+                ),
             )
             defer.returnValue(result)
 
@@ -151,12 +160,16 @@ class SyncHandler(BaseHandler):
         published_rooms = yield self.store.get_rooms(is_public=True)
         published_room_ids = set(r["room_id"] for r in published_rooms)
 
-        rooms = []
-        for event in room_list:
-            room_sync = yield self.initial_sync_for_room(
+        def sync_room(event):
+            return self.initial_sync_for_room(
                 event.room_id, sync_config, now_token, published_room_ids
             )
-            rooms.append(room_sync)
+
+        rooms = yield concurrently_map(
+            sync_room, room_list,
+            limit=self.hs.config.sync_room_concurrency,
+            semaphore=self.hs.get_sync_room_semaphore(),
+        )
 
         defer.returnValue(SyncResult(
             public_user_data=presence,
@@ -177,10 +190,16 @@ class SyncHandler(BaseHandler):
             room_id, sync_config, now_token,
         )
 
-        current_state = yield self.state_handler.get_current_state(
-            room_id
-        )
-        current_state_events = current_state.values()
+        state_ids = yield self.get_state_ids_at([room_id], now_token)
+        if room_id in state_ids:
+            current_state_events = yield self.store.get_events(
+                state_ids[room_id].values()
+            )
+        else:
+            current_state = yield self.state_handler.get_current_state(
+                room_id
+            )
+            current_state_events = current_state.values()
 
         defer.returnValue(RoomSyncResult(
             room_id=room_id,
@@ -277,13 +296,39 @@ class SyncHandler(BaseHandler):
                 if room_sync:
                     rooms.append(room_sync)
         else:
-            for room_id in room_ids:
-                room_sync = yield self.incremental_sync_with_gap_for_room(
+            # Rooms without any new events since the previous sync can only
+            # have new typing notifications, so we don't need to look at them.
+            changed_room_ids = yield self.store.get_rooms_changed_since(
+                room_ids, since_token.room_key
+            )
+
+            state_deltas = yield self.get_state_deltas(
+                changed_room_ids, since_token, now_token
+            )
+
+            def sync_room(room_id):
+                if room_id not in changed_room_ids:
+                    return RoomSyncResult(
+                        room_id=room_id,
+                        published=room_id in published_room_ids,
+                        events=[],
+                        prev_batch=now_token,
+                        state=[],
+                        limited=False,
+                        ephemeral=typing_by_room.get(room_id, [])
+                    )
+                return self.incremental_sync_with_gap_for_room(
                     room_id, sync_config, since_token, now_token,
-                    published_room_ids, typing_by_room
+                    published_room_ids, typing_by_room,
+                    state_delta=state_deltas.get(room_id),
                 )
-                if room_sync:
-                    rooms.append(room_sync)
+
+            room_syncs = yield concurrently_map(
+                sync_room, room_ids,
+                limit=self.hs.config.sync_room_concurrency,
+                semaphore=self.hs.get_sync_room_semaphore(),
+            )
+            rooms = [room_sync for room_sync in room_syncs if room_sync]
 
         defer.returnValue(SyncResult(
             public_user_data=presence,
@@ -332,10 +377,15 @@ class SyncHandler(BaseHandler):
     @defer.inlineCallbacks
     def incremental_sync_with_gap_for_room(self, room_id, sync_config,
                                            since_token, now_token,
-                                           published_room_ids, typing_by_room):
+                                           published_room_ids, typing_by_room,
+                                           state_delta=None):
         """ Get the incremental delta needed to bring the client up to date for
         the room. Gives the client the most recent events and the changes to
         state.
+
+        Args:
+            state_delta (list): The changes to the state of the room, as
+                returned by `get_state_deltas`, if known.
         Returns:
             A Deferred RoomSyncResult
         """
@@ -348,22 +398,25 @@ class SyncHandler(BaseHandler):
 
         logging.debug("Recents %r", recents)
 
-        # TODO(mjark): This seems racy since this isn't being passed a
-        # token to indicate what point in the stream this is
-        current_state = yield self.state_handler.get_current_state(
-            room_id
-        )
-        current_state_events = current_state.values()
+        if state_delta is not None:
+            state_events_delta = state_delta
+        else:
+            # TODO(mjark): This seems racy since this isn't being passed a
+            # token to indicate what point in the stream this is
+            current_state = yield self.state_handler.get_current_state(
+                room_id
+            )
+            current_state_events = current_state.values()
 
-        state_at_previous_sync = yield self.get_state_at_previous_sync(
-            room_id, since_token=since_token
-        )
+            state_at_previous_sync = yield self.get_state_at_previous_sync(
+                room_id, since_token=since_token
+            )
 
-        state_events_delta = yield self.compute_state_delta(
-            since_token=since_token,
-            previous_state=state_at_previous_sync,
-            current_state=current_state_events,
-        )
+            state_events_delta = yield self.compute_state_delta(
+                since_token=since_token,
+                previous_state=state_at_previous_sync,
+                current_state=current_state_events,
+            )
 
         state_events_delta = yield self.check_joined_room(
             sync_config, room_id, state_events_delta
@@ -383,6 +436,111 @@ class SyncHandler(BaseHandler):
 
         defer.returnValue(room_sync)
 
+    @defer.inlineCallbacks
+    def get_unforked_last_event_ids(self, room_ids, stream_token):
+        """ Get the latest event of each room at the stream token, for the
+        rooms where it is the only forward extremity. The state group of that
+        event is then the current state of the room. If the room has several
+        forward extremities its current state has to be resolved from all of
+        them.
+        Returns:
+            A Deferred dict mapping room_id to event_id.
+        """
+        last_event_ids = yield self.store.get_last_event_ids_for_rooms(
+            room_ids, stream_token.room_key
+        )
+        extremities = yield self.store.get_latest_event_ids_in_rooms(
+            last_event_ids.keys()
+        )
+
+        defer.returnValue({
+            room_id: event_id
+            for room_id, event_id in last_event_ids.items()
+            if extremities.get(room_id) == [event_id]
+        })
+
+    @defer.inlineCallbacks
+    def get_state_ids_at(self, room_ids, stream_token):
+        """ Get the state of each room after its latest event at the stream
+        token, from the state group of that event, if that is the current
+        state of the room. This is much cheaper than resolving the current
+        state of the room.
+        Returns:
+            A Deferred dict mapping room_id to a dict of
+            (type, state_key) -> event_id. Rooms whose state we can't get this
+            way are omitted.
+        """
+        last_event_ids = yield self.get_unforked_last_event_ids(
+            room_ids, stream_token
+        )
+        state_ids = yield self.store.get_state_ids_for_events(
+            last_event_ids.values()
+        )
+
+        defer.returnValue({
+            room_id: state_ids[event_id]
+            for room_id, event_id in last_event_ids.items()
+            if event_id in state_ids
+        })
+
+    @defer.inlineCallbacks
+    def get_state_deltas(self, room_ids, since_token, now_token):
+        """ Works out the changes to the state of each room between the two
+        tokens by comparing the state groups of the latest events in the room
+        at each token, rather than resolving the state of the room. Rooms
+        that have several forward extremities are omitted, see
+        `get_unforked_last_event_ids`.
+        Returns:
+            A Deferred dict mapping room_id to a list of the state events that
+            are new since the previous sync. Rooms whose state we can't get
+            this way are omitted.
+        """
+        previous_event_ids = yield self.store.get_last_event_ids_for_rooms(
+            room_ids, since_token.room_key
+        )
+        current_event_ids = yield self.get_unforked_last_event_ids(
+            room_ids, now_token
+        )
+
+        state_ids = yield self.store.get_state_ids_for_events(
+            set(previous_event_ids.values()) | set(current_event_ids.values())
+        )
+
+        changed_ids_by_room = {}
+        for room_id in room_ids:
+            current_state_ids = state_ids.get(current_event_ids.get(room_id))
+            if current_state_ids is None:
+                continue
+
+            previous_event_id = previous_event_ids.get(room_id)
+            if previous_event_id is None:
+                # The room had no events when the client last synced.
+                previous_state_ids = {}
+            elif previous_event_id in state_ids:
+                previous_state_ids = state_ids[previous_event_id]
+            else:
+                continue
+
+            changed_ids_by_room[room_id] = [
+                event_id for key, event_id in current_state_ids.items()
+                if previous_state_ids.get(key) != event_id
+            ]
+
+        events = yield self.store.get_events([
+            event_id
+            for event_ids in changed_ids_by_room.values()
+            for event_id in event_ids
+        ])
+        event_map = {event.event_id: event for event in events}
+
+        defer.returnValue({
+            room_id: [
+                event_map[event_id] for event_id in event_ids
+                if event_id in event_map
+            ]
+            for room_id, event_ids in changed_ids_by_room.items()
+        })
+
     @defer.inlineCallbacks
     def get_state_at_previous_sync(self, room_id, since_token):
         """ Get the room state at the previous sync the client made.
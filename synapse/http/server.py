@@ -17,12 +17,12 @@
 from synapse.api.errors import (
     cs_exception, SynapseError, CodeMessageException, UnrecognizedRequestError
 )
+from synapse.events.utils import ClientEvent
 from synapse.util.logcontext import LoggingContext, PreserveLoggingContext
+from synapse.util.streamedjson import StreamedJsonList
 import synapse.metrics
 
-from syutil.jsonutil import (
-    encode_canonical_json, encode_pretty_printed_json
-)
+from frozendict import frozendict
 
 from twisted.internet import defer
 from twisted.web import server, resource
@@ -31,6 +31,9 @@ from twisted.web.util import redirectTo
 
 import collections
 import logging
+import os
+import re
+import simplejson
 import urllib
 
 logger = logging.getLogger(__name__)
@@ -162,15 +165,20 @@ class JsonResource(HttpServer, resource.Resource):
     The JsonResource is primarily intended for returning JSON, but callbacks
     may send something other than JSON, they may do so by using the methods
     on the request object and instead returning None.
+
+    Responses are encoded as canonical JSON unless `canonical_json` is False,
+    which should only be used for resources whose responses are never signed
+    or hashed, e.g. those for clients.
     """
 
     isLeaf = True
 
     _PathEntry = collections.namedtuple("_PathEntry", ["pattern", "callback"])
 
-    def __init__(self, hs):
+    def __init__(self, hs, canonical_json=True):
         resource.Resource.__init__(self)
 
+        self.canonical_json = canonical_json
         self.clock = hs.get_clock()
         self.path_regexs = {}
         self.version_string = hs.version_string
@@ -225,7 +233,7 @@ class JsonResource(HttpServer, resource.Resource):
             callback_return = yield callback(request, *args)
             if callback_return is not None:
                 code, response = callback_return
-                self._send_response(request, code, response)
+                yield self._send_response(request, code, response)
 
             response_timer.inc_by(
                 self.clock.time_msec() - start, request.method, servlet_classname
@@ -250,12 +258,13 @@ class JsonResource(HttpServer, resource.Resource):
         outgoing_responses_counter.inc(request.method, str(code))
 
         # TODO: Only enable CORS for the requests that need it.
-        respond_with_json(
+        return respond_with_json(
             request, code, response_json_object,
             send_cors=True,
             response_code_message=response_code_message,
             pretty_print=_request_user_agent_is_curl(request),
             version_string=self.version_string,
+            canonical_json=self.canonical_json,
         )
 
 
@@ -275,21 +284,132 @@ class RootRedirect(resource.Resource):
         return resource.Resource.getChild(self, name, request)
 
 
+def encode_json_with_client_events(json_object, canonical=True):
+    """Encodes the object as JSON, as UTF-8 bytes. Any `ClientEvent`s in the
+    object are replaced by their cached encodings, rather than being encoded
+    again.
+
+    Args:
+        json_object: The object to encode. This must not contain any
+            `StreamedJsonList`s.
+        canonical (bool): Whether to encode the object as canonical JSON. If
+            not then the keys of the object are not sorted, which is quicker.
+            This is fine for responses to clients, but not for anything that
+            is signed or hashed.
+    """
+    parts = _encode_json_parts(json_object, canonical=canonical)
+    if len(parts) > 1:
+        raise TypeError("Can only stream a StreamedJsonList in a response")
+    return parts[0]
+
+
+def _encode_json_parts(json_object, canonical=True, pretty_print=False):
+    """Encodes the object as JSON, as UTF-8 bytes, except for any
+    `StreamedJsonList`s in it.
+
+    Returns:
+        list: The encoded bytes before, between and after each
+        `StreamedJsonList`, alternating with the `StreamedJsonList`s. This
+        has a single element if there are no `StreamedJsonList`s.
+    """
+    # Each ClientEvent and StreamedJsonList is encoded as a placeholder string,
+    # which is then replaced. The placeholders include a random nonce so that
+    # they can't clash with strings in the response.
+    placeholder = "__json_fragment_%s_" % (os.urandom(8).encode("hex"),)
+    fragments = []
+
+    def default(o):
+        if isinstance(o, StreamedJsonList):
+            fragments.append(o)
+        elif isinstance(o, ClientEvent) and not pretty_print:
+            fragments.append(o.encode_json())
+        else:
+            return _json_default(o)
+        return "%s%d" % (placeholder, len(fragments) - 1)
+
+    if pretty_print:
+        json_bytes = simplejson.dumps(
+            json_object,
+            ensure_ascii=False,
+            indent=4,
+            sort_keys=True,
+            default=default,
+        )
+    else:
+        json_bytes = simplejson.dumps(
+            json_object,
+            ensure_ascii=False,
+            separators=(",", ":"),
+            sort_keys=canonical,
+            default=default,
+        )
+    if isinstance(json_bytes, unicode):
+        json_bytes = json_bytes.encode("UTF-8")
+
+    if not fragments:
+        return [json_bytes]
+
+    # This alternates between the bytes between placeholders and the indices
+    # of the fragments in the placeholders.
+    pieces = re.split('"%s(\\d+)"' % (placeholder,), json_bytes)
+
+    parts = []
+    current = [pieces[0]]
+    for i in range(1, len(pieces), 2):
+        fragment = fragments[int(pieces[i])]
+        if isinstance(fragment, StreamedJsonList):
+            parts.append("".join(current))
+            parts.append(fragment)
+            current = []
+        else:
+            current.append(fragment)
+        current.append(pieces[i + 1])
+    parts.append("".join(current))
+
+    return parts
+
+
+def _json_default(o):
+    if isinstance(o, (ClientEvent, frozendict)):
+        return dict(o)
+    raise TypeError("%r is not JSON serializable" % (o,))
+
+
 def respond_with_json(request, code, json_object, send_cors=False,
                       response_code_message=None, pretty_print=False,
-                      version_string=""):
+                      version_string="", canonical_json=True):
+    """Sends the object as JSON in response to the given request.
+
+    If the object contains any `StreamedJsonList`s then the response is
+    streamed to the client, and this returns a Deferred that completes once
+    the whole response has been written.
+    """
+    parts = _encode_json_parts(
+        json_object, canonical=canonical_json, pretty_print=pretty_print
+    )
     if pretty_print:
-        json_bytes = encode_pretty_printed_json(json_object) + "\n"
-    else:
-        json_bytes = encode_canonical_json(json_object)
+        parts[-1] += "\n"
+
+    if len(parts) == 1:
+        return respond_with_json_bytes(
+            request, code, parts[0],
+            send_cors=send_cors,
+            response_code_message=response_code_message,
+            version_string=version_string
+        )
 
-    return respond_with_json_bytes(
-        request, code, json_bytes,
+    _set_response_headers(
+        request, code,
         send_cors=send_cors,
         response_code_message=response_code_message,
-        version_string=version_string
+        version_string=version_string,
     )
 
+    producer = _StreamedJsonProducer(
+        request, parts, canonical_json, pretty_print
+    )
+    return producer.start()
+
 
 def respond_with_json_bytes(request, code, json_bytes, send_cors=False,
                             version_string="", response_code_message=None):
@@ -304,10 +424,24 @@ def respond_with_json_bytes(request, code, json_bytes, send_cors=False,
     Returns:
         twisted.web.server.NOT_DONE_YET"""
 
+    _set_response_headers(
+        request, code,
+        send_cors=send_cors,
+        response_code_message=response_code_message,
+        version_string=version_string,
+    )
+    request.setHeader(b"Content-Length", b"%d" % (len(json_bytes),))
+
+    request.write(json_bytes)
+    request.finish()
+    return NOT_DONE_YET
+
+
+def _set_response_headers(request, code, send_cors=False, version_string="",
+                          response_code_message=None):
     request.setResponseCode(code, message=response_code_message)
     request.setHeader(b"Content-Type", b"application/json")
     request.setHeader(b"Server", version_string)
-    request.setHeader(b"Content-Length", b"%d" % (len(json_bytes),))
 
     if send_cors:
         request.setHeader("Access-Control-Allow-Origin", "*")
@@ -316,9 +450,121 @@ def respond_with_json_bytes(request, code, json_bytes, send_cors=False,
         request.setHeader("Access-Control-Allow-Headers",
                           "Origin, X-Requested-With, Content-Type, Accept")
 
-    request.write(json_bytes)
-    request.finish()
-    return NOT_DONE_YET
+
+class _StreamedJsonProducer(object):
+    """Writes a JSON response containing `StreamedJsonList`s to the request,
+    working out the items of each list as it goes.
+
+    This is registered as a streaming producer for the request, so that we
+    stop working out items while the transport's buffer is full, and stop
+    altogether if the client goes away.
+
+    Args:
+        request (twisted.web.http.Request)
+        parts (list): The parts of the response, as returned by
+            `_encode_json_parts`.
+        canonical_json (bool): Whether to encode the items as canonical JSON.
+        pretty_print (bool): Whether to pretty print the items.
+    """
+
+    def __init__(self, request, parts, canonical_json, pretty_print):
+        self.request = request
+        self.parts = parts
+        self.canonical_json = canonical_json
+        self.pretty_print = pretty_print
+
+        self.paused = False
+        self.stopped = False
+
+        # Fired when we are resumed while waiting to be.
+        self._resumed = None
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+        if self._resumed is not None:
+            resumed, self._resumed = self._resumed, None
+            resumed.callback(None)
+
+    def stopProducing(self):
+        self.stopped = True
+        self.resumeProducing()
+
+    @defer.inlineCallbacks
+    def start(self):
+        """Writes the response and finishes the request. This never fails,
+        if something goes wrong part way through we log it and drop the
+        connection, as we have already started sending a successful response.
+
+        Returns:
+            Deferred: Completes once the whole response has been written.
+        """
+        self.request.registerProducer(self, True)
+        try:
+            for part in self.parts:
+                if isinstance(part, StreamedJsonList):
+                    yield self._write_list(part)
+                else:
+                    yield self._write(part)
+
+                if self.stopped:
+                    logger.info(
+                        "Stopped streaming response to %s", self.request
+                    )
+                    return
+        except:
+            logger.exception("Failed to stream response to %s", self.request)
+            # The client may already have gone away.
+            if self.request.transport is not None:
+                self.request.transport.loseConnection()
+            return
+        finally:
+            self.request.unregisterProducer()
+
+        self.request.finish()
+
+    @defer.inlineCallbacks
+    def _write_list(self, streamed_list):
+        yield self._write("[")
+
+        separator = ""
+        for item in streamed_list:
+            item = yield item
+            if self.stopped:
+                return
+
+            parts = _encode_json_parts(
+                item,
+                canonical=self.canonical_json,
+                pretty_print=self.pretty_print,
+            )
+            if len(parts) > 1:
+                raise TypeError("Can't stream a StreamedJsonList in an item")
+
+            yield self._write(separator + parts[0])
+            if self.stopped:
+                return
+
+            separator = ","
+
+        yield self._write("]")
+
+    def _write(self, data):
+        """Writes the data to the request, and returns a Deferred that
+        completes once we should carry on producing.
+        """
+        if self.stopped:
+            return defer.succeed(None)
+
+        self.request.write(data)
+
+        if self.paused and not self.stopped:
+            self._resumed = defer.Deferred()
+            return self._resumed
+
+        return defer.succeed(None)
 
 
 def _request_user_agent_is_curl(request):
@@ -16,10 +16,12 @@
 from twisted.internet import defer
 
 from synapse.util.logutils import log_function
-from synapse.util.async import run_on_reactor
+from synapse.util.async import run_on_reactor, ObservableDeferred
 from synapse.types import StreamToken
 import synapse.metrics
 
+from collections import OrderedDict
+
 import logging
 
 
@@ -29,6 +31,20 @@ metrics = synapse.metrics.get_metrics_for(__name__)
 
 notified_events_counter = metrics.register_counter("notified_events")
 
+deduplicated_callbacks_counter = metrics.register_counter(
+    "deduplicated_callbacks"
+)
+
+fanout_latency_timer = metrics.register_distribution("fanout_latency")
+fanout_batch_size_distribution = metrics.register_distribution(
+    "fanout_batch_size"
+)
+
+
+# The maximum number of user streams whose listeners we wake up in one go,
+# before letting the reactor get on with other work.
+FANOUT_BATCH_SIZE = 500
+
 
 # TODO(paul): Should be shared somewhere
 def count(func, l):
@@ -88,9 +104,20 @@ class _NotifierUserStream(object):
             stream_id(str): The new id for the stream the event came from.
             time_now_ms(int): The current time in milliseconds.
         """
+        self.advance(stream_key, stream_id)
+        self.wake_listeners(time_now_ms)
+
+    def advance(self, stream_key, stream_id):
+        """Advance the current token for this user for a new event from an
+        event source, without notifying the listeners.
+        """
         self.current_token = self.current_token.copy_and_advance(
             stream_key, stream_id
         )
+
+    def wake_listeners(self, time_now_ms):
+        """Notify any listeners for this user of the current token.
+        """
         if self.listeners:
             self.last_notified_ms = time_now_ms
             listeners = self.listeners
@@ -135,6 +162,15 @@ class Notifier(object):
         self.store = hs.get_datastore()
         self.pending_new_room_events = []
 
+        # Maps the key of each callback call in progress for wait_for_events
+        # to an ObservableDeferred of its result.
+        self.pending_callbacks = {}
+
+        # User streams whose listeners are waiting to be woken up, mapped to
+        # the time they were first notified, in the order they were notified.
+        self.pending_wake_ups = OrderedDict()
+        self.wake_up_scheduled = False
+
         self.clock = hs.get_clock()
 
         hs.get_distributor().observe(
@@ -245,14 +281,9 @@ class Notifier(object):
 
         logger.debug("on_new_room_event listeners %s", user_streams)
 
-        time_now_ms = self.clock.time_msec()
-        for user_stream in user_streams:
-            try:
-                user_stream.notify(
-                    "room_key", "s%d" % (room_stream_id,), time_now_ms
-                )
-            except:
-                logger.exception("Failed to notify listener")
+        self._notify_user_streams(
+            user_streams, "room_key", "s%d" % (room_stream_id,)
+        )
 
     @defer.inlineCallbacks
     @log_function
@@ -273,18 +304,66 @@ class Notifier(object):
         for room in rooms:
             user_streams |= self.room_to_user_streams.get(room, set())
 
+        self._notify_user_streams(user_streams, stream_key, new_token)
+
+    def _notify_user_streams(self, user_streams, stream_key, stream_id):
+        """Advances the current tokens of the user streams, and schedules
+        their listeners to be woken up.
+
+        Listeners are woken up in batches of FANOUT_BATCH_SIZE streams per
+        reactor tick, so that notifying a large room doesn't block the reactor
+        for long. A stream notified several times before its listeners are
+        woken up only has them woken up once, with its latest token.
+        """
         time_now_ms = self.clock.time_msec()
         for user_stream in user_streams:
             try:
-                user_stream.notify(stream_key, new_token, time_now_ms)
+                user_stream.advance(stream_key, stream_id)
+            except:
+                logger.exception("Failed to notify listener")
+                continue
+
+            if user_stream.listeners:
+                self.pending_wake_ups.setdefault(user_stream, time_now_ms)
+
+        self._schedule_wake_ups()
+
+    def _schedule_wake_ups(self):
+        if self.pending_wake_ups and not self.wake_up_scheduled:
+            self.wake_up_scheduled = True
+            self.clock.call_later(0, self._wake_up_pending_streams)
+
+    def _wake_up_pending_streams(self):
+        self.wake_up_scheduled = False
+
+        time_now_ms = self.clock.time_msec()
+        batch_size = 0
+        while self.pending_wake_ups and batch_size < FANOUT_BATCH_SIZE:
+            user_stream, notified_ms = self.pending_wake_ups.popitem(
+                last=False
+            )
+            batch_size += 1
+
+            fanout_latency_timer.inc_by(time_now_ms - notified_ms)
+            try:
+                user_stream.wake_listeners(time_now_ms)
             except:
                 logger.exception("Failed to notify listener")
 
+        fanout_batch_size_distribution.inc_by(batch_size)
+
+        self._schedule_wake_ups()
+
     @defer.inlineCallbacks
     def wait_for_events(self, user, rooms, timeout, callback,
-                        from_token=StreamToken("s0", "0", "0")):
+                        from_token=StreamToken("s0", "0", "0"),
+                        callback_key=None):
         """Wait until the callback returns a non empty response or the
         timeout fires.
+
+        If `callback_key` is given, concurrent calls to callbacks with the same
+        key and tokens share a single call, so it should identify everything
+        other than the tokens that the callback's result depends on.
         """
 
         deferred = defer.Deferred()
@@ -314,7 +393,9 @@ class Notifier(object):
             user_stream.listeners.add(listener[0])
 
         if current_token.is_after(from_token):
-            result = yield callback(from_token, current_token)
+            result = yield self._run_callback(
+                callback, callback_key, from_token, current_token
+            )
         else:
             result = None
 
@@ -343,7 +424,9 @@ class Notifier(object):
                 deferred = defer.Deferred()
                 listener[0] = _NotificationListener(deferred)
                 user_stream.listeners.add(listener[0])
-                result = yield callback(current_token, new_token)
+                result = yield self._run_callback(
+                    callback, callback_key, current_token, new_token
+                )
                 current_token = new_token
 
         if timer[0] is not None:
@@ -354,6 +437,32 @@ class Notifier(object):
 
         defer.returnValue(result)
 
+    def _run_callback(self, callback, callback_key, before_token, after_token):
+        """Calls the callback for `wait_for_events`, or if an identical call
+        is already in progress waits for that instead.
+        """
+        if callback_key is None:
+            return callback(before_token, after_token)
+
+        key = (callback_key, before_token, after_token)
+
+        pending = self.pending_callbacks.get(key)
+        if pending is None:
+            pending = ObservableDeferred(
+                defer.maybeDeferred(callback, before_token, after_token),
+                consumeErrors=True
+            )
+            self.pending_callbacks[key] = pending
+
+            @pending.addBoth
+            def remove(ret):
+                self.pending_callbacks.pop(key, None)
+                return ret
+        else:
+            deduplicated_callbacks_counter.inc()
+
+        return pending.observe()
+
     @defer.inlineCallbacks
     def get_events_for(self, user, rooms, pagination_config, timeout):
         """ For the given user and rooms, return any new events for them. If
@@ -388,7 +497,8 @@ class Notifier(object):
                 defer.returnValue(None)
 
         result = yield self.wait_for_events(
-            user, rooms, timeout, check_for_updates, from_token=from_token
+            user, rooms, timeout, check_for_updates, from_token=from_token,
+            callback_key=("events", str(user), from_token, limit),
         )
 
         if result is None:
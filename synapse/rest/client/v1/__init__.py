@@ -25,7 +25,9 @@ class ClientV1RestResource(JsonResource):
     """A resource for version 1 of the matrix client API."""
 
     def __init__(self, hs):
-        JsonResource.__init__(self, hs)
+        JsonResource.__init__(
+            self, hs, canonical_json=hs.config.canonical_client_json
+        )
         self.register_servlets(self, hs)
 
     @staticmethod
@@ -45,5 +45,22 @@ class WhoisRestServlet(ClientV1RestServlet):
         defer.returnValue((200, ret))
 
 
+class CacheStatsRestServlet(ClientV1RestServlet):
+    PATTERN = client_path_pattern("/admin/caches$")
+
+    @defer.inlineCallbacks
+    def on_GET(self, request):
+        auth_user, client = yield self.auth.get_user_by_req(request)
+        is_admin = yield self.auth.is_server_admin(auth_user)
+
+        if not is_admin:
+            raise AuthError(403, "You are not a server admin")
+
+        ret = self.handlers.admin_handler.get_cache_stats()
+
+        defer.returnValue((200, ret))
+
+
 def register_servlets(hs, http_server):
     WhoisRestServlet(hs).register(http_server)
+    CacheStatsRestServlet(hs).register(http_server)
@@ -28,7 +28,9 @@ class ClientV2AlphaRestResource(JsonResource):
     """A resource for version 2 alpha of the matrix client API."""
 
     def __init__(self, hs):
-        JsonResource.__init__(self, hs)
+        JsonResource.__init__(
+            self, hs, canonical_json=hs.config.canonical_client_json
+        )
         self.register_servlets(self, hs)
 
     @staticmethod
@@ -20,6 +20,7 @@ from synapse.http.servlet import (
 )
 from synapse.handlers.sync import SyncConfig
 from synapse.types import StreamToken
+from synapse.util.streamedjson import StreamedJsonList
 from synapse.events.utils import (
     serialize_event, format_event_for_client_v2_without_event_id,
 )
@@ -163,10 +164,11 @@ class SyncRestServlet(RestServlet):
         return events
 
     def encode_rooms(self, rooms, filter, time_now, token_id):
-        return [
+        # Each room is only serialized as it is written to the client.
+        return StreamedJsonList(
             self.encode_room(room, filter, time_now, token_id)
             for room in rooms
-        ]
+        )
 
     @staticmethod
     def encode_room(room, filter, time_now, token_id):
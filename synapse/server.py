@@ -35,6 +35,8 @@ from synapse.push.pusherpool import PusherPool
 from synapse.events.builder import EventBuilderFactory
 from synapse.api.filtering import Filtering
 
+from twisted.internet import defer
+
 
 class BaseHomeServer(object):
     """A basic homeserver object without lazy component builders.
@@ -69,6 +71,7 @@ class BaseHomeServer(object):
         'rest_servlet_factory',
         'state_handler',
         'room_lock_manager',
+        'sync_room_semaphore',
         'notifier',
         'distributor',
         'resource_for_client',
@@ -197,6 +200,9 @@ class HomeServer(BaseHomeServer):
     def build_room_lock_manager(self):
         return LockManager()
 
+    def build_sync_room_semaphore(self):
+        return defer.DeferredSemaphore(self.config.sync_total_room_concurrency)
+
     def build_distributor(self):
         return Distributor()
 
@@ -154,6 +154,7 @@ class StateHandler(object):
 
         context.current_state = curr_state
         context.state_group = group if not event.is_state() else None
+        context.prev_group = group
 
         prev_state = yield self.store.add_event_hashes(
             prev_state
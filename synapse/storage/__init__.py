@@ -13,11 +13,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from twisted.internet import defer
+from twisted.internet import defer, reactor
 from .appservice import (
     ApplicationServiceStore, ApplicationServiceTransactionStore
 )
-from ._base import Cache
+from ._base import Cache, resize_caches
 from .directory import DirectoryStore
 from .events import EventsStore
 from .presence import PresenceStore
@@ -39,19 +39,26 @@ from .signatures import SignatureStore
 from .filtering import FilteringStore
 
 
+import synapse.metrics
+
 import fnmatch
 import imp
 import logging
 import os
 import re
+import time
 
 
 logger = logging.getLogger(__name__)
 
+metrics = synapse.metrics.get_metrics_for("synapse.storage")
+
+client_ip_flush_timer = metrics.register_distribution("client_ip_flush_time")
+
 
 # Remember to update this number every time a change is made to database
 # schema files, so the users will be informed on server restarts.
-SCHEMA_VERSION = 19
+SCHEMA_VERSION = 20
 
 dir_path = os.path.abspath(os.path.dirname(__file__))
 
@@ -88,8 +95,67 @@ class DataStore(RoomMemberStore, RoomStore,
             keylen=4,
         )
 
+        # (user_id, access_token, ip, user_agent) -> (device_id, last_seen)
+        # for client IPs that we haven't written to the database yet.
+        self._pending_client_ips = {}
+
+        metrics.register_callback(
+            "pending_client_ips",
+            lambda: len(self._pending_client_ips),
+        )
+
+        resize_caches(hs.config.cache_factor, hs.config.cache_sizes)
+
+    def start_client_ip_flushing(self):
+        """Starts periodically writing the client IPs recorded by
+        `insert_client_ip` to the database, and writes any that are left when
+        the reactor shuts down.
+        """
+        self._clock.looping_call(
+            self._flush_client_ips, self.hs.config.client_ip_flush_interval
+        )
+        reactor.addSystemEventTrigger(
+            "before", "shutdown", self._flush_client_ips
+        )
+
     @defer.inlineCallbacks
+    def _flush_client_ips(self):
+        if not self._pending_client_ips:
+            return
+
+        pending = self._pending_client_ips
+        self._pending_client_ips = {}
+
+        start = time.time() * 1000
+
+        try:
+            # It's safe not to lock here: a) no unique constraint,
+            # b) LAST_SEEN_GRANULARITY makes concurrent updates incredibly
+            # unlikely
+            yield self.runInteraction(
+                "flush_client_ips",
+                self._simple_upsert_many_txn,
+                "user_ips",
+                ["user_id", "access_token", "ip", "user_agent"],
+                pending.keys(),
+                ["device_id", "last_seen"],
+                pending.values(),
+                lock=False,
+            )
+        except:
+            logger.exception("Failed to flush %d client IPs", len(pending))
+
+            # Keep them for the next flush, unless the same client has been
+            # seen again since.
+            for key, value in pending.items():
+                self._pending_client_ips.setdefault(key, value)
+        finally:
+            client_ip_flush_timer.inc_by(time.time() * 1000 - start)
+
     def insert_client_ip(self, user, access_token, device_id, ip, user_agent):
+        """Records that the user made a request from the given IP. These are
+        buffered in memory and written to the database periodically.
+        """
         now = int(self._clock.time_msec())
         key = (user.to_string(), access_token, device_id, ip)
 
@@ -100,30 +166,17 @@ class DataStore(RoomMemberStore, RoomStore,
 
         # Rate-limited inserts
         if last_seen is not None and (now - last_seen) < LAST_SEEN_GRANULARITY:
-            defer.returnValue(None)
+            return
 
         self.client_ip_last_seen.prefill(*key + (now,))
 
-        # It's safe not to lock here: a) no unique constraint,
-        # b) LAST_SEEN_GRANULARITY makes concurrent updates incredibly unlikely
-        yield self._simple_upsert(
-            "user_ips",
-            keyvalues={
-                "user_id": user.to_string(),
-                "access_token": access_token,
-                "ip": ip,
-                "user_agent": user_agent,
-            },
-            values={
-                "device_id": device_id,
-                "last_seen": now,
-            },
-            desc="insert_client_ip",
-            lock=False,
-        )
+        self._pending_client_ips[
+            (user.to_string(), access_token, ip, user_agent)
+        ] = (device_id, now)
 
+    @defer.inlineCallbacks
     def get_user_ip_and_agents(self, user):
-        return self._simple_select_list(
+        rows = yield self._simple_select_list(
             table="user_ips",
             keyvalues={"user_id": user.to_string()},
             retcols=[
@@ -132,6 +185,24 @@ class DataStore(RoomMemberStore, RoomStore,
             desc="get_user_ip_and_agents",
         )
 
+        # Include the client IPs we haven't written to the database yet.
+        results = {
+            (row["access_token"], row["ip"], row["user_agent"]): row
+            for row in rows
+        }
+        for key, (device_id, last_seen) in self._pending_client_ips.items():
+            user_id, access_token, ip, user_agent = key
+            if user_id == user.to_string():
+                results[(access_token, ip, user_agent)] = {
+                    "device_id": device_id,
+                    "access_token": access_token,
+                    "ip": ip,
+                    "user_agent": user_agent,
+                    "last_seen": last_seen,
+                }
+
+        defer.returnValue(results.values())
+
 
 def read_schema(path):
     """ Read the named database schema.
@@ -18,6 +18,8 @@ from synapse.api.errors import StoreError
 from synapse.util.logutils import log_function
 from synapse.util.logcontext import preserve_context_over_fn, LoggingContext
 from synapse.util.lrucache import LruCache
+from synapse.util.roomstreambuffer import RoomStreamBuffer
+from synapse.util.streamchangecache import StreamChangeCache
 import synapse.metrics
 
 from util.id_generators import IdGenerator, StreamIdGenerator
@@ -27,12 +29,44 @@ from twisted.internet import defer
 from collections import namedtuple, OrderedDict
 
 import functools
+import itertools
 import sys
 import time
 import threading
 
 DEBUG_CACHES = False
 
+# The maximum number of values we put in a single `IN (...)` clause. SQLite
+# limits the number of bound parameters per statement to 999.
+SELECT_MANY_BATCH_SIZE = 200
+
+# The number of event_ids, summed across all cached auth chains, to cache.
+AUTH_CHAIN_CACHE_SIZE = 100000
+
+# The number of rooms to track the latest stream ordering of.
+ROOM_STREAM_CHANGE_CACHE_SIZE = 100000
+
+# The number of invalidated keys a cache with keyed invalidation remembers,
+# so that in flight reads of other keys can still update it.
+KEYED_INVALIDATION_HISTORY = 10000
+
+# How many entries of a cache, and items of a container within an entry, we
+# look at when estimating how much memory the cache uses.
+MEMORY_SAMPLE_SIZE = 20
+
+# The tables which have a unique constraint on exactly the columns we upsert
+# on, and so can use the database's native upsert where it has one.
+NATIVE_UPSERT_TABLES = {
+    "application_services_state": ("as_id",),
+    "current_state_events": ("room_id", "type", "state_key"),
+    "push_rules_enable": ("user_name", "rule_id"),
+    "room_depth": ("room_id",),
+    "server_keys_json": ("server_name", "key_id", "from_server"),
+    "server_signature_keys": ("server_name", "key_id"),
+    "server_tls_certificates": ("server_name", "fingerprint"),
+    "user_threepids": ("user_id", "medium", "address"),
+}
+
 logger = logging.getLogger(__name__)
 
 sql_logger = logging.getLogger("synapse.storage.SQL")
@@ -53,23 +87,132 @@ cache_counter = metrics.register_cache(
     lambda: {(name,): len(caches_by_name[name]) for name in caches_by_name.keys()},
     labels=["name"],
 )
+cache_eviction_counter = metrics.register_counter(
+    "cache:evictions", labels=["name"],
+)
+metrics.register_callback(
+    "cache:max_size",
+    lambda: {(name,): c.max_entries for name, c in caches_by_name.items()},
+    labels=["name"],
+)
+metrics.register_callback(
+    "cache:memory",
+    lambda: {
+        (name,): c.estimate_memory() for name, c in caches_by_name.items()
+    },
+    labels=["name"],
+)
+
+
+def _estimate_size(obj, depth=3):
+    """ Approximates the number of bytes used by `obj`, including the objects
+    it contains up to `depth` levels deep. Large containers are estimated from
+    a sample of their items.
+    """
+    size = sys.getsizeof(obj)
+    if depth <= 0:
+        return size
+
+    if isinstance(obj, dict):
+        items = itertools.chain.from_iterable(obj.iteritems())
+        length = 2 * len(obj)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        items = obj
+        length = len(obj)
+    elif hasattr(obj, "__dict__"):
+        return size + _estimate_size(obj.__dict__, depth - 1)
+    else:
+        return size
+
+    sample = list(itertools.islice(items, 2 * MEMORY_SAMPLE_SIZE))
+    if sample:
+        sample_size = sum(_estimate_size(item, depth - 1) for item in sample)
+        size += sample_size * length / len(sample)
+
+    return size
+
+
+def resize_caches(cache_factor, cache_sizes):
+    """ Sets the maximum size of each cache to its default size multiplied by
+    `cache_factor`, or to the size given for it in `cache_sizes`.
+
+    Args:
+        cache_factor (float)
+        cache_sizes (dict): cache name -> maximum size
+    """
+    for cache in caches_by_name.values():
+        resize_cache(cache, cache_factor, cache_sizes)
+
+
+def resize_cache(cache, cache_factor, cache_sizes):
+    """ Sets the maximum size of the cache as `resize_caches` does, for caches
+    that are created after the datastore.
+    """
+    if cache.name in cache_sizes:
+        cache.resize(cache_sizes[cache.name])
+    else:
+        cache.resize(int(cache.default_max_entries * cache_factor))
+
+
+def get_cache_stats():
+    """ Returns a dict of cache name -> dict of the cache's size, maximum size,
+    approximate memory usage in bytes, and hit, miss and eviction counts.
+    """
+    stats = {}
+    for name, cache in caches_by_name.items():
+        hits = cache_counter.hits.counts.get((name,), 0)
+        total = cache_counter.total.counts.get((name,), 0)
+        stats[name] = {
+            "size": len(cache),
+            "max_size": cache.max_entries,
+            "memory": cache.estimate_memory(),
+            "hits": hits,
+            "misses": total - hits,
+            "hit_rate": float(hits) / total if total else None,
+            "evictions": cache_eviction_counter.counts.get((name,), 0),
+        }
+    return stats
 
 
 class Cache(object):
 
-    def __init__(self, name, max_entries=1000, keylen=1, lru=False):
+    def __init__(self, name, max_entries=1000, keylen=1, lru=False,
+                 size_callback=None, keyed_invalidation=False):
         if lru:
-            self.cache = LruCache(max_size=max_entries)
-            self.max_entries = None
+            self.cache = LruCache(
+                max_size=max_entries, size_callback=size_callback,
+                evicted_callback=self._on_evicted,
+            )
         else:
             self.cache = OrderedDict()
-            self.max_entries = max_entries
+
+        self.max_entries = max_entries
+        self.default_max_entries = max_entries
+        self.lru = lru
+        self.size_callback = size_callback
 
         self.name = name
         self.keylen = keylen
         self.sequence = 0
         self.thread = None
-        caches_by_name[name] = self.cache
+
+        # If set, invalidating a key only stops reads of that key which raced
+        # with the invalidation from updating the cache, rather than reads of
+        # every key. Maps key to the sequence number it was last invalidated
+        # at, for the most recently invalidated keys.
+        self.keyed_invalidation = keyed_invalidation
+        self._invalidations = OrderedDict()
+        # The sequence number before which we have forgotten which keys were
+        # invalidated.
+        self._invalidations_start = 0
+
+        caches_by_name[name] = self
+
+    def __len__(self):
+        return len(self.cache)
+
+    def _on_evicted(self, evicted):
+        cache_eviction_counter.inc_by(evicted, self.name)
 
     def check_thread(self):
         expected_thread = self.thread
@@ -98,6 +241,14 @@ class Cache(object):
             # Only update the cache if the caches sequence number matches the
             # number that the cache had before the SELECT was started (SYN-369)
             self.prefill(*args)
+        elif self.keyed_invalidation:
+            # Otherwise only update it if this key wasn't invalidated since
+            # the SELECT was started.
+            if sequence < self._invalidations_start:
+                return
+            if self._invalidations.get(args[:-1], 0) > sequence:
+                return
+            self.prefill(*args)
 
     def prefill(self, *args):  # because I can't  *keyargs, value
         keyargs = args[:-1]
@@ -106,9 +257,13 @@ class Cache(object):
         if len(keyargs) != self.keylen:
             raise ValueError("Expected a key to have %d items", self.keylen)
 
-        if self.max_entries is not None:
-            while len(self.cache) >= self.max_entries:
+        if not self.lru:
+            evicted = 0
+            while self.cache and len(self.cache) >= self.max_entries:
                 self.cache.popitem(last=False)
+                evicted += 1
+            if evicted:
+                self._on_evicted(evicted)
 
         self.cache[keyargs] = value
 
@@ -121,11 +276,57 @@ class Cache(object):
         self.sequence += 1
         self.cache.pop(keyargs, None)
 
+        if self.keyed_invalidation:
+            self._invalidations.pop(keyargs, None)
+            self._invalidations[keyargs] = self.sequence
+            while len(self._invalidations) > KEYED_INVALIDATION_HISTORY:
+                _, forgotten = self._invalidations.popitem(last=False)
+                self._invalidations_start = forgotten
+
     def invalidate_all(self):
         self.check_thread()
         self.sequence += 1
         self.cache.clear()
 
+        self._invalidations.clear()
+        self._invalidations_start = self.sequence
+
+    def resize(self, max_entries):
+        self.max_entries = max_entries
+        if self.lru:
+            self.cache.set_max_size(max_entries)
+        else:
+            evicted = 0
+            while len(self.cache) > max_entries:
+                self.cache.popitem(last=False)
+                evicted += 1
+            if evicted:
+                self._on_evicted(evicted)
+
+    def estimate_memory(self):
+        """ Returns the approximate number of bytes used by the entries in the
+        cache, extrapolated from a sample of them.
+        """
+        if self.lru:
+            sample = self.cache.sample(MEMORY_SAMPLE_SIZE)
+        else:
+            sample = list(
+                itertools.islice(self.cache.iteritems(), MEMORY_SAMPLE_SIZE)
+            )
+
+        if self.size_callback:
+            sampled = sum(self.size_callback(v) for _, v in sample)
+        else:
+            sampled = len(sample)
+
+        if not sampled:
+            return 0
+
+        sample_size = sum(
+            _estimate_size(k) + _estimate_size(v) for k, v in sample
+        )
+        return sample_size * len(self.cache) / sampled
+
 
 def cached(max_entries=1000, num_args=1, lru=False):
     """ A method decorator that applies a memoizing cache around the function.
@@ -304,6 +505,48 @@ class SQLBaseStore(object):
         self._get_event_cache = Cache("*getEvent*", keylen=3, lru=True,
                                       max_entries=hs.config.event_cache_size)
 
+        # Maps event_id to the raw row used to build the event, as returned by
+        # _fetch_event_rows. This is much more compact than the parsed events
+        # in _get_event_cache, so can hold many more events, and saves a trip
+        # to the database on a miss in _get_event_cache.
+        # Persisting an event only invalidates that event's row, so that
+        # fetches of other events racing with it can still fill the cache.
+        self._event_row_cache = Cache(
+            "*getEventRow*", lru=True,
+            max_entries=hs.config.event_row_cache_size,
+            keyed_invalidation=True,
+        )
+
+        # Maps state group to a dict of (type, state_key) -> event_id. State
+        # groups are immutable, so entries never need to be invalidated. The
+        # size is the total number of state entries across all groups.
+        self._state_group_cache = Cache(
+            "*stateGroupCache*", lru=True,
+            max_entries=hs.config.state_group_cache_size,
+            size_callback=len,
+        )
+
+        # Maps event_id to a frozenset of the event_ids in its auth chain. Only
+        # complete auth chains are cached, and they never change once complete.
+        self._auth_chain_cache = Cache(
+            "*authChainCache*", lru=True,
+            max_entries=AUTH_CHAIN_CACHE_SIZE,
+            size_callback=len,
+        )
+
+        self._auth_chain_index_enabled = hs.config.auth_chain_index
+        self._auth_chain_index_backfill_loop = None
+
+        # The most recent events in each room, used to answer event stream
+        # requests without going to the database.
+        self._room_stream_buffer = RoomStreamBuffer()
+
+        # The stream ordering of the latest event in each room, used to skip
+        # rooms without new events when getting event streams.
+        self._room_stream_change_cache = StreamChangeCache(
+            "RoomStreamChangeCache", max_size=ROOM_STREAM_CHANGE_CACHE_SIZE,
+        )
+
         self._event_fetch_lock = threading.Condition()
         self._event_fetch_list = []
         self._event_fetch_ongoing = 0
@@ -599,6 +842,14 @@ class SQLBaseStore(object):
 
     def _simple_upsert_txn(self, txn, table, keyvalues, values, insertion_values={},
                            lock=True):
+        if self._can_native_upsert(table, keyvalues):
+            return self._simple_upsert_many_txn(
+                txn, table,
+                keyvalues.keys(), [keyvalues.values()],
+                values.keys(), [values.values()],
+                insertion_values,
+            )
+
         # We need to lock the table :(, unless we're *really* careful
         if lock:
             self.database_engine.lock_table(txn, table)
@@ -634,6 +885,80 @@ class SQLBaseStore(object):
             )
             txn.execute(sql, allvalues.values())
 
+    def _simple_upsert_many_txn(self, txn, table, key_names, key_values,
+                                value_names, value_values,
+                                insertion_values={}, lock=True):
+        """Upserts many rows at once. Where the table and database allow it
+        this is a single native upsert statement run with `executemany`,
+        otherwise each row is upserted in turn.
+
+        Args:
+            table (str): The table to upsert into
+            key_names (list): The names of the unique key columns
+            key_values (list): For each row, a list of the key column values
+            value_names (list): The names of the nonunique columns
+            value_values (list): For each row, a list of the nonunique column
+                values
+            insertion_values (dict): key/values to use when inserting
+        """
+        if not key_values:
+            return
+
+        if not self._can_native_upsert(table, key_names):
+            if lock:
+                self.database_engine.lock_table(txn, table)
+
+            for keyv, valv in zip(key_values, value_values):
+                self._simple_upsert_txn(
+                    txn, table,
+                    dict(zip(key_names, keyv)),
+                    dict(zip(value_names, valv)),
+                    insertion_values,
+                    lock=False,
+                )
+            return
+
+        all_names = (
+            list(key_names) + list(value_names) + insertion_values.keys()
+        )
+
+        if value_names:
+            on_conflict = "DO UPDATE SET %s" % (
+                ", ".join("%s = EXCLUDED.%s" % (k, k) for k in value_names),
+            )
+        else:
+            on_conflict = "DO NOTHING"
+
+        sql = "INSERT INTO %s (%s) VALUES (%s) ON CONFLICT (%s) %s" % (
+            table,
+            ", ".join(all_names),
+            ", ".join("?" for _ in all_names),
+            ", ".join(key_names),
+            on_conflict,
+        )
+
+        args = [
+            list(keyv) + list(valv) + insertion_values.values()
+            for keyv, valv in zip(key_values, value_values)
+        ]
+        logger.debug(
+            "[SQL] %s Args=%s",
+            sql, args,
+        )
+
+        txn.executemany(sql, args)
+
+    def _can_native_upsert(self, table, key_names):
+        """Returns whether we can upsert into the table on the given key
+        columns with the database's native upsert.
+        """
+        unique_names = NATIVE_UPSERT_TABLES.get(table)
+        return (
+            self.database_engine.can_native_upsert
+            and unique_names is not None
+            and set(unique_names) == set(key_names)
+        )
+
     def _simple_select_one(self, table, keyvalues, retcols,
                            allow_none=False, desc="_simple_select_one"):
         """Executes a SELECT query on the named table, which is expected to
@@ -762,6 +1087,49 @@ class SQLBaseStore(object):
 
         return self.cursor_to_dict(txn)
 
+    def _simple_select_many_txn(self, txn, table, column, iterable, retcols,
+                                keyvalues={}, batch_size=SELECT_MANY_BATCH_SIZE):
+        """Executes a SELECT query on the named table, returning the rows
+        whose `column` matches any of the values in `iterable`. The values are
+        sent to the database in chunks of `batch_size` using `IN (...)`
+        clauses, so this costs one round-trip per chunk rather than per value.
+
+        Args:
+            txn : Transaction object
+            table (str): table name
+            column (str): column to match against the values in `iterable`
+            iterable (iterable): values to match `column` against
+            retcols (list): the names of the columns to return
+            keyvalues (dict): additional column names and values to select the
+                rows with
+            batch_size (int): maximum number of values per query
+
+        Returns:
+            list: a list of dicts where the key is the column header.
+        """
+        results = []
+
+        values = list(iterable)
+        if not values:
+            return results
+
+        for i in xrange(0, len(values), batch_size):
+            chunk = values[i:i + batch_size]
+
+            clauses = ["%s IN (%s)" % (column, ",".join("?" for _ in chunk))]
+            clauses.extend("%s = ?" % (k,) for k in keyvalues)
+
+            sql = "SELECT %s FROM %s WHERE %s" % (
+                ", ".join(retcols),
+                table,
+                " AND ".join(clauses),
+            )
+
+            txn.execute(sql, chunk + keyvalues.values())
+            results.extend(self.cursor_to_dict(txn))
+
+        return results
+
     def _simple_update_one(self, table, keyvalues, updatevalues,
                            desc="_simple_update_one"):
         """Executes an UPDATE query on the named table, setting new values for
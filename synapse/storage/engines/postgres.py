@@ -25,6 +25,10 @@ class PostgresEngine(object):
         self.module = database_module
         self.module.extensions.register_type(self.module.extensions.UNICODE)
 
+        # `INSERT ... ON CONFLICT ... DO UPDATE` was added in PostgreSQL 9.5,
+        # so we don't know if we can use it until we've connected.
+        self.can_native_upsert = False
+
     def check_database(self, txn):
         txn.execute("SHOW SERVER_ENCODING")
         rows = txn.fetchall()
@@ -42,6 +46,7 @@ class PostgresEngine(object):
         db_conn.set_isolation_level(
             self.module.extensions.ISOLATION_LEVEL_REPEATABLE_READ
         )
+        self.can_native_upsert = db_conn.server_version >= 90500
 
     def prepare_database(self, db_conn):
         prepare_database(db_conn, self)
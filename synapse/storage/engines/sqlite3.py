@@ -22,6 +22,9 @@ class Sqlite3Engine(object):
     def __init__(self, database_module):
         self.module = database_module
 
+        # `INSERT ... ON CONFLICT ... DO UPDATE` was added in SQLite 3.24
+        self.can_native_upsert = database_module.sqlite_version_info >= (3, 24)
+
     def check_database(self, txn):
         pass
 
@@ -25,6 +25,12 @@ from Queue import PriorityQueue, Empty
 logger = logging.getLogger(__name__)
 
 
+# How many events the auth chain index backfill looks at in each transaction,
+# and how often it runs.
+AUTH_CHAIN_INDEX_BACKFILL_BATCH_SIZE = 100
+AUTH_CHAIN_INDEX_BACKFILL_INTERVAL_MS = 1000
+
+
 class EventFederationStore(SQLBaseStore):
     """ Responsible for storing and serving up the various graphs associated
     with an event. Including the main event graph and the auth chains for an
@@ -46,26 +52,363 @@ class EventFederationStore(SQLBaseStore):
         )
 
     def _get_auth_chain_ids_txn(self, txn, event_ids):
-        results = set()
-
-        base_sql = (
-            "SELECT auth_id FROM event_auth WHERE event_id = ?"
-        )
+        """ Get the event_ids of every event in the auth chains of the given
+        events.
+
+        The auth graph is walked a level at a time, fetching the auth events
+        of the whole frontier with one query per level (rather than one per
+        event). Events whose auth chain we have already computed are taken
+        from the auth chain cache, or from the auth chain index if it is
+        enabled, and not walked at all.
+        """
+        # The cached auth chains of the events we've come across
+        chains = {}
+        # Maps each event we've looked up in the database to its auth events
+        auth_ids = {}
 
+        seen = set()
         front = set(event_ids)
         while front:
-            new_front = set()
-            for f in front:
-                txn.execute(base_sql, (f,))
-                new_front.update([r[0] for r in txn.fetchall()])
+            seen |= front
 
-            new_front -= results
+            lookup = []
+            for event_id in front:
+                try:
+                    chains[event_id] = self._auth_chain_cache.get(event_id)
+                except KeyError:
+                    lookup.append(event_id)
 
-            front = new_front
-            results.update(front)
+            if self._auth_chain_index_enabled:
+                indexed = self._get_indexed_auth_chains_txn(txn, lookup)
+                chains.update(indexed)
+                lookup = [e_id for e_id in lookup if e_id not in indexed]
+
+            for event_id in lookup:
+                auth_ids[event_id] = []
+
+            rows = self._simple_select_many_txn(
+                txn,
+                table="event_auth",
+                column="event_id",
+                iterable=lookup,
+                retcols=["event_id", "auth_id"],
+            )
+
+            front = set()
+            for row in rows:
+                auth_ids[row["event_id"]].append(row["auth_id"])
+                if row["auth_id"] not in seen:
+                    front.add(row["auth_id"])
+
+        results = set()
+        for ids in auth_ids.values():
+            results.update(ids)
+        for chain in chains.values():
+            results.update(chain)
+
+        self._cache_auth_chains_txn(txn, event_ids, chains, auth_ids)
 
         return list(results)
 
+    def _cache_auth_chains_txn(self, txn, event_ids, chains, auth_ids):
+        """ Adds the auth chains of the given events to the auth chain cache,
+        given the auth graph computed by `_get_auth_chain_ids_txn`.
+
+        Events without any auth events are either create events or events we
+        don't have yet. We don't cache chains that include the latter, since
+        they will be incomplete until we get the missing events.
+        """
+        no_auth = [e_id for e_id, ids in auth_ids.items() if not ids]
+        rows = self._simple_select_many_txn(
+            txn,
+            table="events",
+            column="event_id",
+            iterable=no_auth,
+            retcols=["event_id"],
+        )
+        missing = set(no_auth) - set(row["event_id"] for row in rows)
+
+        for event_id in event_ids:
+            if event_id in chains or event_id in missing:
+                continue
+
+            chain = set()
+            stack = [event_id]
+            while stack:
+                e_id = stack.pop()
+                if e_id in chains:
+                    chain.update(chains[e_id])
+                    continue
+
+                for auth_id in auth_ids.get(e_id, []):
+                    if auth_id not in chain:
+                        chain.add(auth_id)
+                        stack.append(auth_id)
+
+            if not chain & missing:
+                txn.call_after(
+                    self._auth_chain_cache.prefill, event_id, frozenset(chain)
+                )
+
+    def _get_indexed_auth_chains_txn(self, txn, event_ids):
+        """ Get the auth chains of the given events from the auth chain index.
+
+        Returns:
+            dict: event_id -> set of auth chain event_ids, for each of the
+            given events that have been indexed.
+        """
+        rows = self._simple_select_many_txn(
+            txn,
+            table="event_auth_closure_indexed",
+            column="event_id",
+            iterable=event_ids,
+            retcols=["event_id"],
+        )
+
+        chains = {row["event_id"]: set() for row in rows}
+
+        rows = self._simple_select_many_txn(
+            txn,
+            table="event_auth_closure",
+            column="event_id",
+            iterable=chains.keys(),
+            retcols=["event_id", "auth_id"],
+        )
+
+        for row in rows:
+            chains[row["event_id"]].add(row["auth_id"])
+
+        return chains
+
+    def _index_auth_chain_txn(self, txn, event_id, auth_ids):
+        """ Adds the auth chain of the given event to the auth chain index.
+
+        This can only be done once all of its auth events have been indexed,
+        since its auth chain is built from theirs.
+
+        Args:
+            event_id (str): The event to index.
+            auth_ids (list): The event_ids of the event's auth events.
+
+        Returns:
+            bool: True if the event was indexed.
+        """
+        auth_ids = set(auth_ids)
+
+        chains = self._get_indexed_auth_chains_txn(txn, auth_ids)
+        if len(chains) != len(auth_ids):
+            return False
+
+        chain = set(auth_ids)
+        for auth_chain in chains.values():
+            chain.update(auth_chain)
+
+        txn.executemany(
+            "INSERT INTO event_auth_closure (event_id, auth_id) VALUES (?,?)",
+            [(event_id, auth_id) for auth_id in chain]
+        )
+
+        self._simple_insert_txn(
+            txn,
+            table="event_auth_closure_indexed",
+            values={"event_id": event_id},
+        )
+
+        return True
+
+    def _index_new_auth_chains_txn(self, txn, events):
+        """ Adds the auth chains of newly persisted events to the auth chain
+        index. Events that can't be indexed yet are queued for the backfill,
+        which is woken if any of the queued events may now be indexable.
+        """
+        # An event can only be indexed once its auth events have been, so
+        # index them in order of depth.
+        indexed = []
+        failed = []
+        for event in sorted(events, key=lambda e: e.depth):
+            auth_ids = [auth_id for auth_id, _ in event.auth_events]
+            if self._index_auth_chain_txn(txn, event.event_id, auth_ids):
+                indexed.append(event.event_id)
+            else:
+                failed.append(event.event_id)
+
+        self._simple_insert_many_txn(
+            txn,
+            table="event_auth_closure_pending",
+            values=[{"event_id": event_id} for event_id in failed],
+        )
+
+        if not indexed:
+            return
+
+        sql = (
+            "SELECT p.event_id FROM event_auth_closure_pending AS p"
+            " INNER JOIN event_auth AS a ON a.event_id = p.event_id"
+            " WHERE a.auth_id IN (%s) LIMIT 1"
+        ) % (",".join("?" for _ in indexed),)
+
+        txn.execute(sql, indexed)
+        if txn.fetchall():
+            txn.call_after(self._wake_auth_chain_index_backfill)
+
+    def start_auth_chain_index_backfill(self):
+        """ Starts a background job that adds the events we persisted before
+        the auth chain index was enabled, and the events we couldn't index
+        when they were persisted, to the index.
+
+        The job carries on from where it got to before the last restart, and
+        stops once there is nothing left that it can index. Any events that
+        still can't be indexed fall back to walking the auth graph.
+        """
+        if not self._auth_chain_index_enabled:
+            return
+
+        self._wake_auth_chain_index_backfill()
+
+    def _wake_auth_chain_index_backfill(self):
+        if self._auth_chain_index_backfill_loop:
+            return
+
+        @defer.inlineCallbacks
+        def backfill():
+            try:
+                finished = yield self.runInteraction(
+                    "backfill_auth_chain_index",
+                    self._backfill_auth_chain_index_txn,
+                    AUTH_CHAIN_INDEX_BACKFILL_BATCH_SIZE,
+                )
+            except Exception:
+                logger.exception("Failed to backfill auth chain index")
+                return
+
+            if finished:
+                logger.info("Finished backfilling auth chain index")
+                self._clock.stop_looping_call(loop)
+                self._auth_chain_index_backfill_loop = None
+
+        loop = self._clock.looping_call(
+            backfill, AUTH_CHAIN_INDEX_BACKFILL_INTERVAL_MS
+        )
+        self._auth_chain_index_backfill_loop = loop
+
+    def _backfill_auth_chain_index_txn(self, txn, batch_size):
+        """ Indexes the auth chains of the next `batch_size` events, in order
+        of stream ordering, after the last event the backfill looked at, and
+        retries up to `batch_size` of the events queued in
+        event_auth_closure_pending.
+
+        Returns:
+            bool: True if there were no events left to look at, and none of
+            the queued events could be indexed.
+        """
+        txn.execute(
+            "SELECT last_stream_ordering FROM event_auth_closure_backfill"
+        )
+        last, = txn.fetchone()
+
+        if last is None:
+            txn.execute(
+                "SELECT event_id, stream_ordering FROM events"
+                " ORDER BY stream_ordering ASC LIMIT ?",
+                (batch_size,)
+            )
+        else:
+            txn.execute(
+                "SELECT event_id, stream_ordering FROM events"
+                " WHERE stream_ordering > ?"
+                " ORDER BY stream_ordering ASC LIMIT ?",
+                (last, batch_size)
+            )
+        rows = txn.fetchall()
+
+        if rows:
+            _, failed = self._index_auth_chains_txn(
+                txn, [event_id for event_id, _ in rows]
+            )
+
+            already_queued = self._simple_select_many_txn(
+                txn,
+                table="event_auth_closure_pending",
+                column="event_id",
+                iterable=failed,
+                retcols=["event_id"],
+            )
+            already_queued = set(row["event_id"] for row in already_queued)
+
+            self._simple_insert_many_txn(
+                txn,
+                table="event_auth_closure_pending",
+                values=[
+                    {"event_id": event_id}
+                    for event_id in failed if event_id not in already_queued
+                ],
+            )
+
+            txn.execute(
+                "UPDATE event_auth_closure_backfill"
+                " SET last_stream_ordering = ?",
+                (rows[-1][1],)
+            )
+
+        txn.execute(
+            "SELECT p.event_id FROM event_auth_closure_pending AS p"
+            " INNER JOIN events AS e ON e.event_id = p.event_id"
+            " ORDER BY e.depth ASC LIMIT ?",
+            (batch_size,)
+        )
+        pending = [event_id for event_id, in txn.fetchall()]
+
+        indexed, _ = self._index_auth_chains_txn(txn, pending)
+
+        for event_id in indexed:
+            txn.execute(
+                "DELETE FROM event_auth_closure_pending WHERE event_id = ?",
+                (event_id,)
+            )
+
+        return len(rows) < batch_size and not indexed
+
+    def _index_auth_chains_txn(self, txn, event_ids):
+        """ Adds the auth chains of the given events to the auth chain index,
+        in the order given, if they haven't been indexed already.
+
+        Returns:
+            tuple: the list of events we indexed, and the list of events we
+            couldn't index because some of their auth events haven't been.
+        """
+        rows = self._simple_select_many_txn(
+            txn,
+            table="event_auth_closure_indexed",
+            column="event_id",
+            iterable=event_ids,
+            retcols=["event_id"],
+        )
+        already_indexed = set(row["event_id"] for row in rows)
+
+        rows = self._simple_select_many_txn(
+            txn,
+            table="event_auth",
+            column="event_id",
+            iterable=event_ids,
+            retcols=["event_id", "auth_id"],
+        )
+        auth_ids = {event_id: [] for event_id in event_ids}
+        for row in rows:
+            auth_ids[row["event_id"]].append(row["auth_id"])
+
+        indexed = []
+        failed = []
+        for event_id in event_ids:
+            if event_id in already_indexed:
+                continue
+
+            if self._index_auth_chain_txn(txn, event_id, auth_ids[event_id]):
+                indexed.append(event_id)
+            else:
+                failed.append(event_id)
+
+        return indexed, failed
+
     def get_oldest_events_in_room(self, room_id):
         return self.runInteraction(
             "get_oldest_events_in_room",
@@ -123,6 +466,28 @@ class EventFederationStore(SQLBaseStore):
             desc="get_latest_event_ids_in_room",
         )
 
+    def get_latest_event_ids_in_rooms(self, room_ids):
+        """Gets the forward extremities of each of the given rooms.
+
+        Returns:
+            Deferred: A dict mapping room_id to a list of event_ids.
+        """
+        def f(txn):
+            rows = self._simple_select_many_txn(
+                txn,
+                table="event_forward_extremities",
+                column="room_id",
+                iterable=room_ids,
+                retcols=["room_id", "event_id"],
+            )
+
+            results = {}
+            for row in rows:
+                results.setdefault(row["room_id"], []).append(row["event_id"])
+            return results
+
+        return self.runInteraction("get_latest_event_ids_in_rooms", f)
+
     def _get_latest_events_in_room(self, txn, room_id):
         sql = (
             "SELECT e.event_id, e.depth FROM events as e "
@@ -83,6 +83,53 @@ class EventsStore(SQLBaseStore):
         max_persisted_id = yield self._stream_id_gen.get_max_token(self)
         defer.returnValue((stream_ordering, max_persisted_id))
 
+    @defer.inlineCallbacks
+    def persist_events(self, events_and_contexts, backfilled=False,
+                       is_new_state=True):
+        """Persists a list of events in a single transaction, which is much
+        cheaper than persisting them one at a time with `persist_event`.
+
+        Args:
+            events_and_contexts (list): (event, context) pairs.
+            backfilled (bool)
+            is_new_state (bool)
+
+        Returns:
+            Deferred
+        """
+        if not events_and_contexts:
+            return
+
+        if backfilled:
+            if not self.min_token_deferred.called:
+                yield self.min_token_deferred
+            start = self.min_token - 1
+            self.min_token -= len(events_and_contexts)
+            stream_orderings = range(start, self.min_token - 1, -1)
+
+            @contextmanager
+            def stream_ordering_manager():
+                yield stream_orderings
+            stream_ordering_manager = stream_ordering_manager()
+        else:
+            stream_ordering_manager = yield self._stream_id_gen.get_next_mult(
+                self, len(events_and_contexts)
+            )
+
+        with stream_ordering_manager as stream_orderings:
+            yield self.runInteraction(
+                "persist_events",
+                self._persist_events_txn,
+                events=[
+                    (event, context, stream)
+                    for (event, context), stream in zip(
+                        events_and_contexts, stream_orderings
+                    )
+                ],
+                backfilled=backfilled,
+                is_new_state=is_new_state,
+            )
+
     @defer.inlineCallbacks
     def get_event(self, event_id, check_redacted=True,
                   get_prev_content=False, allow_rejected=False,
@@ -114,22 +161,40 @@ class EventsStore(SQLBaseStore):
 
         defer.returnValue(events[0] if events else None)
 
+    def get_events(self, event_ids, check_redacted=True,
+                   get_prev_content=False, allow_rejected=False):
+        """Get events from the database by event_id.
+
+        Args:
+            event_ids (list): The event_ids of the events to fetch
+            check_redacted (bool): If True, check if events have been redacted
+                and redact them.
+            get_prev_content (bool): If True and an event is a state event,
+                include the previous states content in the unsigned field.
+            allow_rejected (bool): If True return rejected events.
+
+        Returns:
+            Deferred : A list of FrozenEvents. Events that can't be found are
+            omitted.
+        """
+        return self._get_events(
+            event_ids,
+            check_redacted=check_redacted,
+            get_prev_content=get_prev_content,
+            allow_rejected=allow_rejected,
+        )
+
     @log_function
     def _persist_event_txn(self, txn, event, context, backfilled,
                            stream_ordering=None, is_new_state=True,
                            current_state=None):
 
-        # Remove the any existing cache entries for the event_id
-        txn.call_after(self._invalidate_get_event_cache, event.event_id)
-
         # We purposefully do this first since if we include a `current_state`
         # key, we *want* to update the `current_state_events` table
         if current_state:
-            txn.call_after(self.get_current_state_for_key.invalidate_all)
-            txn.call_after(self.get_rooms_for_user.invalidate_all)
-            txn.call_after(self.get_users_in_room.invalidate, event.room_id)
-            txn.call_after(self.get_joined_hosts_for_room.invalidate, event.room_id)
-            txn.call_after(self.get_room_name_and_aliases, event.room_id)
+            self._invalidate_current_state_caches_txn(
+                txn, event.room_id, current_state
+            )
 
             self._simple_delete_txn(
                 txn,
@@ -137,138 +202,178 @@ class EventsStore(SQLBaseStore):
                 keyvalues={"room_id": event.room_id},
             )
 
-            for s in current_state:
-                self._simple_insert_txn(
-                    txn,
-                    "current_state_events",
+            self._simple_insert_many_txn(
+                txn,
+                table="current_state_events",
+                values=[
                     {
                         "event_id": s.event_id,
                         "room_id": s.room_id,
                         "type": s.type,
                         "state_key": s.state_key,
                     }
-                )
+                    for s in current_state
+                ],
+            )
 
-        outlier = event.internal_metadata.is_outlier()
+        self._persist_events_txn(
+            txn, [(event, context, stream_ordering)], backfilled,
+            is_new_state=is_new_state,
+        )
 
-        if not outlier:
-            self._update_min_depth_for_room_txn(
-                txn,
-                event.room_id,
-                event.depth
-            )
+    @log_function
+    def _persist_events_txn(self, txn, events, backfilled, is_new_state=True):
+        """
+        Args:
+            txn
+            events (list): (event, context, stream_ordering) tuples.
+            backfilled (bool)
+            is_new_state (bool)
+        """
+        # An event may be in the list more than once, e.g. if it is both in
+        # the state and the auth chain of a room we're joining.
+        seen_ids = set()
+        deduped_events = []
+        for event, context, stream_ordering in events:
+            if event.event_id not in seen_ids:
+                seen_ids.add(event.event_id)
+                deduped_events.append((event, context, stream_ordering))
+        events = deduped_events
+
+        for event, _, _ in events:
+            # Remove the any existing cache entries for the event_id
+            txn.call_after(self._invalidate_get_event_cache, event.event_id)
+
+            if not event.internal_metadata.is_outlier():
+                self._update_min_depth_for_room_txn(
+                    txn,
+                    event.room_id,
+                    event.depth
+                )
 
-        have_persisted = self._simple_select_one_txn(
+        rows = self._simple_select_many_txn(
             txn,
             table="events",
-            keyvalues={"event_id": event.event_id},
+            column="event_id",
+            iterable=[event.event_id for event, _, _ in events],
             retcols=["event_id", "outlier"],
-            allow_none=True,
         )
+        have_persisted = {row["event_id"]: row["outlier"] for row in rows}
 
-        metadata_json = encode_canonical_json(
-            event.internal_metadata.get_dict()
-        ).decode("UTF-8")
-
-        # If we have already persisted this event, we don't need to do any
+        # If we have already persisted an event, we don't need to do any
         # more processing.
         # The processing above must be done on every call to persist event,
         # since they might not have happened on previous calls. For example,
         # if we are persisting an event that we had persisted as an outlier,
         # but is no longer one.
-        if have_persisted:
-            if not outlier and have_persisted["outlier"]:
-                self._store_state_groups_txn(txn, event, context)
+        for event, context, stream_ordering in events:
+            if event.event_id not in have_persisted:
+                continue
 
-                sql = (
-                    "UPDATE event_json SET internal_metadata = ?"
-                    " WHERE event_id = ?"
-                )
-                txn.execute(
-                    sql,
-                    (metadata_json, event.event_id,)
-                )
+            outlier = event.internal_metadata.is_outlier()
+            if outlier or not have_persisted[event.event_id]:
+                continue
 
-                sql = (
-                    "UPDATE events SET outlier = ?"
-                    " WHERE event_id = ?"
+            self._store_state_groups_txn(txn, event, context)
+
+            # The event keeps the stream ordering it was first persisted
+            # with, so the room stream buffer won't have it.
+            if not backfilled:
+                txn.call_after(
+                    self._room_stream_buffer.invalidate_room,
+                    event.room_id, stream_ordering
                 )
-                txn.execute(
-                    sql,
-                    (False, event.event_id,)
+                txn.call_after(
+                    self._room_stream_change_cache.entity_has_changed,
+                    event.room_id, stream_ordering
                 )
-            return
+                if event.type == EventTypes.Member:
+                    txn.call_after(
+                        self._room_stream_buffer.add_membership_change,
+                        event.state_key, stream_ordering
+                    )
 
-        if not outlier:
-            self._store_state_groups_txn(txn, event, context)
+            metadata_json = encode_canonical_json(
+                event.internal_metadata.get_dict()
+            ).decode("UTF-8")
 
-        self._handle_prev_events(
-            txn,
-            outlier=outlier,
-            event_id=event.event_id,
-            prev_events=event.prev_events,
-            room_id=event.room_id,
-        )
+            sql = (
+                "UPDATE event_json SET internal_metadata = ?"
+                " WHERE event_id = ?"
+            )
+            txn.execute(
+                sql,
+                (metadata_json, event.event_id,)
+            )
 
-        if event.type == EventTypes.Member:
-            self._store_room_member_txn(txn, event)
-        elif event.type == EventTypes.Name:
-            self._store_room_name_txn(txn, event)
-        elif event.type == EventTypes.Topic:
-            self._store_room_topic_txn(txn, event)
-        elif event.type == EventTypes.Redaction:
-            self._store_redaction(txn, event)
-
-        event_dict = {
-            k: v
-            for k, v in event.get_dict().items()
-            if k not in [
-                "redacted",
-                "redacted_because",
-            ]
-        }
+            sql = (
+                "UPDATE events SET outlier = ?"
+                " WHERE event_id = ?"
+            )
+            txn.execute(
+                sql,
+                (False, event.event_id,)
+            )
 
-        self._simple_insert_txn(
-            txn,
-            table="event_json",
-            values={
+        new_events = [
+            (event, context, stream_ordering)
+            for event, context, stream_ordering in events
+            if event.event_id not in have_persisted
+        ]
+
+        if new_events:
+            self._store_new_events_txn(
+                txn, new_events, backfilled, is_new_state
+            )
+
+    def _store_new_events_txn(self, txn, events, backfilled, is_new_state):
+        """Stores events we haven't persisted before, using one INSERT per
+        table for all of the events.
+
+        Args:
+            txn
+            events (list): (event, context, stream_ordering) tuples.
+            backfilled (bool)
+            is_new_state (bool)
+        """
+        event_json_rows = []
+        events_rows = []
+        for event, _, stream_ordering in events:
+            metadata_json = encode_canonical_json(
+                event.internal_metadata.get_dict()
+            ).decode("UTF-8")
+
+            event_dict = {
+                k: v
+                for k, v in event.get_dict().items()
+                if k not in [
+                    "redacted",
+                    "redacted_because",
+                ]
+            }
+
+            event_json_rows.append({
                 "event_id": event.event_id,
                 "room_id": event.room_id,
                 "internal_metadata": metadata_json,
                 "json": encode_canonical_json(event_dict).decode("UTF-8"),
-            },
-        )
+            })
 
-        content = encode_canonical_json(
-            event.content
-        ).decode("UTF-8")
-
-        vals = {
-            "topological_ordering": event.depth,
-            "event_id": event.event_id,
-            "type": event.type,
-            "room_id": event.room_id,
-            "content": content,
-            "processed": True,
-            "outlier": outlier,
-            "depth": event.depth,
-        }
+            content = encode_canonical_json(
+                event.content
+            ).decode("UTF-8")
 
-        unrec = {
-            k: v
-            for k, v in event.get_dict().items()
-            if k not in vals.keys() and k not in [
-                "redacted",
-                "redacted_because",
-                "signatures",
-                "hashes",
-                "prev_events",
-            ]
-        }
+            events_rows.append((
+                stream_ordering, event.depth, event.event_id, event.type,
+                event.room_id, content, True,
+                event.internal_metadata.is_outlier(), event.depth
+            ))
 
-        vals["unrecognized_keys"] = encode_canonical_json(
-            unrec
-        ).decode("UTF-8")
+        self._simple_insert_many_txn(
+            txn,
+            table="event_json",
+            values=event_json_rows,
+        )
 
         sql = (
             "INSERT INTO events"
@@ -277,84 +382,54 @@ class EventsStore(SQLBaseStore):
             " VALUES (?,?,?,?,?,?,?,?,?)"
         )
 
-        txn.execute(
-            sql,
-            (
-                stream_ordering, event.depth, event.event_id, event.type,
-                event.room_id, content, True, outlier, event.depth
-            )
-        )
-
-        if context.rejected:
-            self._store_rejections_txn(
-                txn, event.event_id, context.rejected
-            )
+        txn.executemany(sql, events_rows)
 
-        for hash_alg, hash_base64 in event.hashes.items():
-            hash_bytes = decode_base64(hash_base64)
-            self._store_event_content_hash_txn(
-                txn, event.event_id, hash_alg, hash_bytes,
-            )
+        for event, context, stream_ordering in events:
+            outlier = event.internal_metadata.is_outlier()
 
-        for prev_event_id, prev_hashes in event.prev_events:
-            for alg, hash_base64 in prev_hashes.items():
-                hash_bytes = decode_base64(hash_base64)
-                self._store_prev_event_hash_txn(
-                    txn, event.event_id, prev_event_id, alg,
-                    hash_bytes
-                )
-
-        self._simple_insert_many_txn(
-            txn,
-            table="event_auth",
-            values=[
-                {
-                    "event_id": event.event_id,
-                    "room_id": event.room_id,
-                    "auth_id": auth_id,
-                }
-                for auth_id, _ in event.auth_events
-            ],
-        )
-
-        (ref_alg, ref_hash_bytes) = compute_event_reference_hash(event)
-        self._store_event_reference_hash_txn(
-            txn, event.event_id, ref_alg, ref_hash_bytes
-        )
-
-        if event.is_state():
-            vals = {
-                "event_id": event.event_id,
-                "room_id": event.room_id,
-                "type": event.type,
-                "state_key": event.state_key,
-            }
-
-            # TODO: How does this work with backfilling?
-            if hasattr(event, "replaces_state"):
-                vals["prev_state"] = event.replaces_state
+            if not outlier:
+                self._store_state_groups_txn(txn, event, context)
 
-            self._simple_insert_txn(
+            self._handle_prev_events(
                 txn,
-                "state_events",
-                vals,
+                outlier=outlier,
+                event_id=event.event_id,
+                prev_events=event.prev_events,
+                room_id=event.room_id,
             )
 
-            self._simple_insert_many_txn(
-                txn,
-                table="event_edges",
-                values=[
-                    {
-                        "event_id": event.event_id,
-                        "prev_event_id": e_id,
-                        "room_id": event.room_id,
-                        "is_state": True,
-                    }
-                    for e_id, h in event.prev_state
-                ],
-            )
+            if event.type == EventTypes.Member:
+                self._store_room_member_txn(txn, event)
+            elif event.type == EventTypes.Name:
+                self._store_room_name_txn(txn, event)
+            elif event.type == EventTypes.Topic:
+                self._store_room_topic_txn(txn, event)
+            elif event.type == EventTypes.Redaction:
+                self._store_redaction(txn, event)
+
+            if not backfilled:
+                if not outlier:
+                    txn.call_after(
+                        self._room_stream_buffer.add_event,
+                        stream_ordering, event.room_id, event.event_id,
+                        (
+                            event.state_key
+                            if event.type == EventTypes.Member else None
+                        )
+                    )
+                    txn.call_after(
+                        self._room_stream_change_cache.entity_has_changed,
+                        event.room_id, stream_ordering
+                    )
+                elif event.type == EventTypes.Member:
+                    # Outlier membership events, e.g. invites to remote rooms,
+                    # are still included in the user's event stream.
+                    txn.call_after(
+                        self._room_stream_buffer.add_membership_change,
+                        event.state_key, stream_ordering
+                    )
 
-            if is_new_state and not context.rejected:
+            if event.is_state() and is_new_state and not context.rejected:
                 txn.call_after(
                     self.get_current_state_for_key.invalidate,
                     event.room_id, event.type, event.state_key
@@ -380,7 +455,118 @@ class EventsStore(SQLBaseStore):
                     }
                 )
 
-        return
+        self._simple_insert_many_txn(
+            txn,
+            table="rejections",
+            values=[
+                {
+                    "event_id": event.event_id,
+                    "reason": context.rejected,
+                    "last_check": self._clock.time_msec(),
+                }
+                for event, context, _ in events
+                if context.rejected
+            ],
+        )
+
+        self._simple_insert_many_txn(
+            txn,
+            table="event_content_hashes",
+            values=[
+                {
+                    "event_id": event.event_id,
+                    "algorithm": hash_alg,
+                    "hash": buffer(decode_base64(hash_base64)),
+                }
+                for event, _, _ in events
+                for hash_alg, hash_base64 in event.hashes.items()
+            ],
+        )
+
+        self._simple_insert_many_txn(
+            txn,
+            table="event_edge_hashes",
+            values=[
+                {
+                    "event_id": event.event_id,
+                    "prev_event_id": prev_event_id,
+                    "algorithm": alg,
+                    "hash": buffer(decode_base64(hash_base64)),
+                }
+                for event, _, _ in events
+                for prev_event_id, prev_hashes in event.prev_events
+                for alg, hash_base64 in prev_hashes.items()
+            ],
+        )
+
+        self._simple_insert_many_txn(
+            txn,
+            table="event_auth",
+            values=[
+                {
+                    "event_id": event.event_id,
+                    "room_id": event.room_id,
+                    "auth_id": auth_id,
+                }
+                for event, _, _ in events
+                for auth_id, _ in event.auth_events
+            ],
+        )
+
+        if self._auth_chain_index_enabled:
+            self._index_new_auth_chains_txn(
+                txn, [event for event, _, _ in events]
+            )
+
+        reference_hashes = []
+        for event, _, _ in events:
+            (ref_alg, ref_hash_bytes) = compute_event_reference_hash(event)
+            reference_hashes.append({
+                "event_id": event.event_id,
+                "algorithm": ref_alg,
+                "hash": buffer(ref_hash_bytes),
+            })
+
+        self._simple_insert_many_txn(
+            txn,
+            table="event_reference_hashes",
+            values=reference_hashes,
+        )
+
+        state_events = [
+            event for event, _, _ in events if event.is_state()
+        ]
+
+        # TODO: How does this work with backfilling?
+        self._simple_insert_many_txn(
+            txn,
+            table="state_events",
+            values=[
+                {
+                    "event_id": event.event_id,
+                    "room_id": event.room_id,
+                    "type": event.type,
+                    "state_key": event.state_key,
+                    "prev_state": getattr(event, "replaces_state", None),
+                }
+                for event in state_events
+            ],
+        )
+
+        self._simple_insert_many_txn(
+            txn,
+            table="event_edges",
+            values=[
+                {
+                    "event_id": event.event_id,
+                    "prev_event_id": e_id,
+                    "room_id": event.room_id,
+                    "is_state": True,
+                }
+                for event in state_events
+                for e_id, h in event.prev_state
+            ],
+        )
 
     def _store_redaction(self, txn, event):
         # invalidate the cache for the redacted event
@@ -492,7 +678,48 @@ class EventsStore(SQLBaseStore):
             if e_id in event_map and event_map[e_id]
         ]
 
+    def _invalidate_current_state_caches_txn(self, txn, room_id,
+                                             current_state):
+        """ Invalidates the caches affected by replacing the current state of
+        the room with `current_state`. Only the state keys whose event has
+        changed, and the users whose membership has changed, are invalidated.
+        """
+        rows = self._simple_select_list_txn(
+            txn,
+            table="current_state_events",
+            keyvalues={"room_id": room_id},
+            retcols=["type", "state_key", "event_id"],
+        )
+
+        old_state = {(r["type"], r["state_key"]): r["event_id"] for r in rows}
+        new_state = {(s.type, s.state_key): s.event_id for s in current_state}
+
+        changed = [
+            key for key in set(old_state) | set(new_state)
+            if old_state.get(key) != new_state.get(key)
+        ]
+
+        for etype, state_key in changed:
+            txn.call_after(
+                self.get_current_state_for_key.invalidate,
+                room_id, etype, state_key
+            )
+
+        members_changed = False
+        for etype, state_key in changed:
+            if etype == EventTypes.Member:
+                members_changed = True
+                txn.call_after(self.get_rooms_for_user.invalidate, state_key)
+
+        if members_changed:
+            txn.call_after(self.get_users_in_room.invalidate, room_id)
+            txn.call_after(self.get_joined_hosts_for_room.invalidate, room_id)
+
+        if any(t in (EventTypes.Name, EventTypes.Aliases) for t, _ in changed):
+            txn.call_after(self.get_room_name_and_aliases.invalidate, room_id)
+
     def _invalidate_get_event_cache(self, event_id):
+        self._event_row_cache.invalidate(event_id)
         for check_redacted in (False, True):
             for get_prev_content in (False, True):
                 self._get_event_cache.invalidate(event_id, check_redacted,
@@ -529,6 +756,21 @@ class EventsStore(SQLBaseStore):
 
         return event_map
 
+    def _get_event_rows_from_cache(self, events):
+        """Returns a dict of event_id -> row, as returned by
+        `_fetch_event_rows`, for the given events that are in the event row
+        cache.
+        """
+        row_map = {}
+
+        for event_id in events:
+            try:
+                row_map[event_id] = self._event_row_cache.get(event_id)
+            except KeyError:
+                pass
+
+        return row_map
+
     def _do_fetch(self, conn):
         """Takes a database connection and waits for requests for events from
         the _event_fetch_list queue.
@@ -601,41 +843,48 @@ class EventsStore(SQLBaseStore):
         if not events:
             defer.returnValue({})
 
-        events_d = defer.Deferred()
-        with self._event_fetch_lock:
-            self._event_fetch_list.append(
-                (events, events_d)
-            )
+        row_map = self._get_event_rows_from_cache(events)
+        missing_events = [e for e in events if e not in row_map]
 
-            self._event_fetch_lock.notify()
+        if missing_events:
+            # Get the sequence number of the row cache before fetching, so
+            # that we don't cache rows that are invalidated while we fetch.
+            sequence = self._event_row_cache.sequence
 
-            if self._event_fetch_ongoing < EVENT_QUEUE_THREADS:
-                self._event_fetch_ongoing += 1
-                should_start = True
-            else:
-                should_start = False
+            events_d = defer.Deferred()
+            with self._event_fetch_lock:
+                self._event_fetch_list.append(
+                    (missing_events, events_d)
+                )
 
-        if should_start:
-            self.runWithConnection(
-                self._do_fetch
-            )
+                self._event_fetch_lock.notify()
 
-        rows = yield preserve_context_over_deferred(events_d)
+                if self._event_fetch_ongoing < EVENT_QUEUE_THREADS:
+                    self._event_fetch_ongoing += 1
+                    should_start = True
+                else:
+                    should_start = False
+
+            if should_start:
+                self.runWithConnection(
+                    self._do_fetch
+                )
+
+            fetched_rows = yield preserve_context_over_deferred(events_d)
+
+            for row in fetched_rows:
+                self._event_row_cache.update(sequence, row["event_id"], row)
+                row_map[row["event_id"]] = row
+
+        rows = row_map.values()
 
         if not allow_rejected:
             rows[:] = [r for r in rows if not r["rejects"]]
 
-        res = yield defer.gatherResults(
-            [
-                self._get_event_from_row(
-                    row["internal_metadata"], row["json"], row["redacts"],
-                    check_redacted=check_redacted,
-                    get_prev_content=get_prev_content,
-                    rejected_reason=row["rejects"],
-                )
-                for row in rows
-            ],
-            consumeErrors=True
+        res = yield self._get_events_from_rows(
+            rows,
+            check_redacted=check_redacted,
+            get_prev_content=get_prev_content,
         )
 
         defer.returnValue({
@@ -656,8 +905,8 @@ class EventsStore(SQLBaseStore):
                 " e.event_id as event_id, "
                 " e.internal_metadata,"
                 " e.json,"
-                " r.redacts as redacts,"
-                " rej.event_id as rejects "
+                " r.event_id as redacted_by,"
+                " rej.reason as rejects "
                 " FROM event_json as e"
                 " LEFT JOIN rejections as rej USING (event_id)"
                 " LEFT JOIN redactions as r ON e.event_id = r.redacts"
@@ -674,141 +923,154 @@ class EventsStore(SQLBaseStore):
         if not events:
             return {}
 
-        rows = self._fetch_event_rows(
-            txn, events,
-        )
+        row_map = self._get_event_rows_from_cache(events)
+        missing_events = [e for e in events if e not in row_map]
+
+        if missing_events:
+            sequence = self._event_row_cache.sequence
+
+            fetched_rows = self._fetch_event_rows(
+                txn, missing_events,
+            )
+
+            for row in fetched_rows:
+                txn.call_after(
+                    self._event_row_cache.update,
+                    sequence, row["event_id"], row
+                )
+                row_map[row["event_id"]] = row
+
+        rows = row_map.values()
 
         if not allow_rejected:
             rows[:] = [r for r in rows if not r["rejects"]]
 
-        res = [
-            self._get_event_from_row_txn(
-                txn,
-                row["internal_metadata"], row["json"], row["redacts"],
-                check_redacted=check_redacted,
-                get_prev_content=get_prev_content,
-                rejected_reason=row["rejects"],
-            )
-            for row in rows
-        ]
+        res = self._get_events_from_rows_txn(
+            txn, rows,
+            check_redacted=check_redacted,
+            get_prev_content=get_prev_content,
+        )
 
         return {
             r.event_id: r
             for r in res
         }
 
-    @defer.inlineCallbacks
-    def _get_event_from_row(self, internal_metadata, js, redacted,
-                            check_redacted=True, get_prev_content=False,
-                            rejected_reason=None):
-        d = json.loads(js)
-        internal_metadata = json.loads(internal_metadata)
-
-        if rejected_reason:
-            rejected_reason = yield self._simple_select_one_onecol(
-                table="rejections",
-                keyvalues={"event_id": rejected_reason},
-                retcol="reason",
-                desc="_get_event_from_row",
-            )
+    def _build_event_from_row(self, row, check_redacted):
+        """Builds an event from a row returned by `_fetch_event_rows`, pruning
+        it if it has been redacted and `check_redacted` is set.
+        """
+        d = json.loads(row["json"])
+        internal_metadata = json.loads(row["internal_metadata"])
 
         ev = FrozenEvent(
             d,
             internal_metadata_dict=internal_metadata,
-            rejected_reason=rejected_reason,
+            rejected_reason=row["rejects"],
         )
 
-        if check_redacted and redacted:
+        if check_redacted and row["redacted_by"]:
             ev = prune_event(ev)
+            ev.unsigned["redacted_by"] = row["redacted_by"]
 
-            redaction_id = yield self._simple_select_one_onecol(
-                table="redactions",
-                keyvalues={"redacts": ev.event_id},
-                retcol="event_id",
-                desc="_get_event_from_row",
-            )
-
-            ev.unsigned["redacted_by"] = redaction_id
-            # Get the redaction event.
+        return ev
 
-            because = yield self.get_event(
-                redaction_id,
-                check_redacted=False
-            )
+    def _add_related_events(self, events, rows, redactions, prev_events):
+        """Adds the redaction events and previous state content fetched by
+        `_get_events_from_rows` to the events.
+        """
+        redactions = {e.event_id: e for e in redactions}
+        prev_events = {e.event_id: e for e in prev_events}
 
+        for ev, row in zip(events, rows):
+            because = redactions.get(row["redacted_by"])
             if because:
                 ev.unsigned["redacted_because"] = because
 
-        if get_prev_content and "replaces_state" in ev.unsigned:
-            prev = yield self.get_event(
-                ev.unsigned["replaces_state"],
-                get_prev_content=False,
-            )
+            prev = prev_events.get(ev.unsigned.get("replaces_state"))
             if prev:
                 ev.unsigned["prev_content"] = prev.get_dict()["content"]
 
-        self._get_event_cache.prefill(
-            ev.event_id, check_redacted, get_prev_content, ev
+    @defer.inlineCallbacks
+    def _get_events_from_rows(self, rows, check_redacted=True,
+                              get_prev_content=False):
+        """Builds events from rows returned by `_fetch_event_rows`. The
+        redaction events and previous state events needed are fetched with one
+        `_get_events` call each, rather than one per event.
+        """
+        events = [
+            self._build_event_from_row(row, check_redacted)
+            for row in rows
+        ]
+
+        redaction_ids = set()
+        if check_redacted:
+            redaction_ids = set(
+                row["redacted_by"] for row in rows if row["redacted_by"]
+            )
+        redactions = yield self._get_events(
+            list(redaction_ids),
+            check_redacted=False,
         )
 
-        defer.returnValue(ev)
+        prev_events = []
+        if get_prev_content:
+            prev_ids = set(
+                ev.unsigned["replaces_state"] for ev in events
+                if "replaces_state" in ev.unsigned
+            )
+            prev_events = yield self._get_events(
+                list(prev_ids),
+                get_prev_content=False,
+            )
 
-    def _get_event_from_row_txn(self, txn, internal_metadata, js, redacted,
-                                check_redacted=True, get_prev_content=False,
-                                rejected_reason=None):
-        d = json.loads(js)
-        internal_metadata = json.loads(internal_metadata)
+        self._add_related_events(events, rows, redactions, prev_events)
 
-        if rejected_reason:
-            rejected_reason = self._simple_select_one_onecol_txn(
-                txn,
-                table="rejections",
-                keyvalues={"event_id": rejected_reason},
-                retcol="reason",
+        for ev in events:
+            self._get_event_cache.prefill(
+                ev.event_id, check_redacted, get_prev_content, ev
             )
 
-        ev = FrozenEvent(
-            d,
-            internal_metadata_dict=internal_metadata,
-            rejected_reason=rejected_reason,
-        )
+        defer.returnValue(events)
 
-        if check_redacted and redacted:
-            ev = prune_event(ev)
+    def _get_events_from_rows_txn(self, txn, rows, check_redacted=True,
+                                  get_prev_content=False):
+        events = [
+            self._build_event_from_row(row, check_redacted)
+            for row in rows
+        ]
 
-            redaction_id = self._simple_select_one_onecol_txn(
-                txn,
-                table="redactions",
-                keyvalues={"redacts": ev.event_id},
-                retcol="event_id",
+        redaction_ids = set()
+        if check_redacted:
+            redaction_ids = set(
+                row["redacted_by"] for row in rows if row["redacted_by"]
             )
+        redactions = self._get_events_txn(
+            txn,
+            list(redaction_ids),
+            check_redacted=False,
+        )
 
-            ev.unsigned["redacted_by"] = redaction_id
-            # Get the redaction event.
-
-            because = self._get_event_txn(
-                txn,
-                redaction_id,
-                check_redacted=False
+        prev_events = []
+        if get_prev_content:
+            prev_ids = set(
+                ev.unsigned["replaces_state"] for ev in events
+                if "replaces_state" in ev.unsigned
             )
-
-            if because:
-                ev.unsigned["redacted_because"] = because
-
-        if get_prev_content and "replaces_state" in ev.unsigned:
-            prev = self._get_event_txn(
+            prev_events = self._get_events_txn(
                 txn,
-                ev.unsigned["replaces_state"],
+                list(prev_ids),
                 get_prev_content=False,
             )
-            if prev:
-                ev.unsigned["prev_content"] = prev.get_dict()["content"]
 
-        self._get_event_cache.prefill(
-            ev.event_id, check_redacted, get_prev_content, ev
-        )
+        self._add_related_events(events, rows, redactions, prev_events)
 
-        return ev
+        for ev in events:
+            self._get_event_cache.prefill(
+                ev.event_id, check_redacted, get_prev_content, ev
+            )
+
+        return events
 
     def _parse_events(self, rows):
         return self.runInteraction(
@@ -0,0 +1,28 @@
+/* Copyright 2015 OpenMarket Ltd
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *    http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+-- The transitive closure of event_auth, i.e. an entry for every event in the
+-- auth chain of event_id. Only maintained if `auth_chain_index` is enabled.
+CREATE TABLE IF NOT EXISTS event_auth_closure(
+    event_id TEXT NOT NULL,
+    auth_id TEXT NOT NULL,
+    UNIQUE (event_id, auth_id)
+);
+
+-- The events whose entries in event_auth_closure are complete.
+CREATE TABLE IF NOT EXISTS event_auth_closure_indexed(
+    event_id TEXT NOT NULL,
+    UNIQUE (event_id)
+);
@@ -0,0 +1,31 @@
+/* Copyright 2015 OpenMarket Ltd
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *    http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+-- Events that we couldn't add to event_auth_closure yet, because some of their
+-- auth events haven't been indexed. The backfill retries them.
+CREATE TABLE IF NOT EXISTS event_auth_closure_pending(
+    event_id TEXT NOT NULL,
+    UNIQUE (event_id)
+);
+
+-- The stream ordering of the last event that the backfill of the auth chain
+-- index has looked at, or NULL if it hasn't started.
+CREATE TABLE IF NOT EXISTS event_auth_closure_backfill(
+    Lock CHAR(1) NOT NULL DEFAULT 'X' UNIQUE,  -- Makes sure this table only has one row.
+    last_stream_ordering BIGINT,
+    CHECK (Lock='X')
+);
+
+INSERT INTO event_auth_closure_backfill (last_stream_ordering) VALUES (NULL);
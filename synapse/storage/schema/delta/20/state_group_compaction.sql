@@ -0,0 +1,27 @@
+/* Copyright 2015 OpenMarket Ltd
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *    http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+-- Used to find the previous state group in a room when compacting state groups.
+CREATE INDEX state_groups_room_id ON state_groups(room_id, id);
+
+-- The last state group that the background compaction of state groups has
+-- looked at.
+CREATE TABLE IF NOT EXISTS state_group_compaction_progress(
+    Lock CHAR(1) NOT NULL DEFAULT 'X' UNIQUE,  -- Makes sure this table only has one row.
+    last_group BIGINT NOT NULL,
+    CHECK (Lock='X')
+);
+
+INSERT INTO state_group_compaction_progress (last_group) VALUES (0);
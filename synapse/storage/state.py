@@ -13,7 +13,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from ._base import SQLBaseStore, cached
+from ._base import SQLBaseStore, cached, SELECT_MANY_BATCH_SIZE
 
 from twisted.internet import defer
 
@@ -24,6 +24,16 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+# The maximum number of deltas we allow between a state group and the nearest
+# state group that is stored in full, so that reads stay fast.
+MAX_STATE_DELTA_HOPS = 50
+
+# How many state groups the background compaction looks at in each
+# transaction, and how often it runs.
+STATE_GROUP_COMPACTION_BATCH_SIZE = 100
+STATE_GROUP_COMPACTION_INTERVAL_MS = 1000
+
+
 class StateStore(SQLBaseStore):
     """ Keeps track of the state at a given event.
 
@@ -36,11 +46,15 @@ class StateStore(SQLBaseStore):
     generated. However, if no change happens (e.g., if we get a message event
     with only one parent it inherits the state group from its parent.)
 
-    There are three tables:
+    There are four tables:
       * `state_groups`: Stores group name, first event with in the group and
         room id.
       * `event_to_state_groups`: Maps events to state groups.
       * `state_groups_state`: Maps state group to state events.
+      * `state_group_edges`: Maps a state group to the previous state group
+        it is a delta of. If a group has an entry here then its rows in
+        `state_groups_state` only contain the state that differs from the
+        previous group, otherwise they contain the full state.
     """
 
     @defer.inlineCallbacks
@@ -50,35 +64,9 @@ class StateStore(SQLBaseStore):
         The return value is a dict mapping group names to lists of events.
         """
 
-        def f(txn):
-            groups = set()
-            for event_id in event_ids:
-                group = self._simple_select_one_onecol_txn(
-                    txn,
-                    table="event_to_state_groups",
-                    keyvalues={"event_id": event_id},
-                    retcol="state_group",
-                    allow_none=True,
-                )
-                if group:
-                    groups.add(group)
-
-            res = {}
-            for group in groups:
-                state_ids = self._simple_select_onecol_txn(
-                    txn,
-                    table="state_groups_state",
-                    keyvalues={"state_group": group},
-                    retcol="event_id",
-                )
-
-                res[group] = state_ids
-
-            return res
-
         states = yield self.runInteraction(
             "get_state_groups",
-            f,
+            self._get_state_groups_txn, event_ids,
         )
 
         @defer.inlineCallbacks
@@ -95,6 +83,216 @@ class StateStore(SQLBaseStore):
 
         defer.returnValue(states)
 
+    def _get_state_groups_txn(self, txn, event_ids):
+        """ Get the state groups for the given list of event_ids, and the
+        event_ids of the state in each group.
+
+        Both the event to group and group to state lookups are done in bulk,
+        so this costs a fixed number of queries regardless of how many
+        event_ids or groups are involved. The state of groups that are in the
+        state group cache is not fetched from the database at all.
+
+        Returns:
+            dict: mapping group names to lists of state event_ids.
+        """
+        rows = self._simple_select_many_txn(
+            txn,
+            table="event_to_state_groups",
+            column="event_id",
+            iterable=event_ids,
+            retcols=["state_group"],
+        )
+
+        groups = set(row["state_group"] for row in rows if row["state_group"])
+
+        group_to_state = self._get_state_for_groups_txn(txn, groups)
+
+        return {
+            group: list(state.values())
+            for group, state in group_to_state.items()
+        }
+
+    def get_state_ids_for_events(self, event_ids):
+        """ Get the state after each of the given events, from their state
+        groups.
+
+        Returns:
+            Deferred: A dict mapping event_id to a dict of
+            (type, state_key) -> event_id. Events without a state group are
+            omitted.
+        """
+        def f(txn):
+            rows = self._simple_select_many_txn(
+                txn,
+                table="event_to_state_groups",
+                column="event_id",
+                iterable=event_ids,
+                retcols=["event_id", "state_group"],
+            )
+
+            event_to_group = {
+                row["event_id"]: row["state_group"]
+                for row in rows if row["state_group"]
+            }
+
+            group_to_state = self._get_state_for_groups_txn(
+                txn, set(event_to_group.values())
+            )
+
+            return {
+                event_id: group_to_state[group]
+                for event_id, group in event_to_group.items()
+                if group in group_to_state
+            }
+
+        return self.runInteraction("get_state_ids_for_events", f)
+
+    def _get_state_for_groups_txn(self, txn, groups, prefill_cache=True):
+        """ Get the full state of each of the given state groups.
+
+        Groups stored as deltas are reconstructed by walking their chain of
+        prev_state_groups, one query per hop for all the groups at once, until
+        we reach either a group that is stored in full or one that is in the
+        state group cache.
+
+        If `prefill_cache` is set then the state of the given groups is added
+        to the state group cache once the transaction completes.
+
+        Returns:
+            dict: mapping group names to dicts of (type, state_key) -> event_id
+        """
+        # The state of any group we found in the cache
+        cached = {}
+        # Maps groups stored as deltas to the group they are a delta of
+        prev_groups = {}
+        # Groups whose rows we need to fetch from state_groups_state
+        missing = set()
+
+        seen = set()
+        frontier = set(groups)
+        while frontier:
+            seen |= frontier
+
+            lookup = []
+            for group in frontier:
+                try:
+                    cached[group] = self._state_group_cache.get(group)
+                except KeyError:
+                    lookup.append(group)
+
+            missing.update(lookup)
+
+            rows = self._simple_select_many_txn(
+                txn,
+                table="state_group_edges",
+                column="state_group",
+                iterable=lookup,
+                retcols=["state_group", "prev_state_group"],
+            )
+
+            frontier = set()
+            for row in rows:
+                prev_group = row["prev_state_group"]
+                prev_groups[row["state_group"]] = prev_group
+                if prev_group not in seen:
+                    frontier.add(prev_group)
+
+        rows = self._simple_select_many_txn(
+            txn,
+            table="state_groups_state",
+            column="state_group",
+            iterable=missing,
+            retcols=["state_group", "type", "state_key", "event_id"],
+        )
+
+        deltas = {group: {} for group in missing}
+        for row in rows:
+            key = (row["type"], row["state_key"])
+            deltas[row["state_group"]][key] = row["event_id"]
+
+        results = {}
+        for group in groups:
+            if group in cached:
+                results[group] = cached[group]
+                continue
+
+            chain = []
+            base = group
+            while base not in cached and base in prev_groups:
+                chain.append(base)
+                base = prev_groups[base]
+
+            if base in cached:
+                state = dict(cached[base])
+            else:
+                state = dict(deltas[base])
+
+            for delta_group in reversed(chain):
+                state.update(deltas[delta_group])
+
+            results[group] = state
+            if prefill_cache:
+                txn.call_after(self._state_group_cache.prefill, group, state)
+
+        return results
+
+    def _get_state_group_hops_txn(self, txn, state_group):
+        """ Returns the number of deltas that need to be applied to get from
+        the nearest fully stored state group to the given one.
+        """
+        hops = self._simple_select_one_onecol_txn(
+            txn,
+            table="state_group_edges",
+            keyvalues={"state_group": state_group},
+            retcol="hops",
+            allow_none=True,
+        )
+        return hops or 0
+
+    def _get_state_delta_txn(self, txn, prev_group, state_ids, extra_hops=0,
+                             prefill_cache=True):
+        """ Works out whether the state `state_ids` can be stored as a delta
+        against `prev_group`.
+
+        Args:
+            prev_group (int): the candidate state group.
+            state_ids (dict): (type, state_key) -> event_id of the new state.
+            extra_hops (int): the length of the longest chain of deltas that
+                are already stored against the new state group.
+
+        Returns:
+            tuple: the (type, state_key) -> event_id entries that differ from
+            the state of `prev_group`, and the number of hops the new group
+            would have. The delta is None if the state can't be stored as a
+            delta, i.e. if it would remove entries from `prev_group`, if it
+            wouldn't save anything, or if it would make a chain of deltas too
+            long.
+        """
+        hops = self._get_state_group_hops_txn(txn, prev_group) + 1
+        if hops + extra_hops >= MAX_STATE_DELTA_HOPS:
+            return None, hops
+
+        prev_state = self._get_state_for_groups_txn(
+            txn, [prev_group], prefill_cache=prefill_cache,
+        ).get(prev_group)
+
+        if not prev_state:
+            return None, hops
+
+        if any(key not in state_ids for key in prev_state):
+            return None, hops
+
+        delta = {
+            key: event_id
+            for key, event_id in state_ids.items()
+            if prev_state.get(key) != event_id
+        }
+
+        if len(delta) >= len(state_ids):
+            return None, hops
+
+        return delta, hops
+
     def _store_state_groups_txn(self, txn, event, context):
         if context.current_state is None:
             return
@@ -117,6 +315,32 @@ class StateStore(SQLBaseStore):
                 },
             )
 
+            state_ids = {
+                key: state.event_id for key, state in state_events.items()
+            }
+
+            delta = None
+            if context.prev_group:
+                delta, hops = self._get_state_delta_txn(
+                    txn, context.prev_group, state_ids
+                )
+
+            if delta is not None:
+                self._simple_insert_txn(
+                    txn,
+                    table="state_group_edges",
+                    values={
+                        "state_group": state_group,
+                        "prev_state_group": context.prev_group,
+                        "hops": hops,
+                    },
+                )
+                to_insert = [
+                    state_events[key] for key in delta
+                ]
+            else:
+                to_insert = state_events.values()
+
             self._simple_insert_many_txn(
                 txn,
                 table="state_groups_state",
@@ -128,10 +352,16 @@ class StateStore(SQLBaseStore):
                         "state_key": state.state_key,
                         "event_id": state.event_id,
                     }
-                    for state in state_events.values()
+                    for state in to_insert
                 ],
             )
 
+            # State groups are never modified once written, so we can add the
+            # new group straight to the cache once the transaction commits.
+            txn.call_after(
+                self._state_group_cache.prefill, state_group, state_ids,
+            )
+
         self._simple_insert_txn(
             txn,
             table="event_to_state_groups",
@@ -141,6 +371,170 @@ class StateStore(SQLBaseStore):
             },
         )
 
+    def start_state_group_compaction(self):
+        """ Starts a background job that rewrites state groups that are stored
+        in full as deltas against the previous state group in the same room,
+        where possible. The job carries on from where it got to before the
+        last restart.
+        """
+        @defer.inlineCallbacks
+        def compact():
+            try:
+                finished = yield self.runInteraction(
+                    "compact_state_groups",
+                    self._compact_state_groups_txn,
+                    STATE_GROUP_COMPACTION_BATCH_SIZE,
+                )
+            except Exception:
+                logger.exception("Failed to compact state groups")
+                return
+
+            if finished:
+                logger.info("Finished compacting state groups")
+                self._clock.stop_looping_call(loop)
+
+        loop = self._clock.looping_call(
+            compact, STATE_GROUP_COMPACTION_INTERVAL_MS
+        )
+
+    def _compact_state_groups_txn(self, txn, batch_size):
+        """ Rewrites up to `batch_size` state groups after the last group we
+        looked at as deltas, if they are stored in full and can be expressed
+        as a delta against the previous group in the room.
+
+        Returns:
+            bool: True if there were no groups left to look at.
+        """
+        txn.execute("SELECT last_group FROM state_group_compaction_progress")
+        last_group, = txn.fetchone()
+
+        txn.execute(
+            "SELECT id, room_id FROM state_groups WHERE id > ?"
+            " ORDER BY id ASC LIMIT ?",
+            (last_group, batch_size)
+        )
+        rows = txn.fetchall()
+
+        if not rows:
+            return True
+
+        edges = self._simple_select_many_txn(
+            txn,
+            table="state_group_edges",
+            column="state_group",
+            iterable=[state_group for state_group, _ in rows],
+            retcols=["state_group"],
+        )
+        has_prev = set(edge["state_group"] for edge in edges)
+
+        sql = (
+            "SELECT MAX(id) FROM state_groups WHERE room_id = ? AND id < ?"
+        )
+
+        for state_group, room_id in rows:
+            if state_group in has_prev:
+                continue
+
+            txn.execute(sql, (room_id, state_group))
+            prev_group, = txn.fetchone()
+            if not prev_group:
+                continue
+
+            # Groups that are already stored as deltas against this one get
+            # further from a full group once it is a delta too.
+            descendants, depth = self._get_state_group_descendants_txn(
+                txn, state_group
+            )
+
+            # We don't want to push recently used groups out of the cache
+            # with the historic groups we look at here.
+            state_ids = self._get_state_for_groups_txn(
+                txn, [state_group], prefill_cache=False,
+            )[state_group]
+
+            delta, hops = self._get_state_delta_txn(
+                txn, prev_group, state_ids, extra_hops=depth,
+                prefill_cache=False,
+            )
+            if delta is None:
+                continue
+
+            txn.execute(
+                "DELETE FROM state_groups_state WHERE state_group = ?",
+                (state_group,)
+            )
+
+            self._simple_insert_many_txn(
+                txn,
+                table="state_groups_state",
+                values=[
+                    {
+                        "state_group": state_group,
+                        "room_id": room_id,
+                        "type": key[0],
+                        "state_key": key[1],
+                        "event_id": event_id,
+                    }
+                    for key, event_id in delta.items()
+                ],
+            )
+
+            self._simple_insert_txn(
+                txn,
+                table="state_group_edges",
+                values={
+                    "state_group": state_group,
+                    "prev_state_group": prev_group,
+                    "hops": hops,
+                },
+            )
+
+            descendants = list(descendants)
+            for i in range(0, len(descendants), SELECT_MANY_BATCH_SIZE):
+                batch = descendants[i:i + SELECT_MANY_BATCH_SIZE]
+                txn.execute(
+                    "UPDATE state_group_edges SET hops = hops + ?"
+                    " WHERE state_group IN (%s)" % (
+                        ",".join("?" for _ in batch),
+                    ),
+                    [hops] + batch
+                )
+
+        txn.execute(
+            "UPDATE state_group_compaction_progress SET last_group = ?",
+            (rows[-1][0],)
+        )
+
+        return False
+
+    def _get_state_group_descendants_txn(self, txn, state_group):
+        """ Finds the state groups that are stored as deltas against the
+        given group, directly or through other deltas.
+
+        Returns:
+            tuple: the set of descendant groups, and the length of the longest
+            chain of deltas from the given group to one of them. We stop
+            looking once the chain is MAX_STATE_DELTA_HOPS long, as the group
+            can't be made a delta then anyway.
+        """
+        descendants = set()
+        depth = 0
+        frontier = [state_group]
+        while frontier and depth < MAX_STATE_DELTA_HOPS:
+            rows = self._simple_select_many_txn(
+                txn,
+                table="state_group_edges",
+                column="prev_state_group",
+                iterable=frontier,
+                retcols=["state_group"],
+            )
+            frontier = [row["state_group"] for row in rows]
+            if frontier:
+                descendants.update(frontier)
+                depth += 1
+
+        return descendants, depth
+
     @defer.inlineCallbacks
     def get_current_state(self, room_id, event_type=None, state_key=""):
         if event_type and state_key is not None:
@@ -35,7 +35,7 @@ what sort order was used:
 
 from twisted.internet import defer
 
-from ._base import SQLBaseStore
+from ._base import SQLBaseStore, SELECT_MANY_BATCH_SIZE
 from synapse.api.constants import EventTypes
 from synapse.types import RoomStreamToken
 from synapse.util.logutils import log_function
@@ -156,6 +156,7 @@ class StreamStore(SQLBaseStore):
         results = yield self.runInteraction("get_appservice_room_stream", f)
         defer.returnValue(results)
 
+    @defer.inlineCallbacks
     @log_function
     def get_room_events_stream(self, user_id, from_key, to_key, room_id,
                                limit=0, with_feedback=False):
@@ -186,22 +187,65 @@ class StreamStore(SQLBaseStore):
         to_id = RoomStreamToken.parse_stream_token(to_key)
 
         if from_key == to_key:
-            return defer.succeed(([], to_key))
+            defer.returnValue(([], to_key))
+
+        # Most requests are for the events since a recent token, which we can
+        # usually answer without going to the database.
+        results = yield self._get_room_events_stream_from_buffer(
+            user_id, from_id, to_id, limit,
+        )
+        if results is not None:
+            defer.returnValue(results)
+
+        # Otherwise, if we know which of the user's rooms have had events
+        # since the from token, we only need to query those rooms.
+        rooms = yield self.get_rooms_for_user(user_id)
+        changed_room_ids = self._room_stream_change_cache.get_entities_changed(
+            [r.room_id for r in rooms], from_id.stream,
+        )
+        membership_changed = self._room_stream_buffer.has_membership_changed(
+            user_id, from_id.stream,
+        )
+
+        if changed_room_ids is None:
+            clauses = [
+                "(e.outlier = ? AND room_id IN (%s))" % (
+                    current_room_membership_sql,
+                ),
+                "event_id IN (%s)" % (membership_sql,),
+            ]
+            args = [False, user_id, user_id]
+        else:
+            clauses = []
+            args = []
+            if changed_room_ids:
+                clauses.append(
+                    "(e.outlier = ? AND room_id IN (%s))" % (
+                        ",".join("?" * len(changed_room_ids)),
+                    )
+                )
+                args.append(False)
+                args.extend(changed_room_ids)
+            if membership_changed:
+                clauses.append("event_id IN (%s)" % (membership_sql,))
+                args.append(user_id)
+
+            if not clauses:
+                defer.returnValue(([], to_key))
 
         sql = (
             "SELECT e.event_id, e.stream_ordering FROM events AS e WHERE "
-            "(e.outlier = ? AND (room_id IN (%(current)s)) OR "
-            "(event_id IN (%(invites)s))) "
+            "(%(clauses)s) "
             "AND e.stream_ordering > ? AND e.stream_ordering <= ? "
             "ORDER BY stream_ordering ASC LIMIT %(limit)d "
         ) % {
-            "current": current_room_membership_sql,
-            "invites": membership_sql,
+            "clauses": " OR ".join(clauses),
             "limit": limit
         }
+        args.extend([from_id.stream, to_id.stream])
 
         def f(txn):
-            txn.execute(sql, (False, user_id, user_id, from_id.stream, to_id.stream,))
+            txn.execute(sql, args)
 
             rows = self.cursor_to_dict(txn)
 
@@ -222,7 +266,56 @@ class StreamStore(SQLBaseStore):
 
             return ret, key
 
-        return self.runInteraction("get_room_events_stream", f)
+        results = yield self.runInteraction("get_room_events_stream", f)
+        defer.returnValue(results)
+
+    @defer.inlineCallbacks
+    def _get_room_events_stream_from_buffer(self, user_id, from_id, to_id,
+                                            limit):
+        """Gets the events for `get_room_events_stream` from the room stream
+        buffer, if it has all the events needed.
+
+        Returns:
+            A tuple of the events and the new stream token, as returned by
+            `get_room_events_stream`, or None if the buffer doesn't have all
+            the events needed.
+        """
+        # The stream includes any membership events about the user, not just
+        # those in rooms they are joined to.
+        buf = self._room_stream_buffer
+        if buf.has_membership_changed(user_id, from_id.stream):
+            defer.returnValue(None)
+
+        rooms = yield self.get_rooms_for_user(user_id)
+
+        recent = buf.get_events_for_rooms(
+            [r.room_id for r in rooms], from_id.stream, to_id.stream,
+        )
+        if recent is None:
+            defer.returnValue(None)
+
+        recent = recent[:limit]
+
+        events = yield self._get_events(
+            [event_id for _, event_id in recent],
+            get_prev_content=True,
+        )
+
+        stream_orderings = {
+            event_id: stream_ordering for stream_ordering, event_id in recent
+        }
+        rows = [
+            {"stream_ordering": stream_orderings[e.event_id]} for e in events
+        ]
+
+        self._set_before_and_after(events, rows)
+
+        if recent:
+            key = "s%d" % recent[-1][0]
+        else:
+            key = "s%d" % (to_id.stream,)
+
+        defer.returnValue((events, key))
 
     @defer.inlineCallbacks
     def paginate_room_events(self, room_id, from_key, to_key=None,
@@ -368,6 +461,83 @@ class StreamStore(SQLBaseStore):
 
         defer.returnValue((events, token))
 
+    @defer.inlineCallbacks
+    def get_rooms_changed_since(self, room_ids, from_key):
+        """Gets which of the given rooms have had events since the given
+        stream token, using the room stream change cache if it goes back far
+        enough.
+
+        Returns:
+            Deferred: A set of room_ids.
+        """
+        from_id = RoomStreamToken.parse_stream_token(from_key).stream
+
+        changed = self._room_stream_change_cache.get_entities_changed(
+            room_ids, from_id
+        )
+        if changed is not None:
+            defer.returnValue(changed)
+
+        def f(txn):
+            changed = set()
+            room_id_list = list(room_ids)
+            for i in xrange(0, len(room_id_list), SELECT_MANY_BATCH_SIZE):
+                batch = room_id_list[i:i + SELECT_MANY_BATCH_SIZE]
+                sql = (
+                    "SELECT DISTINCT room_id FROM events"
+                    " WHERE stream_ordering > ? AND outlier = ?"
+                    " AND room_id IN (%s)"
+                ) % (",".join("?" for _ in batch),)
+                txn.execute(sql, [from_id, False] + batch)
+                changed.update(row[0] for row in txn.fetchall())
+            return changed
+
+        changed = yield self.runInteraction("get_rooms_changed_since", f)
+        defer.returnValue(changed)
+
+    def get_last_event_ids_for_rooms(self, room_ids, end_token):
+        """Gets the event_id of the latest event in each of the given rooms at
+        the given stream token.
+
+        Returns:
+            Deferred: A dict mapping room_id to event_id. Rooms without any
+            events at the token are omitted.
+        """
+        end_token = RoomStreamToken.parse_stream_token(end_token)
+        room_ids = list(room_ids)
+
+        # Finds the events at the greatest topological ordering in each room,
+        # of which we want the one with the greatest stream ordering.
+        sql = (
+            "SELECT e.room_id, e.event_id, e.stream_ordering FROM events AS e"
+            " INNER JOIN ("
+            "  SELECT room_id,"
+            "   MAX(topological_ordering) AS topological_ordering"
+            "  FROM events"
+            "  WHERE room_id IN (%s) AND stream_ordering <= ? AND outlier = ?"
+            "  GROUP BY room_id"
+            " ) AS m USING (room_id, topological_ordering)"
+            " WHERE e.stream_ordering <= ? AND e.outlier = ?"
+        )
+
+        def f(txn):
+            results = {}
+            max_stream_orderings = {}
+            for i in range(0, len(room_ids), SELECT_MANY_BATCH_SIZE):
+                batch = room_ids[i:i + SELECT_MANY_BATCH_SIZE]
+                txn.execute(
+                    sql % (",".join(["?"] * len(batch)),),
+                    batch + [end_token.stream, False, end_token.stream, False]
+                )
+                for room_id, event_id, stream_ordering in txn.fetchall():
+                    prev = max_stream_orderings.get(room_id)
+                    if prev is None or stream_ordering > prev:
+                        max_stream_orderings[room_id] = stream_ordering
+                        results[room_id] = event_id
+            return results
+
+        return self.runInteraction("get_last_event_ids_for_rooms", f)
+
     @defer.inlineCallbacks
     def get_room_events_max_id(self, direction='f'):
         token = yield self._stream_id_gen.get_max_token(self)
@@ -18,6 +18,10 @@ from twisted.internet import defer, reactor
 
 from .logcontext import preserve_context_over_deferred
 
+from synapse.util import unwrapFirstError
+
+import collections
+
 
 def sleep(seconds):
     d = defer.Deferred()
@@ -48,7 +52,7 @@ class ObservableDeferred(object):
         object.__setattr__(self, "_observers", [])
 
         def callback(r):
-            self._result = (True, r)
+            object.__setattr__(self, "_result", (True, r))
             while self._observers:
                 try:
                     self._observers.pop().callback(r)
@@ -57,7 +61,7 @@ class ObservableDeferred(object):
             return r
 
         def errback(f):
-            self._result = (False, f)
+            object.__setattr__(self, "_result", (False, f))
             while self._observers:
                 try:
                     self._observers.pop().errback(f)
@@ -85,3 +89,78 @@ class ObservableDeferred(object):
 
     def __setattr__(self, name, value):
         setattr(self._deferred, name, value)
+
+
+def concurrently_map(func, args, limit, semaphore=None):
+    """Calls the function on each of the args, with at most `limit` calls in
+    progress at once.
+
+    Args:
+        func (callable): Takes a single argument and returns a Deferred or a
+            result.
+        args (iterable): The arguments to call the function with.
+        limit (int): The maximum number of calls in progress at once.
+        semaphore (twisted.internet.defer.DeferredSemaphore): If given, each
+            call also holds this while it is in progress, which can be used to
+            limit the total number of calls across several uses of this.
+    Returns:
+        Deferred: A list of the results, in the order of the args. Fails with
+        the first failure of any call.
+    Raises:
+        ValueError: if `limit` is less than 1.
+    """
+    if limit < 1:
+        raise ValueError("limit must be at least 1, not %r" % (limit,))
+
+    args = list(args)
+    results = [None] * len(args)
+    remaining = iter(enumerate(args))
+
+    @defer.inlineCallbacks
+    def worker():
+        for i, arg in remaining:
+            results[i] = yield _call_with_semaphore(func, arg, semaphore)
+
+    d = defer.gatherResults(
+        [worker() for _ in range(min(limit, len(args)))],
+        consumeErrors=True,
+    ).addErrback(unwrapFirstError)
+    d.addCallback(lambda _: results)
+    return d
+
+
+def concurrently_iterate(func, args, limit, semaphore=None):
+    """Like `concurrently_map`, but returns an iterator over Deferreds of the
+    results, in the order of the args.
+
+    Calls are started as the iterator is consumed, at most `limit` ahead of
+    the result most recently taken from it, so only that many results are
+    held at once however slowly they are consumed.
+    """
+    if limit < 1:
+        raise ValueError("limit must be at least 1, not %r" % (limit,))
+
+    args = iter(args)
+    pending = collections.deque()
+
+    try:
+        while True:
+            for arg in args:
+                pending.append(_call_with_semaphore(func, arg, semaphore))
+                if len(pending) >= limit:
+                    break
+
+            if not pending:
+                return
+
+            yield pending.popleft()
+    finally:
+        # Nobody is going to look at the results of these now.
+        for d in pending:
+            d.addErrback(lambda _: None)
+
+
+def _call_with_semaphore(func, arg, semaphore):
+    if semaphore is None:
+        return defer.maybeDeferred(func, arg)
+    return semaphore.run(func, arg)
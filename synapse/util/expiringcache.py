@@ -13,11 +13,27 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import synapse.metrics
+
+from collections import OrderedDict
+
 import logging
 
 
 logger = logging.getLogger(__name__)
 
+metrics = synapse.metrics.get_metrics_for(__name__)
+
+caches_by_name = {}
+cache_counter = metrics.register_cache(
+    "cache",
+    lambda: {(name,): len(cache) for name, cache in caches_by_name.items()},
+    labels=["name"],
+)
+eviction_counter = metrics.register_counter(
+    "evictions", labels=["name", "reason"],
+)
+
 
 class ExpiringCache(object):
     def __init__(self, cache_name, clock, max_len=0, expiry_ms=0,
@@ -45,7 +61,12 @@ class ExpiringCache(object):
 
         self._reset_expiry_on_get = reset_expiry_on_get
 
-        self._cache = {}
+        # Entries are kept in the order they were last set (or accessed, if
+        # reset_expiry_on_get is set), which is also the order of their
+        # timestamps. So the oldest entry is always at the front.
+        self._cache = OrderedDict()
+
+        caches_by_name[cache_name] = self._cache
 
     def start(self):
         if not self._expiry_ms:
@@ -59,23 +80,26 @@ class ExpiringCache(object):
 
     def __setitem__(self, key, value):
         now = self._clock.time_msec()
+        self._cache.pop(key, None)
         self._cache[key] = _CacheEntry(now, value)
 
         # Evict if there are now too many items
-        if self._max_len and len(self._cache.keys()) > self._max_len:
-            sorted_entries = sorted(
-                self._cache.items(),
-                key=lambda (k, v): v.time,
-            )
-
-            for k, _ in sorted_entries[self._max_len:]:
-                self._cache.pop(k)
+        while self._max_len and len(self._cache) > self._max_len:
+            self._cache.popitem(last=False)
+            eviction_counter.inc(self._cache_name, "size")
 
     def __getitem__(self, key):
-        entry = self._cache[key]
+        try:
+            entry = self._cache[key]
+            cache_counter.inc_hits(self._cache_name)
+        except KeyError:
+            cache_counter.inc_misses(self._cache_name)
+            raise
 
         if self._reset_expiry_on_get:
             entry.time = self._clock.time_msec()
+            del self._cache[key]
+            self._cache[key] = entry
 
         return entry.value
 
@@ -85,6 +109,9 @@ class ExpiringCache(object):
         except KeyError:
             return default
 
+    def __len__(self):
+        return len(self._cache)
+
     def _prune_cache(self):
         if not self._expiry_ms:
             # zero expiry time means don't expire. This should never get called
@@ -94,18 +121,22 @@ class ExpiringCache(object):
 
         now = self._clock.time_msec()
 
-        keys_to_delete = set()
+        keys_to_delete = []
 
-        for key, cache_entry in self._cache.items():
-            if now - cache_entry.time > self._expiry_ms:
-                keys_to_delete.add(key)
+        # The entries are in order of age, so we can stop at the first one
+        # that hasn't expired.
+        for key, cache_entry in self._cache.iteritems():
+            if now - cache_entry.time <= self._expiry_ms:
+                break
+            keys_to_delete.append(key)
 
         for k in keys_to_delete:
             self._cache.pop(k)
+            eviction_counter.inc(self._cache_name, "time")
 
         logger.debug(
             "[%s] _prune_cache before: %d, after len: %d",
-            self._cache_name, begin_length, len(self._cache.keys())
+            self._cache_name, begin_length, len(self._cache)
         )
 
 
@@ -61,6 +61,7 @@ class LockManager(object):
             Lock
         """
         new_deferred = defer.Deferred()
+        new_deferred.addCallback(self._released, key, new_deferred)
         old_deferred = self._lock_deferreds.get(key)
         self._lock_deferreds[key] = new_deferred
 
@@ -72,3 +73,9 @@ class LockManager(object):
             logger.debug("Entering uncontended lock for key=%r", key)
 
         defer.returnValue(Lock(new_deferred, key))
+
+    def _released(self, _, key, deferred):
+        # Forget the key if nobody else has queued on the lock since, so that
+        # we don't keep an entry for every key we have ever locked.
+        if self._lock_deferreds.get(key) is deferred:
+            del self._lock_deferreds[key]
@@ -19,12 +19,30 @@ import threading
 
 
 class LruCache(object):
-    """Least-recently-used cache."""
-    def __init__(self, max_size):
+    """Least-recently-used cache.
+
+    Args:
+        max_size (int): The maximum size of the cache. By default this is the
+            number of entries, but if `size_callback` is given it is the sum
+            of `size_callback(value)` over all the values in the cache.
+        size_callback (callable): Optional function that returns the size of
+            a value, e.g. `len`, used to bound the cache by the approximate
+            amount of memory it uses rather than by the number of entries.
+        evicted_callback (callable): Optional function that is called with
+            the number of entries evicted whenever the cache evicts entries to
+            stay within its maximum size.
+    """
+    def __init__(self, max_size, size_callback=None, evicted_callback=None):
         cache = {}
         list_root = []
         list_root[:] = [list_root, list_root, None, None]
 
+        # The current total size of the cache, if we have a size_callback, and
+        # the maximum size. Stored in lists so that the closures below can
+        # update them.
+        cached_size = [0]
+        max_size = [max_size]
+
         PREV, NEXT, KEY, VALUE = 0, 1, 2, 3
 
         lock = threading.Lock()
@@ -44,6 +62,8 @@ class LruCache(object):
             prev_node[NEXT] = node
             next_node[PREV] = node
             cache[key] = node
+            if size_callback:
+                cached_size[0] += size_callback(value)
 
         def move_node_to_front(node):
             prev_node = node[PREV]
@@ -63,6 +83,22 @@ class LruCache(object):
             prev_node[NEXT] = next_node
             next_node[PREV] = prev_node
             cache.pop(node[KEY], None)
+            if size_callback:
+                cached_size[0] -= size_callback(node[VALUE])
+
+        def current_size():
+            if size_callback:
+                return cached_size[0]
+            return len(cache)
+
+        def evict():
+            evicted = 0
+            while current_size() > max_size[0] and list_root[PREV] is not list_root:
+                delete_node(list_root[PREV])
+                evicted += 1
+
+            if evicted and evicted_callback:
+                evicted_callback(evicted)
 
         @synchronized
         def cache_get(key, default=None):
@@ -78,11 +114,13 @@ class LruCache(object):
             node = cache.get(key, None)
             if node is not None:
                 move_node_to_front(node)
+                if size_callback:
+                    cached_size[0] += size_callback(value)
+                    cached_size[0] -= size_callback(node[VALUE])
                 node[VALUE] = value
             else:
                 add_node(key, value)
-                if len(cache) > max_size:
-                    delete_node(list_root[PREV])
+            evict()
 
         @synchronized
         def cache_set_default(key, value):
@@ -91,8 +129,7 @@ class LruCache(object):
                 return node[VALUE]
             else:
                 add_node(key, value)
-                if len(cache) > max_size:
-                    delete_node(list_root[PREV])
+                evict()
                 return value
 
         @synchronized
@@ -109,15 +146,31 @@ class LruCache(object):
             list_root[NEXT] = list_root
             list_root[PREV] = list_root
             cache.clear()
+            cached_size[0] = 0
 
         @synchronized
         def cache_len():
-            return len(cache)
+            return current_size()
 
         @synchronized
         def cache_contains(key):
             return key in cache
 
+        @synchronized
+        def cache_set_max_size(new_max_size):
+            max_size[0] = new_max_size
+            evict()
+
+        @synchronized
+        def cache_sample(n):
+            # Returns up to n of the most recently used (key, value) pairs
+            items = []
+            node = list_root[NEXT]
+            while node is not list_root and len(items) < n:
+                items.append((node[KEY], node[VALUE]))
+                node = node[NEXT]
+            return items
+
         self.sentinel = object()
         self.get = cache_get
         self.set = cache_set
@@ -126,6 +179,8 @@ class LruCache(object):
         self.len = cache_len
         self.contains = cache_contains
         self.clear = cache_clear
+        self.set_max_size = cache_set_max_size
+        self.sample = cache_sample
 
     def __getitem__(self, key):
         result = self.get(key, self.sentinel)
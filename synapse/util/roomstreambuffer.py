@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015 OpenMarket Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict
+
+import bisect
+
+
+class RoomStreamBuffer(object):
+    """Keeps the stream orderings and event_ids of the most recent events
+    persisted in each room, so that requests for the events in a set of rooms
+    after a recent stream ordering can be answered without going to the
+    database.
+
+    Every event persisted after the first one added must also be added, in
+    any order, before its stream ordering is considered complete.
+
+    Args:
+        max_events_per_room (int): How many events to keep for each room.
+        max_rooms (int): How many rooms to keep events for. The rooms that have
+            gone the longest without an event are dropped first.
+        max_users (int): How many users to track membership changes for.
+    """
+
+    def __init__(self, max_events_per_room=100, max_rooms=10000,
+                 max_users=100000):
+        self._max_events_per_room = max_events_per_room
+        self._max_rooms = max_rooms
+        self._max_users = max_users
+
+        # room_id -> _RoomEvents
+        self._rooms = OrderedDict()
+
+        # user_id -> stream ordering of the latest membership event about the
+        # user.
+        self._memberships = OrderedDict()
+
+        # We have every event after this stream ordering, except those in rooms
+        # and for users that we have dropped. This is None until the first
+        # event is added.
+        self._start = None
+
+        # Any room or user we don't have an entry for has no events after
+        # these stream orderings.
+        self._dropped_rooms_bound = 0
+        self._dropped_users_bound = 0
+
+    def add_event(self, stream_ordering, room_id, event_id,
+                  membership_user_id=None):
+        """Adds a newly persisted event.
+
+        Args:
+            stream_ordering (int)
+            room_id (str)
+            event_id (str)
+            membership_user_id (str): The user the event changes the
+                membership of, if it is a membership event.
+        """
+        if self._start is None:
+            self._start = stream_ordering - 1
+
+        room = self._get_room(room_id)
+        bisect.insort(room.events, (stream_ordering, event_id))
+
+        if len(room.events) > self._max_events_per_room:
+            dropped, _ = room.events.pop(0)
+            room.lower_bound = max(room.lower_bound, dropped)
+
+        if membership_user_id:
+            self.add_membership_change(membership_user_id, stream_ordering)
+
+    def add_membership_change(self, user_id, stream_ordering):
+        """Records that the membership of the user has changed at the given
+        stream ordering.
+        """
+        latest = self._memberships.pop(user_id, stream_ordering)
+        self._memberships[user_id] = max(latest, stream_ordering)
+
+        while len(self._memberships) > self._max_users:
+            _, dropped = self._memberships.popitem(last=False)
+            self._dropped_users_bound = max(self._dropped_users_bound, dropped)
+
+    def invalidate_room(self, room_id, stream_ordering):
+        """Stops answering requests for events in the room from before the
+        given stream ordering, e.g. because an old event in the room was
+        changed.
+        """
+        room = self._get_room(room_id)
+        room.lower_bound = max(room.lower_bound, stream_ordering)
+
+    def get_events_for_rooms(self, room_ids, from_stream, to_stream):
+        """Gets the events in the given rooms with a stream ordering after
+        `from_stream` and up to and including `to_stream`.
+
+        Returns:
+            list: (stream_ordering, event_id) tuples, in order, or None if we
+            don't have all of the events requested.
+        """
+        if self._start is None or from_stream < self._start:
+            return None
+
+        results = []
+        for room_id in room_ids:
+            room = self._rooms.get(room_id)
+            if room is None:
+                if from_stream < self._dropped_rooms_bound:
+                    return None
+                continue
+
+            if from_stream < room.lower_bound:
+                return None
+
+            i = bisect.bisect_right(room.events, (from_stream, None))
+            for stream_ordering, event_id in room.events[i:]:
+                if stream_ordering > to_stream:
+                    break
+                if stream_ordering > from_stream:
+                    results.append((stream_ordering, event_id))
+
+        results.sort()
+        return results
+
+    def has_membership_changed(self, user_id, from_stream):
+        """Returns whether the membership of the user may have changed after
+        the given stream ordering.
+        """
+        if self._start is None or from_stream < self._start:
+            return True
+
+        latest = self._memberships.get(user_id)
+        if latest is None:
+            return from_stream < self._dropped_users_bound
+
+        return from_stream < latest
+
+    def _get_room(self, room_id):
+        """Gets the entry for the room, creating it if necessary, and marks it
+        as the most recently changed room.
+        """
+        room = self._rooms.pop(room_id, None)
+        if room is None:
+            room = _RoomEvents(max(self._start, self._dropped_rooms_bound))
+        self._rooms[room_id] = room
+
+        while len(self._rooms) > self._max_rooms:
+            _, dropped = self._rooms.popitem(last=False)
+            self._dropped_rooms_bound = max(
+                self._dropped_rooms_bound, dropped.latest()
+            )
+
+        return room
+
+    def __len__(self):
+        return len(self._rooms)
+
+
+class _RoomEvents(object):
+    def __init__(self, lower_bound):
+        # We have every event in the room after this stream ordering.
+        self.lower_bound = lower_bound
+
+        # Sorted list of (stream_ordering, event_id)
+        self.events = []
+
+    def latest(self):
+        if self.events:
+            return max(self.lower_bound, self.events[-1][0])
+        return self.lower_bound
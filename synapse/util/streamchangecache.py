@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015 OpenMarket Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict
+
+
+class StreamChangeCache(object):
+    """Keeps track of the stream position at which each entity (e.g. a room)
+    last changed, so that we can tell which entities have changed since a
+    given stream position without going to the database.
+
+    Every change after the first one reported must also be reported, in any
+    order, before its stream position is considered complete.
+
+    Args:
+        name (str): Name of this cache, used for logging.
+        max_size (int): How many entities to keep track of. The entities that
+            have gone the longest without changing are dropped first.
+    """
+
+    def __init__(self, name, max_size=10000):
+        self._name = name
+        self._max_size = max_size
+
+        # entity -> stream position of its latest change, in roughly the
+        # order they changed.
+        self._entity_to_pos = OrderedDict()
+
+        # We know about every change after this stream position. This is None
+        # until the first change is reported.
+        self._earliest_known_pos = None
+
+    def entity_has_changed(self, entity, stream_pos):
+        """Reports that the entity changed at the given stream position.
+        """
+        if self._earliest_known_pos is None:
+            self._earliest_known_pos = stream_pos - 1
+
+        latest = self._entity_to_pos.pop(entity, stream_pos)
+        self._entity_to_pos[entity] = max(latest, stream_pos)
+
+        while len(self._entity_to_pos) > self._max_size:
+            _, dropped = self._entity_to_pos.popitem(last=False)
+            self._earliest_known_pos = max(self._earliest_known_pos, dropped)
+
+    def has_entity_changed(self, entity, stream_pos):
+        """Returns whether the entity may have changed after the given stream
+        position.
+        """
+        if not self.knows_changes_since(stream_pos):
+            return True
+
+        return stream_pos < self._entity_to_pos.get(entity, stream_pos)
+
+    def get_entities_changed(self, entities, stream_pos):
+        """Returns the subset of the given entities that may have changed after
+        the given stream position, or None if we don't know which entities
+        have changed since then.
+        """
+        if not self.knows_changes_since(stream_pos):
+            return None
+
+        return set(
+            entity for entity in entities
+            if stream_pos < self._entity_to_pos.get(entity, stream_pos)
+        )
+
+    def knows_changes_since(self, stream_pos):
+        """Returns whether we know about every change after the given stream
+        position.
+        """
+        return (
+            self._earliest_known_pos is not None
+            and stream_pos >= self._earliest_known_pos
+        )
+
+    def __len__(self):
+        return len(self._entity_to_pos)
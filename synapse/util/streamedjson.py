@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015 OpenMarket Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from synapse.util.logcontext import LoggingContext, PreserveLoggingContext
+
+
+class StreamedJsonList(object):
+    """A list in a JSON response whose items are only worked out as the
+    response is written to the client, so that we don't have to hold all of
+    them in memory at once.
+
+    A response containing one of these is sent with chunked transfer encoding
+    by `synapse.http.server.respond_with_json`, and we only work out the next
+    item once the client has kept up with what we've sent so far.
+
+    The items are worked out after the handler that made the list has
+    returned, so they are taken from the iterable in the logging context the
+    list was made in. That way their database queries and log lines are still
+    attributed to the request.
+
+    Args:
+        items (iterable): The items of the list, or Deferreds that resolve to
+            them. This is iterated over lazily, so can be a generator that
+            does the work for each item as it is needed. Items must not contain
+            any `StreamedJsonList`s themselves.
+    """
+
+    def __init__(self, items):
+        self.items = items
+        self.logging_context = LoggingContext.current_context()
+
+    def __iter__(self):
+        items = iter(self.items)
+        while True:
+            with PreserveLoggingContext():
+                LoggingContext.thread_local.current_context = (
+                    self.logging_context
+                )
+                try:
+                    item = next(items)
+                except StopIteration:
+                    return
+            yield item
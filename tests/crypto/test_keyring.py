@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015 OpenMarket Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from tests import unittest
+from twisted.internet import defer
+
+from synapse.api.errors import SynapseError
+from synapse.crypto.keyring import (
+    Keyring, VERIFY_KEY_CACHE_MS, KEY_FETCH_FAILURE_CACHE_MS,
+)
+
+from tests.utils import MockClock
+
+from mock import Mock, patch
+
+
+def make_verify_key(key_id):
+    alg, version = key_id.split(":")
+    return Mock(alg=alg, version=version)
+
+
+class KeyringTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = MockClock()
+        self.store = Mock(spec=[
+            "get_server_verify_keys",
+            "get_server_keys_json",
+        ])
+        self.store.get_server_verify_keys.return_value = defer.succeed([])
+        self.store.get_server_keys_json.return_value = defer.succeed({})
+
+        config = Mock()
+        config.perspectives = {}
+        config.cache_factor = 1.0
+        config.cache_sizes = {"verify_key_cache": 2}
+
+        hs = Mock()
+        hs.get_datastore.return_value = self.store
+        hs.get_clock.return_value = self.clock
+        hs.get_config.return_value = config
+
+        self.keyring = Keyring(hs)
+
+        self.key_a = make_verify_key("ed25519:a")
+        self.key_b = make_verify_key("ed25519:b")
+
+        self.downloads = []
+
+        def get_server_verify_key_impl(server_name, key_ids):
+            d = defer.Deferred()
+            self.downloads.append((server_name, key_ids, d))
+            return d
+
+        self.keyring._get_server_verify_key_impl = get_server_verify_key_impl
+
+    def advance_ms(self, ms):
+        self.clock.advance_time(ms / 1000.)
+
+    def test_cache_hit(self):
+        self.keyring._cache_verify_keys("remote", {"ed25519:a": self.key_a})
+
+        d = self.keyring.get_server_verify_key("remote", ["ed25519:a"])
+
+        self.assertIs(self.key_a, self.successResultOf(d))
+        self.assertFalse(self.store.get_server_verify_keys.called)
+
+    def test_cache_expiry(self):
+        valid_until_ms = self.clock.time_msec() + 1000
+        self.keyring._cache_verify_keys(
+            "remote", {"ed25519:a": self.key_a}, valid_until_ms
+        )
+
+        self.advance_ms(2000)
+
+        self.keyring.get_server_verify_key("remote", ["ed25519:a"])
+
+        self.store.get_server_verify_keys.assert_called_once_with(
+            "remote", ["ed25519:a"]
+        )
+        self.assertEquals(1, len(self.downloads))
+
+    def test_cache_expiry_without_valid_until(self):
+        self.keyring._cache_verify_keys("remote", {"ed25519:a": self.key_a})
+
+        self.advance_ms(VERIFY_KEY_CACHE_MS - 1)
+        d = self.keyring.get_server_verify_key("remote", ["ed25519:a"])
+        self.assertIs(self.key_a, self.successResultOf(d))
+
+        self.advance_ms(2)
+        self.keyring.get_server_verify_key("remote", ["ed25519:a"])
+        self.assertEquals(1, len(self.downloads))
+
+    def test_stored_key_validity(self):
+        valid_until_ms = self.clock.time_msec() + 1000
+        self.store.get_server_verify_keys.return_value = defer.succeed(
+            [self.key_a]
+        )
+        self.store.get_server_keys_json.return_value = defer.succeed({
+            ("remote", "ed25519:a", None): [
+                {"ts_valid_until_ms": valid_until_ms},
+            ],
+        })
+
+        d = self.keyring.get_server_verify_key("remote", ["ed25519:a"])
+        self.assertIs(self.key_a, self.successResultOf(d))
+
+        # The key is served from memory until the stored key JSON expires.
+        d = self.keyring.get_server_verify_key("remote", ["ed25519:a"])
+        self.assertIs(self.key_a, self.successResultOf(d))
+        self.assertEquals(1, self.store.get_server_verify_keys.call_count)
+
+        self.advance_ms(2000)
+
+        self.keyring.get_server_verify_key("remote", ["ed25519:a"])
+        self.assertEquals(2, self.store.get_server_verify_keys.call_count)
+
+    def test_cache_bounded(self):
+        key_c = make_verify_key("ed25519:c")
+        self.keyring._cache_verify_keys("remote", {"ed25519:a": self.key_a})
+        self.keyring._cache_verify_keys("remote", {"ed25519:b": self.key_b})
+        self.keyring._cache_verify_keys("remote", {"ed25519:c": key_c})
+
+        self.assertEquals(2, len(self.keyring.verify_key_cache))
+
+        # The least recently used key was evicted.
+        self.keyring.get_server_verify_key("remote", ["ed25519:a"])
+        self.assertEquals(1, len(self.downloads))
+
+        d = self.keyring.get_server_verify_key("remote", ["ed25519:c"])
+        self.assertIs(key_c, self.successResultOf(d))
+
+    def test_failed_fetch_cached(self):
+        d = self.keyring.get_server_verify_key("remote", ["ed25519:a"])
+        self.downloads[0][2].errback(ValueError("No key"))
+        self.failureResultOf(d, ValueError)
+
+        # We don't ask again for a key we recently failed to fetch...
+        d = self.keyring.get_server_verify_key("remote", ["ed25519:a"])
+        self.failureResultOf(d, ValueError)
+        self.assertEquals(1, len(self.downloads))
+
+        # ... but do ask for a different key of the same server...
+        self.keyring.get_server_verify_key("remote", ["ed25519:b"])
+        self.assertEquals(2, len(self.downloads))
+        self.assertEquals(["ed25519:b"], self.downloads[1][1])
+
+        # ... and for the failed key once the failure has expired.
+        self.advance_ms(KEY_FETCH_FAILURE_CACHE_MS)
+        self.keyring.get_server_verify_key("remote", ["ed25519:a"])
+        self.assertEquals(3, len(self.downloads))
+
+    def test_concurrent_fetches_shared(self):
+        d1 = self.keyring.get_server_verify_key("remote", ["ed25519:a"])
+        d2 = self.keyring.get_server_verify_key("remote", ["ed25519:a"])
+        d3 = self.keyring.get_server_verify_key("remote", ["ed25519:b"])
+
+        self.assertEquals(2, len(self.downloads))
+
+        self.downloads[0][2].callback(self.key_a)
+        self.downloads[1][2].callback(self.key_b)
+
+        self.assertIs(self.key_a, self.successResultOf(d1))
+        self.assertIs(self.key_a, self.successResultOf(d2))
+        self.assertIs(self.key_b, self.successResultOf(d3))
+
+
+def fake_verify_signed_json(json_object, signature_name, verify_key):
+    """Treats the signature as valid if it is "good"."""
+    key_id = "%s:%s" % (verify_key.alg, verify_key.version)
+    if json_object["signatures"][signature_name][key_id] != "good":
+        raise Exception("Bad signature")
+
+
+def make_signed_json(server_name, key_id, signature, **kwargs):
+    json_object = dict(kwargs)
+    json_object["signatures"] = {server_name: {key_id: signature}}
+    return json_object
+
+
+class VerifyJsonTestCase(unittest.TestCase):
+
+    def setUp(self):
+        hs = Mock()
+        hs.get_config.return_value.perspectives = {}
+        hs.get_config.return_value.cache_factor = 1.0
+        hs.get_config.return_value.cache_sizes = {}
+        self.keyring = Keyring(hs)
+
+        self.verify_keys = {
+            "red": make_verify_key("ed25519:red"),
+            "blue": make_verify_key("ed25519:blue"),
+        }
+
+        def get_server_verify_key(server_name, key_ids):
+            if server_name not in self.verify_keys:
+                return defer.fail(ValueError("No key"))
+            return defer.succeed(self.verify_keys[server_name])
+
+        self.keyring.get_server_verify_key = Mock(
+            side_effect=get_server_verify_key
+        )
+
+        patcher = patch(
+            "synapse.crypto.keyring.verify_signed_json",
+            fake_verify_signed_json,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @defer.inlineCallbacks
+    def assert_results(self, deferreds, expected):
+        """Checks which of the Deferreds succeed, and that the rest fail with
+        a SynapseError.
+        """
+        results = yield defer.DeferredList(deferreds, consumeErrors=True)
+        for (success, result), expect_success in zip(results, expected):
+            self.assertEquals(expect_success, success)
+            if not success:
+                result.trap(SynapseError)
+
+    @defer.inlineCallbacks
+    def test_mixed_signatures(self):
+        deferreds = self.keyring.verify_json_objects_for_server([
+            ("red", make_signed_json("red", "ed25519:red", "good", n=1)),
+            ("red", make_signed_json("red", "ed25519:red", "bad", n=2)),
+            ("red", make_signed_json("red", "ed25519:red", "good", n=3)),
+        ])
+
+        yield self.assert_results(deferreds, [True, False, True])
+
+        self.keyring.get_server_verify_key.assert_called_once_with(
+            "red", ["ed25519:red"]
+        )
+
+    @defer.inlineCallbacks
+    def test_several_servers(self):
+        deferreds = self.keyring.verify_json_objects_for_server([
+            ("red", make_signed_json("red", "ed25519:red", "good", n=1)),
+            ("blue", make_signed_json("blue", "ed25519:blue", "good", n=2)),
+            ("red", make_signed_json("red", "ed25519:red", "good", n=3)),
+            ("blue", make_signed_json("blue", "ed25519:blue", "bad", n=4)),
+        ])
+
+        yield self.assert_results(deferreds, [True, True, True, False])
+
+        self.assertEquals(2, self.keyring.get_server_verify_key.call_count)
+
+    @defer.inlineCallbacks
+    def test_missing_key(self):
+        deferreds = self.keyring.verify_json_objects_for_server([
+            ("red", make_signed_json("red", "ed25519:red", "good", n=1)),
+            ("green", make_signed_json("green", "ed25519:g", "good", n=2)),
+            ("green", make_signed_json("green", "ed25519:g", "good", n=3)),
+            ("red", make_signed_json("red", "ed25519:red", "good", n=4)),
+        ])
+
+        yield self.assert_results(deferreds, [True, False, False, True])
+
+    @defer.inlineCallbacks
+    def test_unsigned(self):
+        deferreds = self.keyring.verify_json_objects_for_server([
+            ("red", make_signed_json("red", "ed25519:red", "good", n=1)),
+            ("red", {"n": 2}),
+        ])
+
+        yield self.assert_results(deferreds, [True, False])
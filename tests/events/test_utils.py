@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015 OpenMarket Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from tests import unittest
+
+from syutil.jsonutil import encode_canonical_json
+
+from synapse.events import FrozenEvent
+from synapse.events.utils import serialize_event, serialize_client_event
+from synapse.http.server import encode_json_with_client_events
+
+import json
+
+
+def make_event(**kwargs):
+    d = {
+        "event_id": "$event:test",
+        "type": "m.room.message",
+        "room_id": "!room:test",
+        "sender": "@user:test",
+        "content": {"body": u"café"},
+        "unsigned": {"age_ts": 1000},
+    }
+    d.update(kwargs)
+    return FrozenEvent(d)
+
+
+class ClientEventTestCase(unittest.TestCase):
+
+    def assert_same_encoding(self, event, time_now):
+        self.assertEquals(
+            encode_canonical_json(serialize_event(event, time_now)),
+            serialize_client_event(event, time_now).encode_json(),
+        )
+
+    def test_encode_json(self):
+        event = make_event()
+
+        self.assert_same_encoding(event, 1500)
+
+        # The second time uses the encoding cached on the event.
+        self.assert_same_encoding(event, 2500)
+
+    def test_encode_json_without_age(self):
+        self.assert_same_encoding(make_event(unsigned={}), 1500)
+
+    def test_encode_json_after_change(self):
+        client_event = serialize_client_event(make_event(), 1500)
+        client_event["content"] = {"body": "changed"}
+
+        self.assertEquals(
+            {"body": "changed"},
+            json.loads(client_event.encode_json())["content"],
+        )
+
+    def test_serialize_event_does_not_change_event(self):
+        event = make_event()
+        serialize_event(event, 1500)
+
+        self.assertEquals({"age_ts": 1000}, event.unsigned)
+
+    def test_encode_response(self):
+        events = [
+            make_event(event_id="$event%d:test" % (i,)) for i in range(3)
+        ]
+        response = {
+            "chunk": [serialize_event(e, 1500) for e in events],
+            "end": "s1",
+        }
+        client_response = {
+            "chunk": [serialize_client_event(e, 1500) for e in events],
+            "end": "s1",
+        }
+
+        self.assertEquals(
+            encode_canonical_json(response),
+            encode_json_with_client_events(client_response),
+        )
+
+    def test_encode_response_non_canonical(self):
+        events = [
+            make_event(event_id="$event%d:test" % (i,)) for i in range(3)
+        ]
+        response = {
+            "chunk": [serialize_event(e, 1500) for e in events],
+            "end": "s1",
+        }
+        client_response = {
+            "chunk": [serialize_client_event(e, 1500) for e in events],
+            "end": "s1",
+        }
+
+        self.assertEquals(
+            json.loads(encode_canonical_json(response)),
+            json.loads(encode_json_with_client_events(
+                client_response, canonical=False
+            )),
+        )
@@ -19,6 +19,8 @@ from tests import unittest
 # python imports
 from mock import Mock, ANY
 
+import json
+
 from ..utils import MockHttpResource, MockClock, setup_test_homeserver
 
 from synapse.federation import initialize_http_replication
@@ -51,10 +53,14 @@ class FederationTestCase(unittest.TestCase):
             "set_received_txn_response",
             "get_destination_retry_timings",
             "get_auth_chain",
+            "get_events",
         ])
         self.mock_persistence.get_received_txn_response.return_value = (
             defer.succeed(None)
         )
+        self.mock_persistence.get_events.side_effect = (
+            lambda event_ids, allow_rejected: defer.succeed([])
+        )
 
         retry_timings_res = {
             "destination": "",
@@ -299,3 +305,119 @@ class FederationTestCase(unittest.TestCase):
         recv_handler.assert_called_with(
             {"three": "3", "four": "4"}
         )
+
+    @defer.inlineCallbacks
+    def test_recv_pdus_by_room(self):
+        pdus = [
+            {
+                "event_id": "$%s:red" % (name,),
+                "origin": "red",
+                "user_id": "@a:red",
+                "room_id": room_id,
+                "type": "m.text",
+                "origin_server_ts": 123456789001,
+                "depth": 1,
+                "content": {},
+                "prev_events": [],
+            }
+            for name, room_id in [("a1", "!a:red"), ("b1", "!b:red"),
+                                  ("a2", "!a:red")]
+        ]
+
+        self.federation._check_sigs_and_hashes = lambda pdus: [
+            defer.succeed(pdu) for pdu in pdus
+        ]
+
+        handled = {}
+
+        def handle_new_pdu(origin, pdu, checked_pdu=None):
+            handled[pdu.event_id] = defer.Deferred()
+            return handled[pdu.event_id]
+
+        self.federation._handle_new_pdu = handle_new_pdu
+
+        d = self.mock_resource.trigger(
+            "PUT",
+            "/_matrix/federation/v1/send/1002000/",
+            json.dumps({
+                "origin": "red",
+                "origin_server_ts": 1002000,
+                "pdus": pdus,
+            })
+        )
+
+        # The first PDU of each room is handled at once, but the second PDU
+        # of "!a:red" waits for the first.
+        self.assertEquals(set(["$a1:red", "$b1:red"]), set(handled))
+
+        handled["$b1:red"].callback(None)
+        self.assertEquals(set(["$a1:red", "$b1:red"]), set(handled))
+
+        handled["$a1:red"].callback(None)
+        self.assertIn("$a2:red", handled)
+        self.assertFalse(d.called)
+
+        handled["$a2:red"].errback(Exception("Bad PDU"))
+
+        code, response = yield d
+        self.assertEquals(200, code)
+        self.assertEquals({
+            "$a1:red": {},
+            "$b1:red": {},
+            "$a2:red": {"error": "Bad PDU"},
+        }, response["pdus"])
+
+    @defer.inlineCallbacks
+    def test_recv_pdus_skips_checking_seen(self):
+        pdus = [
+            {
+                "event_id": "$%s:red" % (name,),
+                "origin": "red",
+                "user_id": "@a:red",
+                "room_id": "!a:red",
+                "type": "m.text",
+                "origin_server_ts": 123456789001,
+                "depth": 1,
+                "content": {},
+                "prev_events": [],
+            }
+            for name in ["seen", "outlier", "new"]
+        ]
+
+        def get_events(event_ids, allow_rejected):
+            seen = make_pdu(event_id="$seen:red")
+            outlier = make_pdu(event_id="$outlier:red")
+            outlier.internal_metadata.outlier = True
+            return defer.succeed([seen, outlier])
+        self.mock_persistence.get_events.side_effect = get_events
+
+        checked = []
+
+        def check_sigs_and_hashes(pdus):
+            checked.extend(pdu.event_id for pdu in pdus)
+            return [defer.succeed(pdu) for pdu in pdus]
+        self.federation._check_sigs_and_hashes = check_sigs_and_hashes
+
+        checked_pdus = {}
+
+        def handle_new_pdu(origin, pdu, checked_pdu=None):
+            checked_pdus[pdu.event_id] = checked_pdu
+            return defer.succeed(None)
+        self.federation._handle_new_pdu = handle_new_pdu
+
+        code, response = yield self.mock_resource.trigger(
+            "PUT",
+            "/_matrix/federation/v1/send/1003000/",
+            json.dumps({
+                "origin": "red",
+                "origin_server_ts": 1003000,
+                "pdus": pdus,
+            })
+        )
+
+        self.assertEquals(200, code)
+        self.assertEquals(["$outlier:red", "$new:red"], checked)
+        self.assertIsNone(checked_pdus["$seen:red"])
+        self.assertEquals(
+            "$new:red", checked_pdus["$new:red"].event_id
+        )
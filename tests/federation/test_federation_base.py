@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015 OpenMarket Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from tests import unittest
+from twisted.internet import defer
+
+from synapse.api.errors import SynapseError
+from synapse.crypto.event_signing import compute_content_hash
+from synapse.crypto.keyring import Keyring
+from synapse.events import FrozenEvent
+from synapse.federation.federation_base import FederationBase
+
+from syutil.base64util import encode_base64
+
+from tests.crypto.test_keyring import fake_verify_signed_json, make_verify_key
+
+from mock import Mock, patch
+
+import hashlib
+
+
+def make_pdu(origin, signature, n, tamper=False):
+    """Makes a PDU with a valid content hash, signed by `origin` with the
+    given signature, which `fake_verify_signed_json` accepts if it is "good".
+    """
+    pdu_json = {
+        "event_id": "$%d:%s" % (n, origin),
+        "type": "m.room.message",
+        "room_id": "!room:red",
+        "sender": "@user:%s" % (origin,),
+        "origin": origin,
+        "content": {"body": "Message %d" % (n,)},
+        "prev_events": [],
+        "auth_events": [],
+        "depth": n,
+    }
+
+    name, digest = compute_content_hash(
+        FrozenEvent(pdu_json), hashlib.sha256
+    )
+    pdu_json["hashes"] = {name: encode_base64(digest)}
+    pdu_json["signatures"] = {
+        origin: {"ed25519:%s" % (origin,): signature},
+    }
+
+    if tamper:
+        pdu_json["content"] = {"body": "Tampered"}
+
+    return FrozenEvent(pdu_json)
+
+
+class CheckSigsAndHashesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        hs = Mock()
+        hs.get_config.return_value.perspectives = {}
+        hs.get_config.return_value.cache_factor = 1.0
+        hs.get_config.return_value.cache_sizes = {}
+
+        keyring = Keyring(hs)
+
+        verify_keys = {
+            "red": make_verify_key("ed25519:red"),
+            "blue": make_verify_key("ed25519:blue"),
+        }
+
+        def get_server_verify_key(server_name, key_ids):
+            if server_name not in verify_keys:
+                return defer.fail(ValueError("No key"))
+            return defer.succeed(verify_keys[server_name])
+
+        keyring.get_server_verify_key = Mock(side_effect=get_server_verify_key)
+
+        self.federation = FederationBase()
+        self.federation.keyring = keyring
+
+        patcher = patch(
+            "synapse.crypto.keyring.verify_signed_json",
+            fake_verify_signed_json,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @defer.inlineCallbacks
+    def check(self, pdus):
+        results = yield defer.DeferredList(
+            self.federation._check_sigs_and_hashes(pdus),
+            consumeErrors=True,
+        )
+
+        checked = []
+        for success, result in results:
+            if success:
+                checked.append(result)
+            else:
+                result.trap(SynapseError)
+                checked.append(None)
+
+        defer.returnValue(checked)
+
+    @defer.inlineCallbacks
+    def test_only_bad_signatures_rejected(self):
+        pdus = [
+            make_pdu("red", "good", 1),
+            make_pdu("red", "bad", 2),
+            make_pdu("blue", "good", 3),
+            make_pdu("blue", "bad", 4),
+            make_pdu("red", "good", 5),
+        ]
+
+        checked = yield self.check(pdus)
+
+        self.assertEquals(
+            [pdus[0], None, pdus[2], None, pdus[4]], checked
+        )
+        self.assertEquals(
+            2, self.federation.keyring.get_server_verify_key.call_count
+        )
+
+    @defer.inlineCallbacks
+    def test_missing_key(self):
+        pdus = [
+            make_pdu("red", "good", 1),
+            make_pdu("green", "good", 2),
+            make_pdu("blue", "good", 3),
+        ]
+
+        checked = yield self.check(pdus)
+
+        self.assertEquals([pdus[0], None, pdus[2]], checked)
+
+    @defer.inlineCallbacks
+    def test_tampered_content_redacted(self):
+        pdus = [
+            make_pdu("red", "good", 1),
+            make_pdu("red", "good", 2, tamper=True),
+        ]
+
+        checked = yield self.check(pdus)
+
+        self.assertIs(pdus[0], checked[0])
+        self.assertEquals(pdus[1].event_id, checked[1].event_id)
+        self.assertNotIn("body", checked[1].content)
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015 OpenMarket Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from tests import unittest
+from twisted.internet import defer
+
+from mock import Mock, patch
+
+from synapse.api.constants import EventTypes, Membership
+from synapse.api.filtering import Filter
+from synapse.handlers.sync import SyncConfig
+from synapse.types import StreamToken, UserID, RoomID
+
+from ..utils import setup_test_homeserver
+
+
+class SyncTestCase(unittest.TestCase):
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        hs = yield setup_test_homeserver(
+            resource_for_federation=Mock(),
+            http_client=None,
+        )
+
+        self.store = hs.get_datastore()
+        self.event_builder_factory = hs.get_event_builder_factory()
+        self.message_handler = hs.get_handlers().message_handler
+        self.sync_handler = hs.get_handlers().sync_handler
+
+        self.u_alice = UserID.from_string("@alice:test")
+        self.u_bob = UserID.from_string("@bob:test")
+
+        self.room1 = RoomID.from_string("!abc123:test")
+        self.room2 = RoomID.from_string("!xyx987:test")
+        self.room3 = RoomID.from_string("!qwe456:test")
+
+        self.sync_config = SyncConfig(
+            user=self.u_alice,
+            client_info=Mock(),
+            limit=1,
+            gap=True,
+            sort="timeline,asc",
+            backfill=False,
+            filter=Filter({}),
+        )
+
+    @defer.inlineCallbacks
+    def inject_event(self, room, etype, content, sender=None, state_key=None):
+        event_dict = {
+            "type": etype,
+            "sender": (sender or self.u_alice).to_string(),
+            "room_id": room.to_string(),
+            "content": content,
+        }
+        if state_key is not None:
+            event_dict["state_key"] = state_key
+
+        builder = self.event_builder_factory.new(event_dict)
+
+        event, context = yield self.message_handler._create_new_client_event(
+            builder
+        )
+
+        yield self.store.persist_event(event, context)
+
+        defer.returnValue(event)
+
+    @defer.inlineCallbacks
+    def inject_forked_events(self, room, event_dicts):
+        """Persists events that all have the current forward extremities of
+        the room as their prev_events, so that they fork the room.
+        """
+        created = []
+        for event_dict in event_dicts:
+            event_dict = dict(event_dict, room_id=room.to_string())
+            builder = self.event_builder_factory.new(event_dict)
+            created.append((
+                yield self.message_handler._create_new_client_event(builder)
+            ))
+
+        for event, context in created:
+            yield self.store.persist_event(event, context)
+
+        defer.returnValue([event for event, _ in created])
+
+    def inject_join(self, room, user):
+        return self.inject_event(
+            room, EventTypes.Member, {"membership": Membership.JOIN},
+            sender=user, state_key=user.to_string(),
+        )
+
+    def inject_message(self, room):
+        return self.inject_event(
+            room, EventTypes.Message, {"body": "hello", "msgtype": "message"}
+        )
+
+    @defer.inlineCallbacks
+    def get_token(self):
+        room_key = yield self.store.get_room_events_max_id()
+        defer.returnValue(StreamToken(room_key, "0", "0"))
+
+    @defer.inlineCallbacks
+    def compute_state_delta(self, room, since_token):
+        """Works out the state delta of the room the way it was done before
+        `get_state_deltas`.
+        """
+        state_handler = self.sync_handler.state_handler
+        current_state = yield state_handler.get_current_state(room.to_string())
+        previous_state = yield self.sync_handler.get_state_at_previous_sync(
+            room.to_string(), since_token=since_token,
+        )
+        delta = self.sync_handler.compute_state_delta(
+            since_token=since_token,
+            previous_state=previous_state,
+            current_state=current_state.values(),
+        )
+        defer.returnValue(delta)
+
+    @defer.inlineCallbacks
+    def test_state_deltas_match_computed(self):
+        yield self.inject_join(self.room1, self.u_alice)
+        yield self.inject_event(
+            self.room1, EventTypes.Name, {"name": "Old name"}, state_key="",
+        )
+        yield self.inject_join(self.room3, self.u_alice)
+
+        since_token = yield self.get_token()
+
+        yield self.inject_event(
+            self.room1, EventTypes.Name, {"name": "New name"}, state_key="",
+        )
+        yield self.inject_join(self.room1, self.u_bob)
+        yield self.inject_message(self.room1)
+
+        # A room with no events before the since token.
+        yield self.inject_join(self.room2, self.u_alice)
+        yield self.inject_event(
+            self.room2, EventTypes.Topic, {"topic": "Topic"}, state_key="",
+        )
+
+        now_token = yield self.get_token()
+
+        rooms = [self.room1, self.room2, self.room3]
+
+        deltas = yield self.sync_handler.get_state_deltas(
+            [room.to_string() for room in rooms], since_token, now_token,
+        )
+
+        for room in rooms:
+            expected = yield self.compute_state_delta(room, since_token)
+            self.assertItemsEqual(
+                [e.event_id for e in expected],
+                [e.event_id for e in deltas[room.to_string()]],
+            )
+
+        self.assertEquals(2, len(deltas[self.room1.to_string()]))
+        self.assertEquals(2, len(deltas[self.room2.to_string()]))
+        self.assertEquals([], deltas[self.room3.to_string()])
+
+    @defer.inlineCallbacks
+    def test_unchanged_rooms_skipped(self):
+        yield self.inject_join(self.room1, self.u_alice)
+        yield self.inject_join(self.room2, self.u_alice)
+        yield self.inject_join(self.room3, self.u_alice)
+
+        since_token = yield self.get_token()
+
+        # More events than the limit, so that we sync with a gap.
+        yield self.inject_message(self.room1)
+        yield self.inject_message(self.room1)
+
+        typing = {
+            "type": "m.typing",
+            "room_id": self.room2.to_string(),
+            "content": {"user_ids": [self.u_bob.to_string()]},
+        }
+
+        sources = self.sync_handler.event_sources.sources
+        get_typing = Mock(return_value=defer.succeed(([typing], 1)))
+        get_presence = Mock(return_value=defer.succeed(([], 0)))
+
+        with patch.object(
+            sources["typing"], "get_new_events_for_user", get_typing
+        ), patch.object(
+            sources["presence"], "get_new_events_for_user", get_presence
+        ), patch.object(
+            self.sync_handler, "incremental_sync_with_gap_for_room",
+            wraps=self.sync_handler.incremental_sync_with_gap_for_room,
+        ) as sync_room:
+            result = yield self.sync_handler.incremental_sync_with_gap(
+                self.sync_config, since_token,
+            )
+
+        self.assertEquals(
+            [self.room1.to_string()],
+            [args[0][0] for args in sync_room.call_args_list],
+        )
+
+        rooms = {room.room_id: room for room in result.rooms}
+
+        self.assertItemsEqual(
+            [self.room1.to_string(), self.room2.to_string()], rooms.keys()
+        )
+
+        self.assertTrue(rooms[self.room1.to_string()].events)
+
+        room2 = rooms[self.room2.to_string()]
+        self.assertEquals([], room2.events)
+        self.assertEquals([], room2.state)
+        self.assertEquals(
+            [{
+                "type": "m.typing",
+                "content": {"user_ids": [self.u_bob.to_string()]},
+            }],
+            room2.ephemeral,
+        )
+
+    @defer.inlineCallbacks
+    def test_forked_room_state_resolved(self):
+        yield self.inject_join(self.room1, self.u_alice)
+
+        since_token = yield self.get_token()
+
+        bob_join, name = yield self.inject_forked_events(self.room1, [
+            {
+                "type": EventTypes.Member,
+                "sender": self.u_bob.to_string(),
+                "state_key": self.u_bob.to_string(),
+                "content": {"membership": Membership.JOIN},
+            },
+            {
+                "type": EventTypes.Name,
+                "sender": self.u_alice.to_string(),
+                "state_key": "",
+                "content": {"name": "Name"},
+            },
+        ])
+
+        extremities = yield self.store.get_latest_event_ids_in_room(
+            self.room1.to_string()
+        )
+        self.assertEquals(2, len(extremities))
+
+        now_token = yield self.get_token()
+
+        # The state of the last event of the room is only one side of the
+        # fork, so we can't use it.
+        deltas = yield self.sync_handler.get_state_deltas(
+            [self.room1.to_string()], since_token, now_token,
+        )
+        self.assertEquals({}, deltas)
+
+        state_ids = yield self.sync_handler.get_state_ids_at(
+            [self.room1.to_string()], now_token,
+        )
+        self.assertEquals({}, state_ids)
+
+        room_sync = yield self.sync_handler.initial_sync_for_room(
+            self.room1.to_string(), self.sync_config, now_token, set(),
+        )
+        state_event_ids = [e.event_id for e in room_sync.state]
+        self.assertIn(bob_join.event_id, state_event_ids)
+        self.assertIn(name.event_id, state_event_ids)
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015 OpenMarket Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from tests import unittest
+from twisted.internet import defer
+
+from mock import Mock
+
+from synapse.http.server import respond_with_json
+from synapse.util.logcontext import LoggingContext
+from synapse.util.streamedjson import StreamedJsonList
+
+import json
+
+
+class StreamedJsonResponseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.written = []
+        self.producer = None
+
+        self.request = Mock()
+        self.request.write.side_effect = self.written.append
+
+        def registerProducer(producer, streaming):
+            self.producer = producer
+        self.request.registerProducer.side_effect = registerProducer
+
+    def body(self):
+        return json.loads("".join(self.written))
+
+    @defer.inlineCallbacks
+    def test_stream(self):
+        response = {
+            "rooms": StreamedJsonList(
+                defer.succeed({"room_id": "!room%d" % (i,)}) for i in range(3)
+            ),
+            "end": "s1",
+        }
+
+        yield respond_with_json(self.request, 200, response)
+
+        self.assertEquals({
+            "rooms": [
+                {"room_id": "!room0"},
+                {"room_id": "!room1"},
+                {"room_id": "!room2"},
+            ],
+            "end": "s1",
+        }, self.body())
+        self.request.finish.assert_called_once_with()
+        self.assertNotIn(
+            "Content-Length",
+            [args[0] for args, _ in self.request.setHeader.call_args_list],
+        )
+
+    @defer.inlineCallbacks
+    def test_stream_empty(self):
+        response = {"rooms": StreamedJsonList([])}
+
+        yield respond_with_json(self.request, 200, response)
+
+        self.assertEquals({"rooms": []}, self.body())
+
+    def test_pause(self):
+        looked_up = []
+
+        def rooms():
+            for i in range(3):
+                looked_up.append(i)
+                yield {"room_id": "!room%d" % (i,)}
+
+        def write(data):
+            self.written.append(data)
+            self.producer.pauseProducing()
+        self.request.write.side_effect = write
+
+        d = respond_with_json(
+            self.request, 200, {"rooms": StreamedJsonList(rooms())}
+        )
+
+        # We shouldn't look up any rooms until the first write has been
+        # consumed.
+        self.assertEquals([], looked_up)
+
+        self.producer.resumeProducing()
+        self.producer.resumeProducing()
+        self.assertEquals([0], looked_up)
+
+        for _ in range(5):
+            self.producer.resumeProducing()
+        self.assertEquals([0, 1, 2], looked_up)
+        self.assertTrue(d.called)
+        self.assertEquals(3, len(self.body()["rooms"]))
+
+    def test_stop(self):
+        def rooms():
+            yield {"room_id": "!room0"}
+            self.producer.stopProducing()
+            yield {"room_id": "!room1"}
+
+        respond_with_json(
+            self.request, 200, {"rooms": StreamedJsonList(rooms())}
+        )
+
+        self.assertFalse(self.request.finish.called)
+        self.assertNotIn('{"room_id":"!room1"}', self.written)
+        self.request.unregisterProducer.assert_called_once_with()
+
+    def test_failure(self):
+        def rooms():
+            yield {"room_id": "!room0"}
+            raise Exception("Failed to get room")
+
+        respond_with_json(
+            self.request, 200, {"rooms": StreamedJsonList(rooms())}
+        )
+
+        self.assertFalse(self.request.finish.called)
+        self.request.unregisterProducer.assert_called_once_with()
+        self.request.transport.loseConnection.assert_called_once_with()
+
+    def test_failure_after_disconnect(self):
+        def rooms():
+            yield {"room_id": "!room0"}
+            self.request.transport = None
+            raise Exception("Failed to get room")
+
+        d = respond_with_json(
+            self.request, 200, {"rooms": StreamedJsonList(rooms())}
+        )
+
+        self.successResultOf(d)
+        self.assertFalse(self.request.finish.called)
+        self.request.unregisterProducer.assert_called_once_with()
+
+    def test_logging_context(self):
+        contexts = []
+        deferreds = [defer.Deferred() for _ in range(2)]
+
+        def rooms():
+            for d in deferreds:
+                contexts.append(LoggingContext.current_context())
+                yield d
+
+        with LoggingContext("request") as request_context:
+            response = {"rooms": StreamedJsonList(rooms())}
+
+        d = respond_with_json(self.request, 200, response)
+
+        # Each item is fired from outside the request's logging context, as
+        # if by a database thread.
+        for i, room_d in enumerate(deferreds):
+            room_d.callback({"room_id": "!room%d" % (i,)})
+
+        self.successResultOf(d)
+        self.assertEquals([request_context] * 2, contexts)
+        self.assertIs(
+            LoggingContext.sentinel, LoggingContext.current_context()
+        )
@@ -17,6 +17,8 @@
 from tests import unittest
 from twisted.internet import defer
 
+from mock import patch
+
 from synapse.storage._base import Cache, cached
 
 
@@ -91,6 +93,57 @@ class CacheTestCase(unittest.TestCase):
         cache.get(1)
         cache.get(3)
 
+    def test_update_after_invalidate(self):
+        sequence = self.cache.sequence
+        self.cache.invalidate("bar")
+        self.cache.update(sequence, "foo", 123)
+
+        # Any invalidation stops the update of a cache without keyed
+        # invalidation.
+        self.assertRaises(KeyError, self.cache.get, "foo")
+
+    def test_keyed_invalidation(self):
+        cache = Cache("test", keyed_invalidation=True)
+
+        sequence = cache.sequence
+        cache.invalidate("bar")
+        cache.update(sequence, "foo", 123)
+        cache.update(sequence, "bar", 456)
+
+        self.assertEquals(cache.get("foo"), 123)
+        self.assertRaises(KeyError, cache.get, "bar")
+
+        # Reads of "bar" started after the invalidation may update it.
+        cache.update(cache.sequence, "bar", 789)
+        self.assertEquals(cache.get("bar"), 789)
+
+    def test_keyed_invalidation_all(self):
+        cache = Cache("test", keyed_invalidation=True)
+
+        sequence = cache.sequence
+        cache.invalidate_all()
+        cache.update(sequence, "foo", 123)
+
+        self.assertRaises(KeyError, cache.get, "foo")
+
+    @patch("synapse.storage._base.KEYED_INVALIDATION_HISTORY", 2)
+    def test_keyed_invalidation_forgotten(self):
+        cache = Cache("test", keyed_invalidation=True)
+
+        sequence = cache.sequence
+        cache.invalidate("a")
+        cache.invalidate("b")
+        cache.invalidate("c")
+
+        # We no longer know whether "foo" was invalidated after the read
+        # started, so it mustn't be cached.
+        cache.update(sequence, "foo", 123)
+        self.assertRaises(KeyError, cache.get, "foo")
+
+        sequence = cache.sequence - 1
+        cache.update(sequence, "foo", 123)
+        self.assertEquals(cache.get("foo"), 123)
+
 
 class CacheDecoratorTestCase(unittest.TestCase):
 
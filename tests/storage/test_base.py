@@ -48,6 +48,11 @@ class SQLBaseStoreTestCase(unittest.TestCase):
 
         config = Mock()
         config.event_cache_size = 1
+        config.event_row_cache_size = 1
+        config.state_group_cache_size = 1
+        config.auth_chain_index = False
+        config.cache_factor = 1.0
+        config.cache_sizes = {}
         hs = HomeServer(
             "test",
             db_pool=self.db_pool,
@@ -154,6 +159,34 @@ class SQLBaseStoreTestCase(unittest.TestCase):
                 ["A set"]
         )
 
+    @defer.inlineCallbacks
+    def test_select_many(self):
+        self.mock_txn.fetchall.return_value = ((1,),)
+        self.mock_txn.description = (
+                ("colA", None, None, None, None, None, None),
+        )
+
+        ret = yield self.datastore.runInteraction(
+                "test_select_many",
+                self.datastore._simple_select_many_txn,
+                table="tablename",
+                column="keycol",
+                iterable=["A", "B", "C"],
+                retcols=["colA"],
+                keyvalues={"othercol": "X"},
+                batch_size=2,
+        )
+
+        self.assertEquals([{"colA": 1}, {"colA": 1}], ret)
+        self.mock_txn.execute.assert_has_calls([
+                call("SELECT colA FROM tablename"
+                     " WHERE keycol IN (?,?) AND othercol = ?",
+                     ["A", "B", "X"]),
+                call("SELECT colA FROM tablename"
+                     " WHERE keycol IN (?) AND othercol = ?",
+                     ["C", "X"]),
+        ])
+
     @defer.inlineCallbacks
     def test_update_one_1col(self):
         self.mock_txn.rowcount = 1
@@ -218,3 +251,36 @@ class SQLBaseStoreTestCase(unittest.TestCase):
                 "DELETE FROM tablename WHERE keycol = ?",
                 ["Go away"]
         )
+
+    @defer.inlineCallbacks
+    def test_upsert_native(self):
+        self.datastore.database_engine.can_native_upsert = True
+
+        yield self.datastore._simple_upsert(
+                table="room_depth",
+                keyvalues={"room_id": "!room"},
+                values={"min_depth": 5},
+        )
+
+        self.mock_txn.executemany.assert_called_with(
+                "INSERT INTO room_depth (room_id, min_depth) VALUES (?, ?)"
+                " ON CONFLICT (room_id) DO UPDATE SET"
+                " min_depth = EXCLUDED.min_depth",
+                [["!room", 5]]
+        )
+
+    @defer.inlineCallbacks
+    def test_upsert_without_unique_constraint(self):
+        self.datastore.database_engine.can_native_upsert = True
+        self.mock_txn.rowcount = 1
+
+        yield self.datastore._simple_upsert(
+                table="tablename",
+                keyvalues={"keycol": "TheKey"},
+                values={"columnname": "New Value"},
+        )
+
+        self.mock_txn.execute.assert_called_with(
+                "UPDATE tablename SET columnname = ? WHERE keycol = ?",
+                ["New Value", "TheKey"]
+        )
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015 OpenMarket Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from tests import unittest
+from twisted.internet import defer
+
+from synapse.storage import LAST_SEEN_GRANULARITY
+from synapse.types import UserID
+
+from tests.utils import setup_test_homeserver
+
+from mock import patch
+
+
+class ClientIpStoreTestCase(unittest.TestCase):
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        hs = yield setup_test_homeserver()
+
+        self.store = hs.get_datastore()
+        self.clock = hs.get_clock()
+
+        self.user = UserID.from_string("@user:test")
+
+    def insert(self, ip="10.0.0.1"):
+        self.store.insert_client_ip(
+            self.user, "access_token", "device_id", ip, "user_agent"
+        )
+
+    def get_stored_rows(self):
+        return self.store._simple_select_list(
+            table="user_ips",
+            keyvalues={"user_id": self.user.to_string()},
+            retcols=["ip", "last_seen"],
+        )
+
+    @defer.inlineCallbacks
+    def test_writes_coalesced_until_flush(self):
+        self.insert()
+        self.clock.advance_time(LAST_SEEN_GRANULARITY / 1000.)
+        self.insert()
+        last_seen = self.clock.time_msec()
+
+        rows = yield self.get_stored_rows()
+        self.assertEquals([], rows)
+
+        yield self.store._flush_client_ips()
+
+        rows = yield self.get_stored_rows()
+        self.assertEquals([{"ip": "10.0.0.1", "last_seen": last_seen}], rows)
+
+    @defer.inlineCallbacks
+    def test_failed_flush_keeps_rows(self):
+        self.insert("10.0.0.1")
+        first_seen = self.clock.time_msec()
+
+        with patch.object(
+            self.store, "runInteraction",
+            return_value=defer.fail(Exception("Database is down")),
+        ):
+            yield self.store._flush_client_ips()
+
+        self.clock.advance_time(LAST_SEEN_GRANULARITY / 1000.)
+        self.insert("10.0.0.2")
+        second_seen = self.clock.time_msec()
+
+        yield self.store._flush_client_ips()
+
+        rows = yield self.get_stored_rows()
+        self.assertEquals(
+            [
+                {"ip": "10.0.0.1", "last_seen": first_seen},
+                {"ip": "10.0.0.2", "last_seen": second_seen},
+            ],
+            sorted(rows, key=lambda row: row["ip"]),
+        )
+
+    @defer.inlineCallbacks
+    def test_lookup_sees_pending(self):
+        self.insert()
+        yield self.store._flush_client_ips()
+
+        self.clock.advance_time(LAST_SEEN_GRANULARITY / 1000.)
+        self.insert()
+        last_seen = self.clock.time_msec()
+
+        results = yield self.store.get_user_ip_and_agents(self.user)
+
+        self.assertEquals(1, len(results))
+        self.assertEquals(last_seen, results[0]["last_seen"])
+        self.assertEquals("device_id", results[0]["device_id"])
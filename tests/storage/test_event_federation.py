@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015 OpenMarket Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from tests import unittest
+from twisted.internet import defer
+
+from tests.utils import setup_test_homeserver
+
+from mock import Mock
+
+from collections import OrderedDict
+
+
+ROOM_ID = "!room:test"
+
+
+class EventFederationStoreTestCase(unittest.TestCase):
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        hs = yield setup_test_homeserver(
+            resource_for_federation=Mock(),
+            http_client=None,
+        )
+
+        self.store = hs.get_datastore()
+
+    def _insert_events(self, auth_events, start=0):
+        """Inserts events with the given auth events.
+
+        Args:
+            auth_events (dict): event_id -> list of auth event_ids
+            start (int): the stream ordering and depth of the first event
+        """
+        def f(txn):
+            items = enumerate(auth_events.items(), start)
+            for i, (event_id, auth_ids) in items:
+                txn.execute(
+                    "INSERT INTO events"
+                    " (stream_ordering, topological_ordering, event_id, type,"
+                    " room_id, content, processed, outlier, depth)"
+                    " VALUES (?,?,?,?,?,?,?,?,?)",
+                    (i, i, event_id, "m.test", ROOM_ID, "{}", True, False, i)
+                )
+                txn.executemany(
+                    "INSERT INTO event_auth (event_id, auth_id, room_id)"
+                    " VALUES (?,?,?)",
+                    [(event_id, a, ROOM_ID) for a in auth_ids]
+                )
+        return self.store.runInteraction("_insert_events", f)
+
+    @defer.inlineCallbacks
+    def test_auth_chain(self):
+        yield self._insert_events({
+            "$create": [],
+            "$a": ["$create"],
+            "$b": ["$create", "$a"],
+            "$c": ["$create", "$b"],
+            "$d": ["$create", "$a"],
+        })
+
+        chain = yield self.store.get_auth_chain_ids(["$c"])
+        self.assertEquals(set(["$create", "$a", "$b"]), set(chain))
+
+        chain = yield self.store.get_auth_chain_ids(["$c", "$d"])
+        self.assertEquals(set(["$create", "$a", "$b"]), set(chain))
+
+        self.assertEquals(
+            frozenset(["$create", "$a", "$b"]),
+            self.store._auth_chain_cache.get("$c"),
+        )
+
+        # A cached chain should give the same answer
+        chain = yield self.store.get_auth_chain_ids(["$c"])
+        self.assertEquals(set(["$create", "$a", "$b"]), set(chain))
+
+    @defer.inlineCallbacks
+    def test_auth_chain_missing_events_not_cached(self):
+        # We don't have "$a" yet, so the chain of "$b" is incomplete
+        yield self._insert_events({
+            "$create": [],
+            "$b": ["$create", "$a"],
+        })
+
+        chain = yield self.store.get_auth_chain_ids(["$b"])
+        self.assertEquals(set(["$create", "$a"]), set(chain))
+
+        self.assertRaises(KeyError, self.store._auth_chain_cache.get, "$b")
+
+    def _backfill_auth_chain_index(self, batch_size=10):
+        return self.store.runInteraction(
+            "backfill_auth_chain_index",
+            self.store._backfill_auth_chain_index_txn,
+            batch_size,
+        )
+
+    def _get_indexed_auth_chains(self, event_ids):
+        return self.store.runInteraction(
+            "get_indexed_auth_chains",
+            self.store._get_indexed_auth_chains_txn,
+            event_ids,
+        )
+
+    @defer.inlineCallbacks
+    def _get_pending(self):
+        rows = yield self.store._simple_select_list(
+            table="event_auth_closure_pending",
+            keyvalues={},
+            retcols=["event_id"],
+        )
+        defer.returnValue([row["event_id"] for row in rows])
+
+    @defer.inlineCallbacks
+    def test_auth_chain_index(self):
+        # The backfill indexes events in order of stream ordering, so insert
+        # them in order.
+        yield self._insert_events(OrderedDict([
+            ("$create", []),
+            ("$a", ["$create"]),
+            ("$b", ["$create", "$a"]),
+            ("$c", ["$create", "$b"]),
+        ]))
+
+        finished = yield self._backfill_auth_chain_index()
+        self.assertTrue(finished)
+
+        chains = yield self._get_indexed_auth_chains(["$a", "$c"])
+        self.assertEquals({
+            "$a": set(["$create"]),
+            "$c": set(["$create", "$a", "$b"]),
+        }, chains)
+
+        # Walking the graph from the index should give the same answer
+        self.store._auth_chain_index_enabled = True
+        chain = yield self.store.get_auth_chain_ids(["$c"])
+        self.assertEquals(set(["$create", "$a", "$b"]), set(chain))
+
+    @defer.inlineCallbacks
+    def test_auth_chain_index_backfill_progress(self):
+        yield self._insert_events(OrderedDict([
+            ("$create", []),
+            ("$a", ["$create"]),
+            ("$b", ["$create", "$a"]),
+        ]))
+
+        finished = yield self._backfill_auth_chain_index(batch_size=2)
+        self.assertFalse(finished)
+
+        last = yield self.store._simple_select_one_onecol(
+            table="event_auth_closure_backfill",
+            keyvalues={"Lock": "X"},
+            retcol="last_stream_ordering",
+        )
+        self.assertEquals(1, last)
+
+        chains = yield self._get_indexed_auth_chains(["$a", "$b"])
+        self.assertEquals({"$a": set(["$create"])}, chains)
+
+        finished = yield self._backfill_auth_chain_index(batch_size=2)
+        self.assertTrue(finished)
+
+        chains = yield self._get_indexed_auth_chains(["$b"])
+        self.assertEquals({"$b": set(["$create", "$a"])}, chains)
+
+    @defer.inlineCallbacks
+    def test_auth_chain_index_retries_pending(self):
+        # We don't have "$a" yet, so "$b" can't be indexed
+        yield self._insert_events(OrderedDict([
+            ("$create", []),
+            ("$b", ["$create", "$a"]),
+        ]))
+
+        finished = yield self._backfill_auth_chain_index()
+        self.assertTrue(finished)
+
+        pending = yield self._get_pending()
+        self.assertEquals(["$b"], pending)
+
+        # Persisting "$a" indexes it, and wakes the backfill to retry "$b"
+        yield self._insert_events({"$a": ["$create"]}, start=2)
+        event_a = Mock(
+            event_id="$a", depth=2, auth_events=[("$create", {})],
+        )
+
+        self.store._wake_auth_chain_index_backfill = Mock()
+        yield self.store.runInteraction(
+            "index_new_auth_chains",
+            self.store._index_new_auth_chains_txn,
+            [event_a],
+        )
+        self.store._wake_auth_chain_index_backfill.assert_called_once_with()
+
+        finished = yield self._backfill_auth_chain_index()
+        self.assertFalse(finished)
+
+        pending = yield self._get_pending()
+        self.assertEquals([], pending)
+
+        chains = yield self._get_indexed_auth_chains(["$b"])
+        self.assertEquals({"$b": set(["$create", "$a"])}, chains)
+
+        finished = yield self._backfill_auth_chain_index()
+        self.assertTrue(finished)
+
+    @defer.inlineCallbacks
+    def test_new_events_queued_when_not_indexable(self):
+        yield self._insert_events({"$b": ["$a"]})
+        event_b = Mock(event_id="$b", depth=0, auth_events=[("$a", {})])
+
+        self.store._wake_auth_chain_index_backfill = Mock()
+        yield self.store.runInteraction(
+            "index_new_auth_chains",
+            self.store._index_new_auth_chains_txn,
+            [event_b],
+        )
+        self.assertFalse(self.store._wake_auth_chain_index_backfill.called)
+
+        pending = yield self._get_pending()
+        self.assertEquals(["$b"], pending)
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015 OpenMarket Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from tests import unittest
+from twisted.internet import defer
+
+from synapse.api.constants import EventTypes, Membership
+from synapse.types import UserID, RoomID
+
+from tests.utils import setup_test_homeserver
+
+from mock import Mock
+
+
+class EventsStoreTestCase(unittest.TestCase):
+    """Sets up a room with a joined user, for the tests below to persist
+    events in.
+    """
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        hs = yield setup_test_homeserver(
+            resource_for_federation=Mock(),
+            http_client=None,
+        )
+
+        self.store = hs.get_datastore()
+        self.event_builder_factory = hs.get_event_builder_factory()
+        self.message_handler = hs.get_handlers().message_handler
+
+        self.u_alice = UserID.from_string("@alice:test")
+        self.room1 = RoomID.from_string("!abc123:test")
+
+        yield self.persist(
+            type=EventTypes.Member,
+            state_key=self.u_alice.to_string(),
+            content={"membership": Membership.JOIN},
+        )
+
+    @defer.inlineCallbacks
+    def create(self, **kwargs):
+        event_dict = {
+            "type": EventTypes.Message,
+            "sender": self.u_alice.to_string(),
+            "room_id": self.room1.to_string(),
+            "content": {"body": "hello", "msgtype": u"message"},
+        }
+        event_dict.update(kwargs)
+
+        builder = self.event_builder_factory.new(event_dict)
+
+        event, context = yield self.message_handler._create_new_client_event(
+            builder
+        )
+
+        defer.returnValue((event, context))
+
+    @defer.inlineCallbacks
+    def persist(self, **kwargs):
+        event, context = yield self.create(**kwargs)
+        yield self.store.persist_event(event, context)
+        defer.returnValue(event)
+
+    def clear_event_caches(self):
+        self.store._get_event_cache.invalidate_all()
+        self.store._event_row_cache.invalidate_all()
+
+
+class EventRowCacheTestCase(EventsStoreTestCase):
+
+    def persist_during_next_fetch(self, event, context):
+        """Persists the event after the next event fetch has started, but
+        before it reads from the database.
+        """
+        run_with_connection = self.store.runWithConnection
+
+        def persist_then_fetch(func, *args, **kwargs):
+            self.store.runWithConnection = run_with_connection
+
+            d = self.store.persist_event(event, context)
+            d.addCallback(lambda _: run_with_connection(func, *args, **kwargs))
+            return d
+
+        self.store.runWithConnection = persist_then_fetch
+
+    @defer.inlineCallbacks
+    def test_unrelated_persist_fills_row_cache(self):
+        msg = yield self.persist()
+        other, other_context = yield self.create()
+
+        self.clear_event_caches()
+        self.persist_during_next_fetch(other, other_context)
+
+        event = yield self.store.get_event(msg.event_id)
+        self.assertEquals(event.event_id, msg.event_id)
+
+        row = self.store._event_row_cache.get(msg.event_id)
+        self.assertEquals(row["event_id"], msg.event_id)
+
+    @defer.inlineCallbacks
+    def test_redaction_during_fetch_not_cached(self):
+        msg = yield self.persist()
+        redaction, redaction_context = yield self.create(
+            type=EventTypes.Redaction,
+            content={"reason": "spam"},
+            redacts=msg.event_id,
+        )
+
+        self.clear_event_caches()
+        self.persist_during_next_fetch(redaction, redaction_context)
+
+        yield self.store.get_event(msg.event_id)
+
+        self.assertRaises(
+            KeyError, self.store._event_row_cache.get, msg.event_id
+        )
+
+        # The next fetch sees the redaction.
+        event = yield self.store.get_event(msg.event_id)
+        self.assertEquals(
+            event.unsigned["redacted_by"], redaction.event_id
+        )
+
+
+class GetEventsTestCase(EventsStoreTestCase):
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        yield super(GetEventsTestCase, self).setUp()
+
+        self.normal = yield self.persist(content={"body": "normal"})
+
+        self.redacted = yield self.persist(content={"body": "redacted"})
+        self.redaction = yield self.persist(
+            type=EventTypes.Redaction,
+            content={"reason": "spam"},
+            redacts=self.redacted.event_id,
+        )
+
+        event, context = yield self.create(content={"body": "rejected"})
+        context.rejected = "auth_error"
+        yield self.store.persist_event(event, context)
+        self.rejected = event
+
+        self.event_ids = [
+            self.normal.event_id,
+            self.redacted.event_id,
+            self.rejected.event_id,
+        ]
+
+    def get_events(self, allow_rejected):
+        return self.store.get_events(
+            self.event_ids, allow_rejected=allow_rejected,
+        )
+
+    def get_events_txn(self, allow_rejected):
+        return self.store.runInteraction(
+            "get_events", self.store._get_events_txn, self.event_ids,
+            allow_rejected=allow_rejected,
+        )
+
+    def assert_events(self, events, allow_rejected):
+        events = {e.event_id: e for e in events}
+
+        expected = [self.normal.event_id, self.redacted.event_id]
+        if allow_rejected:
+            expected.append(self.rejected.event_id)
+        self.assertItemsEqual(expected, events.keys())
+
+        normal = events[self.normal.event_id]
+        self.assertEquals({"body": "normal"}, normal.content)
+        self.assertIsNone(normal.rejected_reason)
+        self.assertNotIn("redacted_by", normal.unsigned)
+
+        redacted = events[self.redacted.event_id]
+        self.assertEquals({}, redacted.content)
+        self.assertEquals(
+            self.redaction.event_id, redacted.unsigned["redacted_by"]
+        )
+        self.assertEquals(
+            self.redaction.event_id,
+            redacted.unsigned["redacted_because"].event_id,
+        )
+
+        if allow_rejected:
+            rejected = events[self.rejected.event_id]
+            self.assertEquals({"body": "rejected"}, rejected.content)
+            self.assertEquals("auth_error", rejected.rejected_reason)
+
+    @defer.inlineCallbacks
+    def check_get_events(self, get_events):
+        for allow_rejected in (False, True, False):
+            # Fetch from the database, then from the row cache, then from the
+            # event cache.
+            self.clear_event_caches()
+            events = yield get_events(allow_rejected)
+            self.assert_events(events, allow_rejected)
+
+            self.store._get_event_cache.invalidate_all()
+            events = yield get_events(allow_rejected)
+            self.assert_events(events, allow_rejected)
+
+            events = yield get_events(allow_rejected)
+            self.assert_events(events, allow_rejected)
+
+    def test_get_events(self):
+        return self.check_get_events(self.get_events)
+
+    def test_get_events_txn(self):
+        return self.check_get_events(self.get_events_txn)
@@ -18,6 +18,7 @@ from tests import unittest
 from twisted.internet import defer
 
 from synapse.api.constants import EventTypes, Membership
+from synapse.storage._base import caches_by_name
 from synapse.types import UserID, RoomID
 
 from tests.utils import setup_test_homeserver
@@ -50,6 +51,13 @@ class RoomMemberStoreTestCase(unittest.TestCase):
 
     @defer.inlineCallbacks
     def inject_room_member(self, room, user, membership, replaces_state=None):
+        event, context = yield self.create_room_member(room, user, membership)
+
+        yield self.store.persist_event(event, context)
+
+        defer.returnValue(event)
+
+    def create_room_member(self, room, user, membership):
         builder = self.event_builder_factory.new({
             "type": EventTypes.Member,
             "sender": user.to_string(),
@@ -58,13 +66,7 @@ class RoomMemberStoreTestCase(unittest.TestCase):
             "content": {"membership": membership},
         })
 
-        event, context = yield self.message_handler._create_new_client_event(
-            builder
-        )
-
-        yield self.store.persist_event(event, context)
-
-        defer.returnValue(event)
+        return self.message_handler._create_new_client_event(builder)
 
     @defer.inlineCallbacks
     def test_one_member(self):
@@ -114,6 +116,28 @@ class RoomMemberStoreTestCase(unittest.TestCase):
             ))
         )
 
+    @defer.inlineCallbacks
+    def test_persist_events(self):
+        alice_join = yield self.create_room_member(
+            self.room, self.u_alice, Membership.JOIN
+        )
+        bob_join = yield self.create_room_member(
+            self.room, self.u_bob, Membership.JOIN
+        )
+
+        # Persisting an event twice in a batch should only store it once
+        yield self.store.persist_events([alice_join, bob_join, alice_join])
+
+        self.assertEquals(
+            {self.u_alice.to_string(), self.u_bob.to_string()},
+            {m.user_id for m in (
+                yield self.store.get_room_members(self.room.to_string())
+            )}
+        )
+
+        event = yield self.store.get_event(bob_join[0].event_id)
+        self.assertEquals(bob_join[0].event_id, event.event_id)
+
     @defer.inlineCallbacks
     def test_room_hosts(self):
         yield self.inject_room_member(self.room, self.u_alice, Membership.JOIN)
@@ -158,3 +182,70 @@ class RoomMemberStoreTestCase(unittest.TestCase):
             {"test"},
             (yield self.store.get_joined_hosts_for_room(self.room.to_string()))
         )
+
+    @defer.inlineCallbacks
+    def test_current_state_invalidation(self):
+        room2 = RoomID.from_string("!def456:test")
+
+        alice_join = yield self.inject_room_member(
+            self.room, self.u_alice, Membership.JOIN
+        )
+        bob_join = yield self.inject_room_member(
+            room2, self.u_bob, Membership.JOIN
+        )
+
+        # Fill the caches
+        yield self.store.get_rooms_for_user(self.u_alice.to_string())
+        yield self.store.get_rooms_for_user(self.u_bob.to_string())
+        yield self.store.get_current_state_for_key(
+            self.room.to_string(), EventTypes.Member, self.u_alice.to_string()
+        )
+
+        bob_join2, bob_context = yield self.create_room_member(
+            self.room, self.u_bob, Membership.JOIN
+        )
+        charlie_join, charlie_context = yield self.create_room_member(
+            room2, self.u_charlie, Membership.JOIN
+        )
+
+        # Persist new current state for both rooms at the same time
+        yield defer.gatherResults([
+            self.store.persist_event(
+                bob_join2, bob_context,
+                current_state=[alice_join, bob_join2],
+            ),
+            self.store.persist_event(
+                charlie_join, charlie_context,
+                current_state=[bob_join, charlie_join],
+            ),
+        ])
+
+        self.assertEquals(
+            {self.room.to_string(), room2.to_string()},
+            {r.room_id for r in (
+                yield self.store.get_rooms_for_user(self.u_bob.to_string())
+            )}
+        )
+        self.assertEquals(
+            [room2.to_string()],
+            [r.room_id for r in (
+                yield self.store.get_rooms_for_user(self.u_charlie.to_string())
+            )]
+        )
+        self.assertEquals(
+            {self.u_alice.to_string(), self.u_bob.to_string()},
+            set((yield self.store.get_users_in_room(self.room.to_string())))
+        )
+        self.assertEquals(
+            [bob_join2.event_id],
+            [e.event_id for e in (yield self.store.get_current_state_for_key(
+                self.room.to_string(), EventTypes.Member,
+                self.u_bob.to_string(),
+            ))]
+        )
+
+        # Alice's entries were unaffected, so should still be cached
+        caches_by_name["get_current_state_for_key"].get(
+            self.room.to_string(), EventTypes.Member, self.u_alice.to_string()
+        )
+        caches_by_name["get_rooms_for_user"].get(self.u_alice.to_string())
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015 OpenMarket Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from tests import unittest
+from twisted.internet import defer
+
+from synapse.api.constants import EventTypes, Membership
+from synapse.types import UserID, RoomID
+
+from tests.utils import setup_test_homeserver
+
+from mock import Mock, patch
+
+
+class StateGroupDeltaTestCase(unittest.TestCase):
+
+    @defer.inlineCallbacks
+    def setUp(self):
+        hs = yield setup_test_homeserver(
+            resource_for_federation=Mock(),
+            http_client=None,
+        )
+
+        self.store = hs.get_datastore()
+        self.event_builder_factory = hs.get_event_builder_factory()
+        self.message_handler = hs.get_handlers().message_handler
+
+        self.u_alice = UserID.from_string("@alice:test")
+        self.room1 = RoomID.from_string("!abc123:test")
+
+        # Maps event_id to the state after the event, as worked out when it
+        # was persisted.
+        self.expected_state = {}
+
+    @defer.inlineCallbacks
+    def inject_state_event(self, etype, state_key, content):
+        builder = self.event_builder_factory.new({
+            "type": etype,
+            "sender": self.u_alice.to_string(),
+            "state_key": state_key,
+            "room_id": self.room1.to_string(),
+            "content": content,
+        })
+
+        event, context = yield self.message_handler._create_new_client_event(
+            builder
+        )
+
+        state = {
+            key: state_event.event_id
+            for key, state_event in context.current_state.items()
+        }
+        state[(event.type, event.state_key)] = event.event_id
+        self.expected_state[event.event_id] = state
+
+        yield self.store.persist_event(event, context)
+
+        defer.returnValue(event)
+
+    @defer.inlineCallbacks
+    def inject_state_events(self, count):
+        yield self.inject_state_event(
+            EventTypes.Member, self.u_alice.to_string(),
+            {"membership": Membership.JOIN},
+        )
+        for i in range(count):
+            yield self.inject_state_event(
+                "test.state", "key%d" % (i % 3,), {"i": i},
+            )
+
+    @defer.inlineCallbacks
+    def assert_state_matches(self):
+        # Make sure we build the state from what is in the database.
+        self.store._state_group_cache.invalidate_all()
+
+        state = yield self.store.get_state_ids_for_events(
+            self.expected_state.keys()
+        )
+
+        self.assertEquals(state, self.expected_state)
+
+    @defer.inlineCallbacks
+    def get_hops(self):
+        """Returns a dict of state group to the stored hops of each group
+        that is stored as a delta, checking they match the edges.
+        """
+        edges = yield self.store._simple_select_list(
+            table="state_group_edges",
+            keyvalues={},
+            retcols=["state_group", "prev_state_group", "hops"],
+        )
+
+        prev_groups = {e["state_group"]: e["prev_state_group"] for e in edges}
+
+        hops = {}
+        for edge in edges:
+            group = edge["state_group"]
+            chain_length = 0
+            while group in prev_groups:
+                group = prev_groups[group]
+                chain_length += 1
+
+            self.assertEquals(edge["hops"], chain_length)
+            hops[edge["state_group"]] = chain_length
+
+        defer.returnValue(hops)
+
+    @defer.inlineCallbacks
+    def compact(self):
+        finished = False
+        while not finished:
+            finished = yield self.store.runInteraction(
+                "compact_state_groups",
+                self.store._compact_state_groups_txn, 2,
+            )
+
+    @defer.inlineCallbacks
+    def test_deltas_resolve_to_full_state(self):
+        yield self.inject_state_events(6)
+
+        hops = yield self.get_hops()
+        self.assertTrue(hops)
+
+        yield self.assert_state_matches()
+
+    @defer.inlineCallbacks
+    def test_hop_cap_forces_full_group(self):
+        with patch("synapse.storage.state.MAX_STATE_DELTA_HOPS", 3):
+            yield self.inject_state_events(8)
+
+        hops = yield self.get_hops()
+        self.assertTrue(hops)
+        self.assertEquals(max(hops.values()), 2)
+
+        yield self.assert_state_matches()
+
+    @defer.inlineCallbacks
+    def test_compaction_keeps_state(self):
+        # Store every group in full.
+        with patch("synapse.storage.state.MAX_STATE_DELTA_HOPS", 1):
+            yield self.inject_state_events(6)
+
+        hops = yield self.get_hops()
+        self.assertFalse(hops)
+
+        yield self.compact()
+
+        hops = yield self.get_hops()
+        self.assertTrue(hops)
+
+        yield self.assert_state_matches()
+
+    @defer.inlineCallbacks
+    def test_compaction_respects_descendant_chains(self):
+        # Every other group is stored in full, with a delta stored against it.
+        with patch("synapse.storage.state.MAX_STATE_DELTA_HOPS", 2):
+            yield self.inject_state_events(8)
+
+        hops = yield self.get_hops()
+        self.assertEquals(max(hops.values()), 1)
+
+        with patch("synapse.storage.state.MAX_STATE_DELTA_HOPS", 3):
+            yield self.compact()
+
+        hops = yield self.get_hops()
+        self.assertEquals(max(hops.values()), 2)
+
+        yield self.assert_state_matches()
+
+    @defer.inlineCallbacks
+    def get_compaction_progress(self):
+        last_group = yield self.store._simple_select_one_onecol(
+            table="state_group_compaction_progress",
+            keyvalues={"Lock": "X"},
+            retcol="last_group",
+        )
+        defer.returnValue(last_group)
+
+    @defer.inlineCallbacks
+    def test_compaction_progress_is_stored(self):
+        with patch("synapse.storage.state.MAX_STATE_DELTA_HOPS", 1):
+            yield self.inject_state_events(6)
+
+        groups = yield self.store._simple_select_onecol(
+            table="state_groups",
+            keyvalues={"room_id": self.room1.to_string()},
+            retcol="id",
+        )
+        groups.sort()
+
+        yield self.store.runInteraction(
+            "compact_state_groups",
+            self.store._compact_state_groups_txn, 2,
+        )
+
+        last_group = yield self.get_compaction_progress()
+        self.assertEquals(last_group, groups[1])
+
+        yield self.compact()
+
+        last_group = yield self.get_compaction_progress()
+        self.assertEquals(last_group, groups[-1])
@@ -225,3 +225,69 @@ class StreamStoreTestCase(unittest.TestCase):
             "prev_content" in event.unsigned,
             msg="No prev_content key"
         )
+
+    @defer.inlineCallbacks
+    def test_get_rooms_changed_since(self):
+        yield self.inject_room_member(
+            self.room1, self.u_alice, Membership.JOIN
+        )
+        yield self.inject_room_member(
+            self.room2, self.u_alice, Membership.JOIN
+        )
+
+        start = yield self.store.get_room_events_max_id()
+
+        yield self.inject_room_member(
+            self.room1, self.u_bob, Membership.JOIN
+        )
+
+        room_ids = [self.room1.to_string(), self.room2.to_string()]
+
+        changed = yield self.store.get_rooms_changed_since(room_ids, start)
+        self.assertEquals({self.room1.to_string()}, changed)
+
+        # The same again, without the room stream change cache.
+        self.store._room_stream_change_cache._earliest_known_pos = None
+
+        changed = yield self.store.get_rooms_changed_since(room_ids, start)
+        self.assertEquals({self.room1.to_string()}, changed)
+
+    @defer.inlineCallbacks
+    def test_get_state_at_last_events(self):
+        alice_join = yield self.inject_room_member(
+            self.room1, self.u_alice, Membership.JOIN
+        )
+
+        start = yield self.store.get_room_events_max_id()
+
+        bob_join = yield self.inject_room_member(
+            self.room1, self.u_bob, Membership.JOIN
+        )
+
+        end = yield self.store.get_room_events_max_id()
+
+        room_ids = [self.room1.to_string(), self.room2.to_string()]
+
+        at_start = yield self.store.get_last_event_ids_for_rooms(
+            room_ids, start
+        )
+        at_end = yield self.store.get_last_event_ids_for_rooms(room_ids, end)
+
+        self.assertEquals(
+            {self.room1.to_string(): alice_join.event_id}, at_start
+        )
+        self.assertEquals(
+            {self.room1.to_string(): bob_join.event_id}, at_end
+        )
+
+        state_ids = yield self.store.get_state_ids_for_events(
+            [alice_join.event_id, bob_join.event_id]
+        )
+
+        self.assertEquals({
+            (EventTypes.Member, self.u_alice.to_string()): alice_join.event_id,
+        }, state_ids[alice_join.event_id])
+        self.assertEquals({
+            (EventTypes.Member, self.u_alice.to_string()): alice_join.event_id,
+            (EventTypes.Member, self.u_bob.to_string()): bob_join.event_id,
+        }, state_ids[bob_join.event_id])
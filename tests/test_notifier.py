@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015 OpenMarket Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from . import unittest
+from twisted.internet import defer
+
+from mock import Mock, patch
+
+from synapse.notifier import Notifier
+from synapse.types import StreamToken
+
+from tests.utils import MockClock
+
+
+ROOM_ID = "!room:test"
+
+
+class NotifierTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = MockClock()
+
+        self.current_token = StreamToken("s1", "0", "0")
+
+        store = Mock()
+        store.get_app_service_by_user_id.side_effect = (
+            lambda user_id: defer.succeed(None)
+        )
+        store.get_rooms_for_user.side_effect = (
+            lambda user_id: defer.succeed([Mock(room_id=ROOM_ID)])
+        )
+
+        hs = Mock()
+        hs.get_clock.return_value = self.clock
+        hs.get_datastore.return_value = store
+        hs.get_event_sources.return_value.get_current_token.side_effect = (
+            lambda: defer.succeed(self.current_token)
+        )
+
+        self.notifier = Notifier(hs)
+
+        # The (before_token, after_token) of each callback call, by user.
+        self.callback_calls = {}
+
+    def wait(self, user, timeout=10000):
+        calls = self.callback_calls.setdefault(user, [])
+
+        def callback(before_token, after_token):
+            calls.append((before_token, after_token))
+            if after_token.is_after(before_token):
+                return after_token
+            return None
+
+        return self.notifier.wait_for_events(
+            user, [ROOM_ID], timeout, callback,
+            from_token=self.current_token,
+        )
+
+    def notify_room(self, room_stream_id):
+        self.notifier._on_new_room_event(
+            Mock(room_id=ROOM_ID), room_stream_id
+        )
+
+    def tick(self):
+        self.clock.advance_time(0)
+
+    def test_fanout_batched(self):
+        users = ["@user%d:test" % (i,) for i in range(5)]
+        deferreds = [self.wait(user) for user in users]
+
+        with patch("synapse.notifier.FANOUT_BATCH_SIZE", 2):
+            self.notify_room(2)
+
+            woken = []
+            for _ in range(3):
+                self.tick()
+                woken.append(len([d for d in deferreds if d.called]))
+
+        self.assertEquals([2, 4, 5], woken)
+
+        for d in deferreds:
+            self.assertEquals("s2", self.successResultOf(d).room_key)
+
+    def test_timed_out_listener_not_woken_again(self):
+        d = self.wait("@user:test", timeout=1000)
+
+        self.notify_room(2)
+
+        # The timeout fires before the queued wake up.
+        self.clock.advance_time(1)
+
+        self.assertIsNone(self.successResultOf(d))
+        self.assertEquals(1, len(self.callback_calls["@user:test"]))
+
+        self.tick()
+
+        self.assertEquals(1, len(self.callback_calls["@user:test"]))
+        self.assertFalse(self.notifier.pending_wake_ups)
+
+    def test_queued_stream_gets_latest_token(self):
+        d = self.wait("@user:test")
+
+        self.notify_room(2)
+        self.notify_room(3)
+
+        self.assertEquals(1, len(self.notifier.pending_wake_ups))
+
+        self.tick()
+
+        self.assertEquals("s3", self.successResultOf(d).room_key)
+        self.assertEquals(
+            [(self.current_token, self.current_token._replace(room_key="s3"))],
+            self.callback_calls["@user:test"],
+        )
+
+    def wait_with_callback_key(self, callback, callback_key):
+        return self.notifier.wait_for_events(
+            "@user:test", [ROOM_ID], 0, callback,
+            from_token=StreamToken("s0", "0", "0"),
+            callback_key=callback_key,
+        )
+
+    def test_callback_shared(self):
+        callback_d = defer.Deferred()
+        callback = Mock(return_value=callback_d)
+
+        d1 = self.wait_with_callback_key(callback, "key")
+        d2 = self.wait_with_callback_key(callback, "key")
+
+        self.assertEquals(1, callback.call_count)
+        self.assertNoResult(d1)
+        self.assertNoResult(d2)
+
+        callback_d.callback("result")
+
+        self.assertEquals("result", self.successResultOf(d1))
+        self.assertEquals("result", self.successResultOf(d2))
+        self.assertFalse(self.notifier.pending_callbacks)
+
+    def test_callback_failure_shared(self):
+        callback_d = defer.Deferred()
+        callback = Mock(return_value=callback_d)
+
+        d1 = self.wait_with_callback_key(callback, "key")
+        d2 = self.wait_with_callback_key(callback, "key")
+
+        callback_d.errback(ValueError("Callback failed"))
+
+        self.failureResultOf(d1, ValueError)
+        self.failureResultOf(d2, ValueError)
+        self.assertEquals(1, callback.call_count)
+        self.assertFalse(self.notifier.pending_callbacks)
+
+    def test_callback_keys_not_merged(self):
+        callback = Mock(side_effect=lambda *args: defer.Deferred())
+
+        self.wait_with_callback_key(callback, "key1")
+        self.wait_with_callback_key(callback, "key2")
+
+        self.assertEquals(2, callback.call_count)
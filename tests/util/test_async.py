@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015 OpenMarket Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from twisted.internet import defer
+from tests import unittest
+
+from synapse.util.async import (
+    ObservableDeferred, concurrently_map, concurrently_iterate,
+)
+
+
+class ObservableDeferredTestCase(unittest.TestCase):
+
+    def test_observe_before_result(self):
+        d = defer.Deferred()
+        observable = ObservableDeferred(d)
+
+        observer = observable.observe()
+        self.assertFalse(observer.called)
+
+        d.callback("result")
+        self.assertEquals("result", self.successResultOf(observer))
+
+    def test_observe_after_result(self):
+        observable = ObservableDeferred(defer.succeed("result"))
+
+        observer = observable.observe()
+        self.assertEquals("result", self.successResultOf(observer))
+
+    def test_observe_after_error(self):
+        observable = ObservableDeferred(
+            defer.fail(ValueError("error")), consumeErrors=True
+        )
+
+        observer = observable.observe()
+        self.failureResultOf(observer, ValueError)
+
+
+class ConcurrentlyMapTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = {}
+
+    def func(self, arg):
+        d = defer.Deferred()
+        self.calls[arg] = d
+        return d
+
+    def test_limit(self):
+        d = concurrently_map(self.func, range(5), limit=2)
+
+        self.assertEquals({0, 1}, set(self.calls))
+
+        self.calls[1].callback("one")
+        self.assertEquals({0, 1, 2}, set(self.calls))
+
+        for arg in (0, 2, 3, 4):
+            self.calls[arg].callback(arg)
+
+        self.assertEquals([0, "one", 2, 3, 4], self.successResultOf(d))
+
+    def test_semaphore(self):
+        semaphore = defer.DeferredSemaphore(3)
+
+        d1 = concurrently_map(self.func, ["a", "b"], 2, semaphore)
+        d2 = concurrently_map(self.func, ["c", "d"], 2, semaphore)
+
+        self.assertEquals({"a", "b", "c"}, set(self.calls))
+
+        self.calls["a"].callback(None)
+        self.calls["b"].callback(None)
+        self.assertEquals({"a", "b", "c", "d"}, set(self.calls))
+
+        self.calls["c"].callback(None)
+        self.calls["d"].callback(None)
+        self.successResultOf(d1)
+        self.successResultOf(d2)
+
+    def test_failure(self):
+        d = concurrently_map(self.func, range(3), limit=2)
+
+        self.calls[0].errback(ValueError("error"))
+
+        self.failureResultOf(d, ValueError)
+
+    def test_empty(self):
+        d = concurrently_map(self.func, [], limit=2)
+
+        self.assertEquals([], self.successResultOf(d))
+
+    def test_invalid_limit(self):
+        for limit in (0, -1):
+            self.assertRaises(
+                ValueError, concurrently_map, self.func, range(3), limit
+            )
+            self.assertRaises(
+                ValueError, next,
+                concurrently_iterate(self.func, range(3), limit),
+            )
+
+        self.assertEquals({}, self.calls)
+
+    def test_iterate(self):
+        results = concurrently_iterate(self.func, range(4), limit=2)
+
+        self.assertEquals({}, self.calls)
+
+        d0 = next(results)
+        self.assertEquals({0, 1}, set(self.calls))
+
+        d1 = next(results)
+        self.assertEquals({0, 1, 2}, set(self.calls))
+
+        self.calls[1].callback("one")
+        self.calls[0].callback("zero")
+        self.assertEquals("zero", self.successResultOf(d0))
+        self.assertEquals("one", self.successResultOf(d1))
+
+        self.assertEquals(2, len(list(results)))
+        self.assertEquals({0, 1, 2, 3}, set(self.calls))
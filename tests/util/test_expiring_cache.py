@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015 OpenMarket Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from .. import unittest
+
+from synapse.util.expiringcache import ExpiringCache
+
+
+class MockClock(object):
+    now = 1000
+
+    def time_msec(self):
+        return self.now
+
+    def looping_call(self, function, interval):
+        pass
+
+
+class ExpiringCacheTestCase(unittest.TestCase):
+
+    def test_get_set(self):
+        clock = MockClock()
+        cache = ExpiringCache("test", clock, max_len=1)
+
+        cache["key"] = "value"
+        self.assertEquals(cache.get("key"), "value")
+        self.assertEquals(cache["key"], "value")
+
+    def test_eviction(self):
+        clock = MockClock()
+        cache = ExpiringCache("test", clock, max_len=2)
+
+        cache["key"] = "value"
+        cache["key2"] = "value2"
+        self.assertEquals(cache.get("key"), "value")
+        self.assertEquals(cache.get("key2"), "value2")
+
+        cache["key3"] = "value3"
+        self.assertEquals(cache.get("key"), None)
+        self.assertEquals(cache.get("key2"), "value2")
+        self.assertEquals(cache.get("key3"), "value3")
+        self.assertEquals(len(cache), 2)
+
+    def test_reset_expiry_on_get(self):
+        clock = MockClock()
+        cache = ExpiringCache(
+            "test", clock, max_len=2, reset_expiry_on_get=True
+        )
+
+        cache["key"] = "value"
+        clock.now += 1
+        cache["key2"] = "value2"
+        clock.now += 1
+
+        # Accessing "key" makes "key2" the oldest entry
+        self.assertEquals(cache.get("key"), "value")
+
+        cache["key3"] = "value3"
+        self.assertEquals(cache.get("key"), "value")
+        self.assertEquals(cache.get("key2"), None)
+        self.assertEquals(cache.get("key3"), "value3")
+
+    def test_time_eviction(self):
+        clock = MockClock()
+        cache = ExpiringCache("test", clock, expiry_ms=1000)
+        cache.start()
+
+        cache["key"] = "value"
+        clock.now += 500
+        cache["key2"] = "value2"
+
+        clock.now += 600
+        cache._prune_cache()
+        self.assertEquals(cache.get("key"), None)
+        self.assertEquals(cache.get("key2"), "value2")
+
+        clock.now += 500
+        cache._prune_cache()
+        self.assertEquals(cache.get("key2"), None)
+        self.assertEquals(len(cache), 0)
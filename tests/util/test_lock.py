@@ -106,3 +106,16 @@ class LockManagerTestCase(unittest.TestCase):
 
         with (yield self.lock_manager.lock(key)):
             pass
+
+    @defer.inlineCallbacks
+    def test_released_keys_forgotten(self):
+        key = "test"
+        lock1 = yield self.lock_manager.lock(key)
+        deferred_lock2 = self.lock_manager.lock(key)
+
+        lock1.release()
+        self.assertIn(key, self.lock_manager._lock_deferreds)
+
+        lock2 = yield deferred_lock2
+        lock2.release()
+        self.assertNotIn(key, self.lock_manager._lock_deferreds)
@@ -53,4 +53,36 @@ class LruCacheTestCase(unittest.TestCase):
         self.assertEquals(cache.pop("key"), 1)
         self.assertEquals(cache.pop("key"), None)
 
+    def test_size_callback(self):
+        cache = LruCache(5, size_callback=len)
+        cache["key1"] = [1, 2]
+        cache["key2"] = [3, 4]
+        self.assertEquals(len(cache), 4)
 
+        cache["key3"] = [5, 6]
+        self.assertEquals(cache.get("key1"), None)
+        self.assertEquals(cache.get("key2"), [3, 4])
+        self.assertEquals(cache.get("key3"), [5, 6])
+        self.assertEquals(len(cache), 4)
+
+        cache["key2"] = [3]
+        self.assertEquals(len(cache), 3)
+
+        cache.pop("key3")
+        self.assertEquals(len(cache), 1)
+
+        cache.clear()
+        self.assertEquals(len(cache), 0)
+
+    def test_set_max_size(self):
+        evictions = []
+        cache = LruCache(3, evicted_callback=evictions.append)
+        cache["key1"] = "value1"
+        cache["key2"] = "value2"
+        cache["key3"] = "value3"
+        self.assertEquals(cache.get("key1"), "value1")
+
+        cache.set_max_size(1)
+        self.assertEquals(len(cache), 1)
+        self.assertEquals(cache.get("key1"), "value1")
+        self.assertEquals(evictions, [2])
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015 OpenMarket Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from .. import unittest
+
+from synapse.util.roomstreambuffer import RoomStreamBuffer
+
+
+class RoomStreamBufferTestCase(unittest.TestCase):
+
+    def test_get_events(self):
+        buf = RoomStreamBuffer()
+        buf.add_event(10, "!a", "$a1")
+        buf.add_event(12, "!b", "$b1")
+        buf.add_event(11, "!a", "$a2")
+
+        self.assertEquals(
+            [(10, "$a1"), (11, "$a2"), (12, "$b1")],
+            buf.get_events_for_rooms(["!a", "!b"], 9, 12),
+        )
+        self.assertEquals(
+            [(11, "$a2")],
+            buf.get_events_for_rooms(["!a", "!c"], 10, 11),
+        )
+
+        # We don't know about events from before the first one added
+        self.assertEquals(None, buf.get_events_for_rooms(["!a"], 8, 12))
+
+    def test_room_eviction(self):
+        buf = RoomStreamBuffer(max_events_per_room=2, max_rooms=1)
+        buf.add_event(10, "!a", "$a1")
+        buf.add_event(11, "!a", "$a2")
+        buf.add_event(12, "!a", "$a3")
+
+        self.assertEquals(None, buf.get_events_for_rooms(["!a"], 9, 12))
+        self.assertEquals(
+            [(11, "$a2"), (12, "$a3")],
+            buf.get_events_for_rooms(["!a"], 10, 12),
+        )
+
+        buf.add_event(13, "!b", "$b1")
+
+        # We've dropped room "!a", so only know it has nothing after 12
+        self.assertEquals(None, buf.get_events_for_rooms(["!a"], 11, 13))
+        self.assertEquals([], buf.get_events_for_rooms(["!a"], 12, 13))
+
+    def test_invalidate_room(self):
+        buf = RoomStreamBuffer()
+        buf.add_event(10, "!a", "$a1")
+        buf.add_event(11, "!a", "$a2")
+
+        buf.invalidate_room("!a", 11)
+        self.assertEquals(None, buf.get_events_for_rooms(["!a"], 10, 11))
+        self.assertEquals([], buf.get_events_for_rooms(["!a"], 11, 11))
+
+    def test_membership_changes(self):
+        buf = RoomStreamBuffer(max_users=1)
+        buf.add_event(10, "!a", "$a1", membership_user_id="@alice:test")
+
+        self.assertTrue(buf.has_membership_changed("@alice:test", 9))
+        self.assertFalse(buf.has_membership_changed("@alice:test", 10))
+        self.assertFalse(buf.has_membership_changed("@bob:test", 9))
+
+        buf.add_membership_change("@bob:test", 11)
+
+        # We've dropped alice, so only know she has no changes after 10
+        self.assertTrue(buf.has_membership_changed("@alice:test", 9))
+        self.assertFalse(buf.has_membership_changed("@alice:test", 10))
+        self.assertTrue(buf.has_membership_changed("@bob:test", 10))
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# Copyright 2015 OpenMarket Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from .. import unittest
+
+from synapse.util.streamchangecache import StreamChangeCache
+
+
+class StreamChangeCacheTestCase(unittest.TestCase):
+
+    def test_entities_changed(self):
+        cache = StreamChangeCache("test")
+
+        # We don't know anything until the first change
+        self.assertEquals(None, cache.get_entities_changed(["!a"], 10))
+
+        cache.entity_has_changed("!a", 10)
+        cache.entity_has_changed("!b", 12)
+        cache.entity_has_changed("!a", 11)
+
+        self.assertEquals(
+            set(["!a", "!b"]),
+            cache.get_entities_changed(["!a", "!b", "!c"], 9),
+        )
+        self.assertEquals(
+            set(["!b"]), cache.get_entities_changed(["!a", "!b"], 11),
+        )
+        self.assertEquals(set(), cache.get_entities_changed(["!a", "!b"], 12))
+
+        # We don't know about changes before the first one
+        self.assertEquals(None, cache.get_entities_changed(["!a"], 8))
+        self.assertTrue(cache.has_entity_changed("!c", 8))
+        self.assertFalse(cache.has_entity_changed("!c", 9))
+
+    def test_eviction(self):
+        cache = StreamChangeCache("test", max_size=2)
+
+        cache.entity_has_changed("!a", 10)
+        cache.entity_has_changed("!b", 11)
+        cache.entity_has_changed("!c", 12)
+
+        self.assertEquals(2, len(cache))
+
+        # We've dropped "!a", so only know about changes after 10
+        self.assertEquals(None, cache.get_entities_changed(["!a"], 9))
+        self.assertEquals(
+            set(["!b", "!c"]),
+            cache.get_entities_changed(["!a", "!b", "!c"], 10),
+        )
@@ -17,6 +17,7 @@ from synapse.http.server import HttpServer
 from synapse.api.errors import cs_error, CodeMessageException, StoreError
 from synapse.api.constants import EventTypes
 from synapse.storage import prepare_database
+from synapse.storage._base import caches_by_name
 from synapse.storage.engines import create_engine
 from synapse.server import HomeServer
 
@@ -43,11 +44,26 @@ def setup_test_homeserver(name="test", datastore=None, config=None, **kargs):
         config = Mock()
         config.signing_key = [MockKey()]
         config.event_cache_size = 1
+        config.event_row_cache_size = 1
+        config.state_group_cache_size = 1
+        config.auth_chain_index = False
+        config.cache_factor = 1.0
+        config.cache_sizes = {}
+        config.client_ip_flush_interval = 5000
+        config.federation_transaction_room_concurrency = 10
+        config.sync_room_concurrency = 10
+        config.sync_total_room_concurrency = 100
+        config.canonical_client_json = False
         config.disable_registration = False
 
     if "clock" not in kargs:
         kargs["clock"] = MockClock()
 
+    # The caches of cached storage methods are shared by every datastore, so
+    # clear them to stop entries leaking from one test's database to the next.
+    for cache in caches_by_name.values():
+        cache.invalidate_all()
+
     if datastore is None:
         db_pool = SQLiteMemoryDbPool()
         yield db_pool.prepare()